@@ -0,0 +1,159 @@
+#!/usr/bin/python
+"""script to benchmark progress update on synthetic installing logs.
+
+   For each host count, a local sqlite database is seeded with one
+   INSTALLING cluster and its hosts, and synthetic logs are appended step
+   by step for the hosts. After each step the progress of the cluster is
+   updated as the progress_update task does, and the latency, the number
+   of sql statements and the peak memory of the cycle are reported.
+"""
+import os.path
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from sqlalchemy import event
+
+from compass.actions import progress_update
+from compass.db import database
+from compass.db.model import Adapter, Cluster, ClusterHost
+from compass.db.model import ClusterState, HostState
+from compass.log_analyzor import file_matcher
+from compass.log_analyzor.log_generator import LogGenerator
+from compass.utils import flags
+from compass.utils import logsetting
+
+
+flags.add('host_counts',
+          help='comma seperated numbers of hosts to benchmark',
+          default='10,100,1000')
+flags.add('steps', type='int',
+          help='number of log appending steps to finish the installation',
+          default=20)
+flags.add('noise_lines', type='int',
+          help='max noise lines between two progress lines',
+          default=5)
+flags.add('workdir',
+          help='directory to put database and logs, default is a temp dir',
+          default='')
+
+
+class StatementCounter(object):
+    """Count the sql statements executed by the engine."""
+
+    def __init__(self, engine):
+        self.count_ = 0
+        event.listen(engine, 'before_cursor_execute', self.count)
+
+    def count(self, *args, **kwargs):
+        """increase the statement count."""
+        self.count_ += 1
+
+
+def seed_database(host_count):
+    """seed database with one installing cluster of host_count hosts.
+
+    :returns: (clusterid, hostnames)
+    """
+    hostnames = ['host-%05d' % i for i in range(host_count)]
+    with database.session() as session:
+        adapter = Adapter(name='CentOS_openstack', os='CentOS',
+                          target_system='openstack')
+        cluster = Cluster(name='benchmark')
+        cluster.adapter = adapter
+        cluster.state = ClusterState(state='INSTALLING')
+        session.add(cluster)
+        for hostname in hostnames:
+            host = ClusterHost(hostname=hostname)
+            host.cluster = cluster
+            host.state = HostState(state='INSTALLING')
+            session.add(host)
+
+        session.flush()
+        clusterid = cluster.id
+
+    return clusterid, hostnames
+
+
+def get_max_rss():
+    """get the peak resident memory of the process in MB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def benchmark(workdir, host_count):
+    """benchmark progress update for host_count hosts.
+
+    :returns: list of (lines, seconds, statements, max_rss) per cycle.
+    """
+    database.init('sqlite:///%s' % os.path.join(workdir, 'benchmark.db'))
+    database.create_db()
+    counter = StatementCounter(database.ENGINE)
+    logdir = os.path.join(workdir, 'anamon')
+    file_matcher.FILE_READER_FACTORY.logdir_ = logdir
+    clusterid, hostnames = seed_database(host_count)
+    generator = LogGenerator(logdir, hostnames, steps=flags.OPTIONS.steps,
+                             noise_lines=flags.OPTIONS.noise_lines)
+    cycles = []
+    while not generator.is_finished():
+        lines = generator.advance()
+        counter.count_ = 0
+        start = time.time()
+        progress_update.update_progress(clusterid)
+        cycles.append((lines, time.time() - start,
+                       counter.count_, get_max_rss()))
+
+    with database.session() as session:
+        state = session.query(ClusterState).filter_by(id=clusterid).first()
+        print '%s hosts: cluster %s progress %.4f' % (
+            host_count, state.state, state.progress)
+
+    return cycles
+
+
+def print_cycles(host_count, cycles):
+    """print the benchmark result of each cycle."""
+    print '  %6s %10s %10s %10s %12s %10s' % (
+        'cycle', 'lines', 'seconds', 'lines/sec', 'statements', 'rss(MB)')
+    for i, (lines, seconds, statements, max_rss) in enumerate(cycles):
+        print '  %6s %10s %10.3f %10.0f %12s %10.1f' % (
+            i, lines, seconds, lines / seconds if seconds else 0.0,
+            statements, max_rss)
+
+    seconds = sorted([cycle[1] for cycle in cycles])
+    print '  %s hosts: cycle seconds median %.3f max %.3f total %.3f' % (
+        host_count, seconds[len(seconds) // 2], seconds[-1], sum(seconds))
+    print '  %s hosts: statements per cycle %.1f' % (
+        host_count,
+        sum([cycle[2] for cycle in cycles]) / float(len(cycles)))
+    print
+
+
+def main(argv):
+    """entry function."""
+    host_counts = [
+        int(host_count) for host_count in flags.OPTIONS.host_counts.split(',')
+        if host_count
+    ]
+    for host_count in host_counts:
+        workdir = flags.OPTIONS.workdir
+        if workdir:
+            workdir = os.path.join(workdir, 'hosts-%s' % host_count)
+            os.makedirs(workdir)
+        else:
+            workdir = tempfile.mkdtemp()
+
+        try:
+            cycles = benchmark(workdir, host_count)
+        finally:
+            if not flags.OPTIONS.workdir:
+                shutil.rmtree(workdir)
+
+        print_cycles(host_count, cycles)
+
+
+if __name__ == '__main__':
+    flags.init()
+    logsetting.init()
+    main(sys.argv)
@@ -8,8 +8,10 @@ from flask.ext.script import Manager
 
 from compass.api import app
 from compass.config_management.utils import config_manager
+from compass.db import catalog
 from compass.db import database
-from compass.db.model import Adapter, Role, Switch, Machine, HostState, ClusterState, Cluster, ClusterHost, LogProgressingHistory    
+from compass.db import migration
+from compass.db.model import Adapter, Role, Switch, Machine, HostState, ClusterState, Cluster, ClusterHost, LogProgressingHistory, DaemonLease, DaemonClaim, SchemaVersion, CatalogVersion
 from compass.utils import flags
 from compass.utils import logsetting
 from compass.utils import setting_wrapper as setting
@@ -33,6 +35,10 @@ TABLE_MAPPING = {
     'cluster': Cluster,
     'clusterhost': ClusterHost,
     'logprogressinghistory': LogProgressingHistory,
+    'daemonlease': DaemonLease,
+    'daemonclaim': DaemonClaim,
+    'schemaversion': SchemaVersion,
+    'catalogversion': CatalogVersion,
 }
 
 
@@ -49,10 +55,18 @@ def createdb():
     if setting.DATABASE_TYPE == 'sqlite':
         if os.path.exists(setting.DATABASE_FILE):
             os.remove(setting.DATABASE_FILE)
-    database.create_db()
+    migration.create_db()
     if setting.DATABASE_TYPE == 'sqlite':
         os.chmod(setting.DATABASE_FILE, 0777)
 
+
+@manager.command
+def upgradedb():
+    "Applies the pending schema migrations to the database"
+    applied = migration.upgrade()
+    print 'applied migrations %s, schema version is %s' % (
+        applied, migration.get_version())
+
 @manager.command
 def dropdb():
     "Creates database tables from sqlalchemy models"
@@ -98,6 +112,7 @@ def sync_from_installers():
         for target_system, roles in roles_per_target_system.items():
             for role in roles:
                 session.add(Role(**role))
+        catalog.bump_version(session)
  
 
 @manager.command
@@ -7,12 +7,14 @@ import sys
 import signal
 import time
 
-from compass.actions import poll_switch 
+from compass.actions import poll_switch
 from compass.db import database
-from compass.db.model import Switch
+from compass.db.lease import WorkLease
+from compass.db.model import DaemonClaim, DaemonLease, Switch
 from compass.tasks.client import celery
 from compass.utils import flags
 from compass.utils import logsetting
+from compass.utils import metrics
 from compass.utils import setting_wrapper as setting
 
 
@@ -28,6 +30,9 @@ flags.add_bool('once',
 flags.add('run_interval',
           help='run interval in seconds',
           default=setting.POLLSWITCH_INTERVAL)
+flags.add_bool('lease',
+               help='share the switches with other running instances',
+               default=True)
 flags.add_bool('daemonize',
                help='run as daemon',
                default=False)
@@ -51,18 +56,31 @@ def main(argv):
     switchids = [int(switchid) for switchid in flags.OPTIONS.switchids.split(',') if switchid]
     signal.signal(signal.SIGTERM, handle_term)
     signal.signal(signal.SIGHUP, handle_term)
+    lease = None
+    if flags.OPTIONS.lease:
+        database.create_table(DaemonLease)
+        database.create_table(DaemonClaim)
+        lease = WorkLease('poll_switch', setting.DAEMON_LEASE_EXPIRE_SECONDS)
+        lease.check_interval(int(flags.OPTIONS.run_interval))
 
     while True:
         BUSY = True
-        with database.session() as session:
-            switch_ips = {}
-            switches = session.query(Switch).all()
-            for switch in switches:
-                switch_ips[switch.id] = switch.ip
+        if lease:
+            try:
+                lease.heartbeat()
+            except Exception as error:
+                logging.error('failed to renew the lease %s', lease)
+                logging.exception(error)
+
+        with metrics.daemon_loop('poll_switch'):
+            with database.read_session() as session:
+                switch_ips = dict(session.query(Switch.id, Switch.ip))
             if not switchids:
-                poll_switchids  = [switch.id for switch in switches]
+                poll_switchids = sorted(switch_ips.keys())
             else:
                 poll_switchids = switchids
+            if lease:
+                poll_switchids = lease.claim(poll_switchids)
             logging.info('poll switches to get machines mac: %s',
                          poll_switchids)
             for switchid in poll_switchids:
@@ -75,11 +93,15 @@ def main(argv):
                                      (switch_ips[switchid],))
                 else:
                     try:
-                        poll_switch.poll_switch(switch_ips[switchid])
+                        with database.session():
+                            poll_switch.poll_switch(switch_ips[switchid])
                     except Exception as error:
                         logging.error('failed to poll switch %s',
                                       switch_ips[switchid])
 
+                    if lease:
+                        lease.heartbeat_if_due()
+
         BUSY = False
         if KILLED:
             logging.info('exit poll switch loop')
@@ -95,6 +117,9 @@ def main(argv):
             time.sleep(flags.OPTIONS.run_interval)
         else:
             logging.info('rerun poll switch imediately')
+
+    if lease:
+        lease.release()
         
 
 if __name__ == '__main__':
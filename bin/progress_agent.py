@@ -0,0 +1,130 @@
+#!/usr/bin/python
+"""main script to run as service next to the installing logs.
+
+   It calculates the installing progresses of the hosts whose logs are
+   under the local installation log dir, and reports the changed
+   progresses to the compass server in batch.
+
+   The agent keeps its log_progressing_history table in its own local
+   database given by --database_url. The compass server only accepts
+   the reports if PROGRESS_UPDATE_FROM_AGENTS is set, in which case the
+   central progress update does not calculate the progresses itself.
+"""
+import logging
+import signal
+import sys
+import time
+import daemon
+import lockfile
+
+from compass.apiclient.restful import Client
+from compass.db import database
+from compass.db.model import LogProgressingHistory
+from compass.log_analyzor import progress_calculator
+from compass.log_analyzor.progress_agent import ProgressAgent
+from compass.utils import flags
+from compass.utils import logsetting
+from compass.utils import setting_wrapper as setting
+
+
+flags.add('compass_server',
+          help='url of the compass server',
+          default='http://127.0.0.1')
+flags.add('database_url',
+          help='url of the local database of the agent',
+          default=setting.PROGRESS_AGENT_DATABASE_URI)
+flags.add('os_installer',
+          help='os installer name',
+          default=setting.OS_INSTALLER)
+flags.add('os_name',
+          help='os name',
+          default='CentOS')
+flags.add('package_installer',
+          help='package installer name',
+          default=setting.PACKAGE_INSTALLER)
+flags.add('target_system',
+          help='target system',
+          default='openstack')
+flags.add_bool('once',
+               help='run once or forever',
+               default=False)
+flags.add('run_interval',
+          help='run interval in seconds',
+          default=setting.PROGRESS_UPDATE_INTERVAL)
+flags.add_bool('daemonize',
+               help='run as daemon',
+               default=False)
+
+
+BUSY = False
+KILLED = False
+
+
+def handle_term(signum, frame):
+    global BUSY
+    global KILLED
+    logging.info('Caught signal %s', signum)
+    KILLED = True
+    if not BUSY:
+        sys.exit(0)
+
+
+def main(argv):
+    """entry function."""
+    global BUSY
+    global KILLED
+    adapter = progress_calculator.get_adapter_matcher(
+        flags.OPTIONS.os_installer, flags.OPTIONS.os_name,
+        flags.OPTIONS.package_installer, flags.OPTIONS.target_system)
+    if not adapter:
+        sys.exit(1)
+
+    if flags.OPTIONS.database_url == setting.SQLALCHEMY_DATABASE_URI:
+        logging.error('the agent database %s should not be the compass '
+                      'database', flags.OPTIONS.database_url)
+        sys.exit(1)
+
+    database.init(flags.OPTIONS.database_url)
+    database.create_table(LogProgressingHistory)
+    agent = ProgressAgent(adapter, Client(flags.OPTIONS.compass_server))
+    signal.signal(signal.SIGINT, handle_term)
+
+    while True:
+        BUSY = True
+        try:
+            agent.run_once()
+        except Exception as error:
+            logging.error('failed to report hosts progresses')
+            logging.exception(error)
+
+        BUSY = False
+        if KILLED:
+            logging.info('exit progress agent loop')
+            break
+
+        if flags.OPTIONS.once:
+            logging.info('progress agent finished')
+            break
+
+        if flags.OPTIONS.run_interval > 0:
+            logging.info('will rerun the progress agent after %s',
+                         flags.OPTIONS.run_interval)
+            time.sleep(flags.OPTIONS.run_interval)
+        else:
+            logging.info('rerun the progress agent immediately')
+
+
+if __name__ == '__main__':
+    flags.init()
+    logsetting.init()
+    logging.info('run progress agent: %s', sys.argv)
+    if flags.OPTIONS.daemonize:
+        with daemon.DaemonContext(
+            pidfile=lockfile.FileLock('/var/run/progress_agent.pid'),
+            stderr=open('/tmp/progress_agent_err.log', 'w+'),
+            stdout=open('/tmp/progress_agent_out.log', 'w+')
+        ):
+            logging.info('run progress agent as daemon')
+            main(sys.argv)
+    else:
+        main(sys.argv)
@@ -5,13 +5,17 @@ import signal
 import sys
 import time
 import daemon
+import lockfile
 
-from compass.actions import progress_update
+from compass.actions.progress_scheduler import ProgressUpdateScheduler
 from compass.db import database
-from compass.db.model import Cluster
+from compass.db.lease import WorkLease
+from compass.db.model import DaemonClaim, DaemonLease
+from compass.log_analyzor import adapter_matcher
 from compass.tasks.client import celery
 from compass.utils import flags
 from compass.utils import logsetting
+from compass.utils import metrics
 from compass.utils import setting_wrapper as setting
 
 
@@ -27,6 +31,18 @@ flags.add_bool('once',
 flags.add('run_interval',
           help='run interval in seconds',
           default=setting.PROGRESS_UPDATE_INTERVAL)
+flags.add('min_interval',
+          help='update interval in seconds of the progressing clusters',
+          default=setting.PROGRESS_UPDATE_MIN_INTERVAL)
+flags.add('max_interval',
+          help='update interval in seconds of the stalled clusters',
+          default=setting.PROGRESS_UPDATE_MAX_INTERVAL)
+flags.add('task_workers',
+          help='number of batches the due clusters are dispatched in',
+          default=setting.PROGRESS_UPDATE_TASK_WORKERS)
+flags.add_bool('lease',
+               help='share the clusters with other running instances',
+               default=True)
 flags.add_bool('daemonize',
                help='run as daemon',
                default=False)
@@ -52,29 +68,44 @@ def main(argv):
         int(clusterid) for clusterid in flags.OPTIONS.clusterids.split(',')
         if clusterid
     ]
+    if setting.PROGRESS_UPDATE_FROM_AGENTS:
+        logging.info('progresses are reported by the progress agents')
+        return
+
     signal.signal(signal.SIGINT, handle_term)
 
+    send_task = None
+    if flags.OPTIONS.async:
+        if setting.PROGRESS_UPDATE_POOL_TYPE == 'process':
+            logging.error('process pool is only used with --noasync, '
+                          'the daemonic celery workers use thread pool')
+
+        send_task = lambda batch: celery.send_task(
+            'compass.tasks.progress_update_clusters', (batch,))
+
+    lease = None
+    if flags.OPTIONS.lease:
+        database.create_table(DaemonLease)
+        database.create_table(DaemonClaim)
+        lease = WorkLease('progress_update',
+                          setting.DAEMON_LEASE_EXPIRE_SECONDS)
+        lease.check_interval(int(flags.OPTIONS.run_interval))
+
+    scheduler = ProgressUpdateScheduler(
+        int(flags.OPTIONS.run_interval),
+        int(flags.OPTIONS.min_interval),
+        int(flags.OPTIONS.max_interval),
+        workers=int(flags.OPTIONS.task_workers),
+        send_task=send_task, clusterids=clusterids, lease=lease)
+
     while True:
         BUSY = True
-        with database.session() as session:
-            if not clusterids:
-                clusters = session.query(Cluster).all()
-                update_clusterids = [cluster.id for cluster in clusters]
-            else:
-                update_clusterids = clusterids
-
-        logging.info('update progress for clusters: %s', update_clusterids)
-        for clusterid in update_clusterids:
-            if flags.OPTIONS.async:
-                celery.send_task('compass.tasks.progress_update', (clusterid,))
-            else:
-                try:
-                    progress_update.update_progress(clusterid)
-                except Exception as error:
-                    logging.error('failed to update progress for cluster %s',
-                                  clusterid)
-                    logging.exception(error)
-                    pass
+        try:
+            with metrics.daemon_loop('progress_update'):
+                scheduler.dispatch()
+        except Exception as error:
+            logging.error('failed to dispatch progress updates')
+            logging.exception(error)
 
         BUSY = False
         if KILLED:
@@ -85,12 +116,15 @@ def main(argv):
             logging.info('trigger installer finsished')
             break
 
-        if flags.OPTIONS.run_interval > 0:
-            logging.info('will rerun the trigger install after %s',
-                         flags.OPTIONS.run_interval)
-            time.sleep(flags.OPTIONS.run_interval)
-        else:
-            logging.info('rerun the trigger installer immediately')
+        sleep_seconds = scheduler.get_sleep_seconds()
+        logging.info('will rerun the progress update after %s',
+                     sleep_seconds)
+        time.sleep(sleep_seconds)
+
+    if lease:
+        lease.release()
+
+    adapter_matcher.close_pools()
 
 
 if __name__ == '__main__':
@@ -103,7 +137,7 @@ if __name__ == '__main__':
             stderr=open('/tmp/poll_switch_err.log', 'w+'),
             stdout=open('/tmp/poll_switch_out.log', 'w+')
         ):
-            logging.info('run progress update as daemon') 
+            logging.info('run progress update as daemon')
             main(sys.argv)
     else:
         main(sys.argv)
@@ -0,0 +1,105 @@
+#!/usr/bin/python
+"""script to replay captured installing logs and profile the line matchers.
+
+   Usage: replay_logs.py [options] <logfile> [<logfile> ...]
+
+   Each log file is replayed through the file matcher of the chosen adapter
+   whose filename is the basename of the log file, e.g. anaconda.log or
+   chef-client.log. It does not read or write the database.
+"""
+import os.path
+import sys
+
+from compass.log_analyzor import progress_calculator
+from compass.log_analyzor import replay
+from compass.utils import flags
+from compass.utils import logsetting
+from compass.utils import setting_wrapper as setting
+
+
+flags.add('os_installer',
+          help='os installer name',
+          default=setting.OS_INSTALLER)
+flags.add('os_name',
+          help='os name',
+          default='CentOS')
+flags.add('package_installer',
+          help='package installer name',
+          default=setting.PACKAGE_INSTALLER)
+flags.add('target_system',
+          help='target system',
+          default='openstack')
+flags.add_bool('timeline',
+               help='print the progress timeline',
+               default=True)
+
+
+def print_result(result):
+    """print the replay result of one log file."""
+    print '%s (%s)' % (result.pathname_, result.file_matcher_.filename_)
+    print '  %s lines in %.3f seconds, %.0f lines/sec, final matcher %s' % (
+        result.lines_, result.seconds_, result.get_lines_per_second(),
+        result.line_matcher_name_)
+    print '  %-28s %10s %8s %10s %10s' % (
+        'line matcher', 'evaluated', 'matched', 'regex(s)', 'us/eval')
+    profiles = sorted(result.profiles_.values(),
+                      key=lambda profile: profile.regex_seconds_,
+                      reverse=True)
+    for profile in profiles:
+        per_evaluation = 0.0
+        if profile.evaluations_:
+            per_evaluation = (
+                profile.regex_seconds_ * 1000000 / profile.evaluations_)
+
+        print '  %-28s %10s %8s %10.4f %10.2f' % (
+            profile.name_, profile.evaluations_, profile.matches_,
+            profile.regex_seconds_, per_evaluation)
+
+    if flags.OPTIONS.timeline:
+        print '  %8s %-28s %8s %8s  %s' % (
+            'line', 'next matcher', 'file', 'total', 'message')
+        for lineno, line_matcher_name, file_progress, total_progress in (
+            result.timeline_
+        ):
+            print '  %8s %-28s %8.4f %8.4f  %s' % (
+                lineno, line_matcher_name, file_progress.progress,
+                total_progress.progress, total_progress.message)
+
+    print
+
+
+def main(argv):
+    """entry function."""
+    adapter = progress_calculator.get_adapter_matcher(
+        flags.OPTIONS.os_installer, flags.OPTIONS.os_name,
+        flags.OPTIONS.package_installer, flags.OPTIONS.target_system)
+    if not adapter:
+        print 'no adapter matcher for %s %s %s %s' % (
+            flags.OPTIONS.os_installer, flags.OPTIONS.os_name,
+            flags.OPTIONS.package_installer, flags.OPTIONS.target_system)
+        return 1
+
+    file_matchers = replay.get_file_matchers(adapter)
+    if not argv[1:]:
+        print 'no log file to replay, expected one of %s' % (
+            file_matchers.keys())
+        return 1
+
+    for pathname in argv[1:]:
+        filename = os.path.basename(pathname)
+        if filename not in file_matchers:
+            print 'ignore %s: no file matcher for %s in %s' % (
+                pathname, filename, file_matchers.keys())
+            continue
+
+        file_matcher, min_progress, max_progress = file_matchers[filename]
+        print_result(replay.replay_file(
+            file_matcher, pathname, min_progress, max_progress))
+
+    return 0
+
+
+if __name__ == '__main__':
+    flags.init()
+    logsetting.init()
+    sys.exit(main(sys.argv))
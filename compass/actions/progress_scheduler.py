@@ -0,0 +1,212 @@
+"""Module to schedule the installing progress updates of the clusters.
+
+   Only the clusters in INSTALLING state are scheduled. Each cluster has
+   its own update interval, which is shortened while the cluster progress
+   is moving and lengthened while it is stalled. The due clusters are
+   dispatched in batches, one batch per worker, and a cluster is not
+   dispatched again while its previous update is still in flight.
+"""
+import logging
+import time
+
+from compass.actions import progress_update
+
+
+class ClusterSchedule(object):
+    """Update schedule of one installing cluster."""
+
+    def __init__(self, progress, interval, next_time):
+        self.progress_ = progress
+        self.interval_ = interval
+        self.next_time_ = next_time
+        self.result_ = None
+        self.dispatch_time_ = None
+
+    def __str__(self):
+        return '%s[progress: %s, interval: %s, next_time: %s]' % (
+            self.__class__.__name__, self.progress_,
+            self.interval_, self.next_time_)
+
+
+class ProgressUpdateScheduler(object):
+    """Scheduler to dispatch the cluster progress updates."""
+
+    def __init__(self, interval, min_interval, max_interval,
+                 workers=1, task_timeout=None, send_task=None,
+                 clusterids=None, lease=None):
+        """Constructor
+
+        :param interval: the initial update interval of a cluster.
+        :param min_interval: the update interval of an active cluster.
+        :param max_interval: the update interval of a stalled cluster.
+        :param workers: the number of batches the due clusters are
+                        dispatched in.
+        :param task_timeout: the seconds after which a dispatched update
+                             is not considered in flight anymore.
+                             Default is max_interval.
+        :param send_task: callable to send a batch of cluster ids to
+                          the task queue and return the AsyncResult.
+                          The batch is updated in process if it is None.
+        :param clusterids: only schedule these clusters if it is set.
+        :param lease: only schedule the clusters claimed by the
+                      :class:`compass.db.lease.WorkLease` if it is set.
+        """
+        if not 0 < min_interval <= interval <= max_interval:
+            raise ValueError(
+                '%s restriction is not met: 0 < min_interval(%s) '
+                '<= interval(%s) <= max_interval(%s)' % (
+                    self.__class__.__name__,
+                    min_interval, interval, max_interval))
+
+        self.interval_ = interval
+        self.min_interval_ = min_interval
+        self.max_interval_ = max_interval
+        self.workers_ = max(workers, 1)
+        self.task_timeout_ = task_timeout or max_interval
+        self.send_task_ = send_task
+        self.clusterids_ = clusterids
+        self.lease_ = lease
+        self.schedules_ = {}
+
+    def __str__(self):
+        return '%s[interval: [%s:%s], workers: %s, clusters: %s]' % (
+            self.__class__.__name__, self.min_interval_,
+            self.max_interval_, self.workers_, len(self.schedules_))
+
+    def is_in_flight(self, schedule, now):
+        """Check if the last update of the cluster is not finished."""
+        if schedule.dispatch_time_ is None:
+            return False
+
+        if now - schedule.dispatch_time_ >= self.task_timeout_:
+            logging.info('update dispatched at %s is timed out',
+                         schedule.dispatch_time_)
+            return False
+
+        if schedule.result_ is None:
+            return False
+
+        try:
+            return not schedule.result_.ready()
+        except Exception as error:
+            logging.error('failed to get the state of %s', schedule.result_)
+            logging.exception(error)
+            return False
+
+    def update_clusters(self, clusters, now):
+        """Refresh the schedules with the installing clusters.
+
+        :param clusters: the installing clusters.
+        :type clusters: dict of clusterid to progress.
+        :param now: current time in seconds.
+
+        .. note::
+           The interval of a cluster is adapted once each dispatched
+           update finished: it is halved if the cluster progress moved
+           and doubled if it did not, within [min_interval, max_interval].
+        """
+        for clusterid in self.schedules_.keys():
+            if clusterid not in clusters:
+                logging.info('cluster %s is not installing', clusterid)
+                del self.schedules_[clusterid]
+
+        for clusterid, progress in clusters.items():
+            schedule = self.schedules_.get(clusterid)
+            if not schedule:
+                self.schedules_[clusterid] = ClusterSchedule(
+                    progress, self.interval_, now)
+                continue
+
+            if (schedule.dispatch_time_ is None or
+                    self.is_in_flight(schedule, now)):
+                continue
+
+            if progress > schedule.progress_:
+                schedule.interval_ = max(
+                    schedule.interval_ / 2.0, self.min_interval_)
+            else:
+                schedule.interval_ = min(
+                    schedule.interval_ * 2.0, self.max_interval_)
+
+            logging.debug('cluster %s progress %s -> %s, interval %s',
+                          clusterid, schedule.progress_, progress,
+                          schedule.interval_)
+            schedule.progress_ = progress
+            schedule.next_time_ = (
+                schedule.dispatch_time_ + schedule.interval_)
+            schedule.dispatch_time_ = None
+            schedule.result_ = None
+
+    def get_due_clusters(self, now):
+        """Get the clusters to update now, skipping in-flight ones."""
+        return sorted([
+            clusterid for clusterid, schedule in self.schedules_.items()
+            if schedule.dispatch_time_ is None and schedule.next_time_ <= now
+        ])
+
+    def get_batches(self, clusterids):
+        """Split the cluster ids into one batch per worker."""
+        batches = [[] for _ in range(min(self.workers_, len(clusterids)))]
+        for index, clusterid in enumerate(clusterids):
+            batches[index % len(batches)].append(clusterid)
+
+        return batches
+
+    def dispatch(self, now=None):
+        """Dispatch the progress updates of the due clusters.
+
+        :returns: list of the dispatched batches of cluster ids.
+        """
+        if now is None:
+            now = time.time()
+
+        if self.lease_:
+            self.lease_.heartbeat()
+
+        clusters = progress_update.get_installing_clusters()
+        if self.clusterids_:
+            clusters = dict([
+                (clusterid, progress)
+                for clusterid, progress in clusters.items()
+                if clusterid in self.clusterids_
+            ])
+
+        if self.lease_:
+            clusters = dict([
+                (clusterid, clusters[clusterid])
+                for clusterid in self.lease_.claim(sorted(clusters.keys()))
+            ])
+
+        self.update_clusters(clusters, now)
+        batches = self.get_batches(self.get_due_clusters(now))
+        for batch in batches:
+            logging.info('update progress for clusters: %s', batch)
+            result = None
+            if self.send_task_:
+                result = self.send_task_(batch)
+            else:
+                progress_update.update_clusters_progress(batch)
+                if self.lease_:
+                    self.lease_.heartbeat_if_due()
+
+            for clusterid in batch:
+                schedule = self.schedules_[clusterid]
+                schedule.dispatch_time_ = now
+                schedule.result_ = result
+
+        return batches
+
+    def get_sleep_seconds(self, now=None):
+        """Get the seconds to wait before the next dispatch."""
+        if now is None:
+            now = time.time()
+
+        if not self.schedules_:
+            return self.interval_
+
+        next_time = min([
+            schedule.next_time_ if schedule.dispatch_time_ is None
+            else schedule.dispatch_time_ + self.min_interval_
+            for schedule in self.schedules_.values()
+        ])
+        return min(max(next_time - now, self.min_interval_), self.interval_)
@@ -5,11 +5,92 @@
 import logging
 
 from compass.db import database
-from compass.db.model import Cluster
+from compass.db.model import Adapter, Cluster, ClusterHost
+from compass.db.model import ClusterState, HostState
+from compass.log_analyzor import adapter_matcher
 from compass.log_analyzor import progress_calculator
+from compass.log_analyzor.line_matcher import Progress
 from compass.utils import setting_wrapper as setting
 
 
+def get_installing_clusters():
+    """Get the clusters in INSTALLING state.
+
+    :returns: dict of clusterid to the cluster progress.
+
+    .. note::
+       The function should be called out of the database session scope.
+       Only one query is issued, so it is cheap to call it periodically
+       even if there is nothing installing.
+    """
+    with database.read_session() as session:
+        return dict(session.query(
+            ClusterState.id, ClusterState.progress
+        ).filter(ClusterState.state == 'INSTALLING'))
+
+
+def update_clusters_progress(clusterids):
+    """Update status and installing progress of the given clusters.
+
+    :param clusterids: the ids of the clusters to get the progress.
+    :type clusterids: list of int
+
+    .. note::
+       The function should be called out of the database session scope.
+       The adapters and hosts of all the given clusters are loaded in
+       two queries, and the clusters which are not in INSTALLING state
+       are skipped. See :func:`update_progress` for how the progress of
+       each cluster is updated.
+
+       Nothing is updated if PROGRESS_UPDATE_FROM_AGENTS is set, since
+       the progresses are then reported by the progress agents.
+    """
+    if setting.PROGRESS_UPDATE_FROM_AGENTS:
+        logging.info('progresses of clusters %s are reported by agents',
+                     clusterids)
+        return
+
+    clusters = {}
+    with database.read_session() as session:
+        for chunk in database.in_chunks(clusterids):
+            for clusterid, os_version, target_system in session.query(
+                Cluster.id, Adapter.os, Adapter.target_system
+            ).join(
+                ClusterState, ClusterState.id == Cluster.id
+            ).join(
+                Adapter, Adapter.id == Cluster.adapter_id
+            ).filter(
+                Cluster.id.in_(chunk),
+                ClusterState.state == 'INSTALLING'
+            ):
+                clusters[clusterid] = (os_version, target_system, [])
+
+            for hostid, clusterid in session.query(
+                ClusterHost.id, ClusterHost.cluster_id
+            ).filter(ClusterHost.cluster_id.in_(chunk)):
+                if clusterid in clusters:
+                    clusters[clusterid][2].append(hostid)
+
+    for clusterid in clusterids:
+        if clusterid not in clusters:
+            logging.error('cluster %s is not found, not installing or '
+                          'has no adapter', clusterid)
+            continue
+
+        os_version, target_system, hostids = clusters[clusterid]
+        try:
+            progress_calculator.update_progress(
+                setting.OS_INSTALLER, os_version,
+                setting.PACKAGE_INSTALLER, target_system,
+                clusterid, hostids,
+                setting.PROGRESS_UPDATE_WORKERS,
+                setting.PROGRESS_UPDATE_POOL_TYPE)
+        except Exception as error:
+            logging.error('failed to update progress for cluster %s',
+                          clusterid)
+            logging.exception(error)
+
+
 def update_progress(clusterid):
     """Update status and installing progress of the given cluster.
 
@@ -28,34 +109,121 @@ def update_progress(clusterid):
        After the progress got updated, these information will be stored back
        to the log_progressing_history for next time run.
     """
-    os_version = ''
-    target_system = ''
-    hostids = []
+    update_clusters_progress([clusterid])
+
+
+def update_hosts_progress(host_progresses):
+    """Apply host progresses calculated by the progress agents.
+
+    :param host_progresses: the progresses reported for each host.
+    :type host_progresses: dict of hostname to dict of progress,
+                           message, severity and checkpoint.
+
+    :returns: dict of hostname to dict of status and checkpoint.
+              The status is 'updated', 'unchanged' or 'not found'.
+
+    .. note::
+       The function should be called out of the database session scope.
+       The hosts, the clusters they belong to and the progresses of the
+       sibling hosts are loaded with a few IN queries, the cluster
+       progresses are recalculated the same way as
+       :func:`update_progress` does, and all the changed states are
+       written back in one transaction.
+
+       The caller should only apply the agent reports if
+       PROGRESS_UPDATE_FROM_AGENTS is set, so the agents and the central
+       progress update do not both update the same hosts.
+    """
+    results = {}
+    for hostname, host_progress in host_progresses.items():
+        results[hostname] = {
+            'status': 'not found',
+            'checkpoint': host_progress.get('checkpoint'),
+        }
+
     with database.session() as session:
-        cluster = session.query(Cluster).filter_by(id=clusterid).first()
-        if not cluster:
-            logging.error('no cluster found for %s', clusterid)
-            return
-
-        if not cluster.adapter:
-            logging.error('there is no adapter for cluster %s', clusterid)
-            return
-
-        os_version = cluster.adapter.os
-        target_system = cluster.adapter.target_system
-        if not cluster.state:
-            logging.error('there is no state for cluster %s', clusterid)
-            return
-
-        if cluster.state.state != 'INSTALLING':
-            logging.error('the state %s is not in installing for cluster %s',
-                          cluster.state.state, clusterid)
-            return
-
-        hostids = [host.id for host in cluster.hosts]
-
-    progress_calculator.update_progress(setting.OS_INSTALLER,
-                                        os_version,
-                                        setting.PACKAGE_INSTALLER,
-                                        target_system,
-                                        clusterid, hostids)
+        hosts = {}
+        for hostnames in database.in_chunks(host_progresses.keys()):
+            rows = session.query(
+                ClusterHost.id, ClusterHost.hostname, ClusterHost.cluster_id,
+                HostState.state, HostState.progress,
+                HostState.message, HostState.severity
+            ).outerjoin(
+                HostState, HostState.id == ClusterHost.id
+            ).filter(ClusterHost.hostname.in_(hostnames))
+            for (hostid, hostname, clusterid, state,
+                 progress, message, severity) in rows:
+                hosts[hostid] = (
+                    hostname, clusterid, state,
+                    Progress(progress or 0.0, message, severity))
+
+        host_updates = {}
+        new_host_progresses = {}
+        for hostid, (hostname, clusterid, state, old_progress) in (
+            hosts.items()
+        ):
+            host_progress = host_progresses[hostname]
+            progress = Progress(host_progress['progress'],
+                                host_progress.get('message', ''),
+                                host_progress.get('severity'))
+            host_update = adapter_matcher.get_state_update(
+                'host %s' % hostname, state, old_progress, progress)
+            if not host_update:
+                results[hostname]['status'] = 'unchanged'
+                continue
+
+            results[hostname]['status'] = 'updated'
+            host_updates[hostid] = host_update
+            new_host_progresses[hostid] = progress
+
+        clusterids = set([
+            hosts[hostid][1] for hostid in host_updates
+            if hosts[hostid][1] is not None
+        ])
+        clusters = {}
+        cluster_host_progresses = {}
+        for chunk in database.in_chunks(clusterids):
+            for clusterid, state, progress, message, severity in (
+                session.query(
+                    ClusterState.id, ClusterState.state,
+                    ClusterState.progress, ClusterState.message,
+                    ClusterState.severity
+                ).filter(ClusterState.id.in_(chunk))
+            ):
+                clusters[clusterid] = (
+                    state, Progress(progress, message, severity))
+                cluster_host_progresses[clusterid] = []
+
+            for hostid, clusterid, progress, message, severity in (
+                session.query(
+                    ClusterHost.id, ClusterHost.cluster_id,
+                    HostState.progress, HostState.message,
+                    HostState.severity
+                ).outerjoin(
+                    HostState, HostState.id == ClusterHost.id
+                ).filter(ClusterHost.cluster_id.in_(chunk))
+            ):
+                if clusterid not in cluster_host_progresses:
+                    continue
+
+                if hostid in new_host_progresses:
+                    host_progress = new_host_progresses[hostid]
+                else:
+                    host_progress = Progress(
+                        progress or 0.0, message, severity)
+
+                cluster_host_progresses[clusterid].append(host_progress)
+
+        cluster_updates = {}
+        for clusterid, (state, old_progress) in clusters.items():
+            progress = adapter_matcher.get_cluster_progress(
+                old_progress, cluster_host_progresses[clusterid],
+                len(cluster_host_progresses[clusterid]))
+            cluster_update = adapter_matcher.get_state_update(
+                'cluster %s' % clusterid, state, old_progress, progress)
+            if cluster_update:
+                cluster_updates[clusterid] = cluster_update
+
+        adapter_matcher.update_states(session, cluster_updates, host_updates)
+
+    return results
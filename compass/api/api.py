@@ -1,19 +1,28 @@
 """Define all the RestfulAPI entry points"""
 import logging
 import simplejson as json
-from flask import request
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import Response, g, request, stream_with_context
 from flask.ext.restful import Resource
+from netaddr import IPNetwork
+from sqlalchemy.orm import joinedload
 from sqlalchemy.sql import and_, or_
 
+from compass.actions import progress_update
 from compass.api import app, util, errors
 from compass.tasks.client import celery
+from compass.db import catalog
 from compass.db import database
+from compass.utils import metrics
+from compass.utils import setting_wrapper as setting
 from compass.db.model import Switch as ModelSwitch
 from compass.db.model import Machine as ModelMachine
 from compass.db.model import Cluster as ModelCluster
 from compass.db.model import ClusterHost as ModelClusterHost
-from compass.db.model import Adapter
-from compass.db.model import Role
+from compass.db.model import ClusterState
+from compass.db.model import HostState
 
 
 class SwitchList(Resource):
@@ -24,6 +33,7 @@ class SwitchList(Resource):
     SWITCHIP = 'switchIp'
     SWITCHIPNETWORK = 'switchIpNetwork'
     LIMIT = 'limit'
+    MARKER = 'marker'
 
     def get(self):
         """
@@ -31,97 +41,87 @@ class SwitchList(Resource):
         Note: switchIp and swtichIpNetwork cannot be combined to use.
 
         :param switchIp: switch IP address
-        :param switchIpNetwork: switch IP network
-        :param limit: the number of records excepted to return
+        :param switchIpNetwork: switch IP network, can be given multiple
+                                times to list the switches in any of them
+        :param limit: the number of records excepted to return in one page
+        :param marker: the id of the last switch of the previous page
         """
         qkeys = request.args.keys()
         logging.info('SwitchList query strings : %s', qkeys)
-        switch_list = []
+        switch_ips = request.args.getlist(self.SWITCHIP)
+        switch_ip_networks = [
+            str(network) for network in
+            request.args.getlist(self.SWITCHIPNETWORK)
+        ]
+        limit = request.args.get(self.LIMIT, 0, type=int)
+        marker = request.args.get(self.MARKER, 0, type=int)
 
-        with database.session() as session:
-            switches = []
-            switch_ips = request.args.getlist(self.SWITCHIP)
-            switch_ip_network = request.args.get(self.SWITCHIPNETWORK,
-                                                 type=str)
-            limit = request.args.get(self.LIMIT, 0, type=int)
-
-            if switch_ips and switch_ip_network:
-                error_msg = 'switchIp and switchIpNetwork cannot be combined!'
-                return errors.handle_invalid_usage(
-                    errors.UserInvalidUsage(error_msg))
+        if switch_ips and switch_ip_networks:
+            error_msg = 'switchIp and switchIpNetwork cannot be combined!'
+            return errors.handle_invalid_usage(
+                errors.UserInvalidUsage(error_msg))
 
-            if limit < 0:
-                error_msg = "limit cannot be less than 1!"
-                return errors.handle_invalid_usage(
-                    errors.UserInvalidUsage(error_msg))
+        if limit < 0:
+            error_msg = "limit cannot be less than 1!"
+            return errors.handle_invalid_usage(
+                errors.UserInvalidUsage(error_msg))
 
-            if switch_ips:
-                for ip_addr in switch_ips:
-                    ip_addr = str(ip_addr)
-                    if not util.is_valid_ip(ip_addr):
-                        error_msg = 'SwitchIp format is incorrect!'
-                        return errors.handle_invalid_usage(
-                            errors.UserInvalidUsage(error_msg))
-                    switch = session.query(ModelSwitch).filter_by(ip=ip_addr)\
-                                                       .first()
-                    if switch:
-                        switches.append(switch)
-                        logging.info('[SwitchList][get] ip %s', ip_addr)
-
-            elif switch_ip_network:
-                # query all switches which belong to the same network
-                if not util.is_valid_ipnetowrk(switch_ip_network):
-                    error_msg = 'SwitchIpNetwork format is incorrect!'
+        if marker < 0:
+            error_msg = "marker cannot be less than 0!"
+            return errors.handle_invalid_usage(
+                errors.UserInvalidUsage(error_msg))
+
+        limit = util.get_page_size(limit)
+        filter_clause = None
+        if switch_ips:
+            switch_ips = [str(ip_addr) for ip_addr in switch_ips]
+            for ip_addr in switch_ips:
+                if not util.is_valid_ip(ip_addr):
+                    error_msg = 'SwitchIp format is incorrect!'
                     return errors.handle_invalid_usage(
                         errors.UserInvalidUsage(error_msg))
 
-                def get_queried_ip_prefix(network, prefix):
-                    """ Get Ip prefex as pattern used to query switches.
-                        Switches' Ip addresses need to match this pattern.
-                    """
-                    count = int(prefix/8)
-                    if count == 0:
-                        count = 1
-                    return network.rsplit('.', count)[0]+'.'
+            filter_clause = ModelSwitch.ip.in_(switch_ips)
+            logging.info('[SwitchList][get] ips %s', switch_ips)
 
-                from netaddr import IPNetwork, IPAddress
+        elif switch_ip_networks:
+            # query all switches which belong to any of the networks
+            ip_ranges = []
+            for switch_ip_network in switch_ip_networks:
+                if not util.is_valid_ipnetowrk(switch_ip_network):
+                    error_msg = 'SwitchIpNetwork format is incorrect!'
+                    return errors.handle_invalid_usage(
+                        errors.UserInvalidUsage(error_msg))
 
                 ip_network = IPNetwork(switch_ip_network)
-                ip_filter = get_queried_ip_prefix(str(ip_network.network),
-                                                  ip_network.prefixlen)
-
-                logging.info('ip_filter is %s', ip_filter)
-                result_set = session.query(ModelSwitch).filter(
-                    ModelSwitch.ip.startswith(ip_filter)).all()
-
-                for switch in result_set:
-                    ip_addr = str(switch.ip)
-                    if IPAddress(ip_addr) in ip_network:
-                        switches.append(switch)
-                        logging.info('[SwitchList][get] ip %s', ip_addr)
-
-                if limit and len(switches) > limit:
-                    switches = switches[:limit]
-
-            elif limit and not switches:
-                switches = session.query(ModelSwitch).limit(limit).all()
-            else:
-                switches = session.query(ModelSwitch).all()
-
-            for switch in switches:
-                switch_res = {}
-                switch_res['id'] = switch.id
-                switch_res['ip'] = switch.ip
-                switch_res['state'] = switch.state
-                switch_res['link'] = {
+                ip_ranges.append(ModelSwitch.ip_int.between(
+                    ip_network.first, ip_network.last))
+
+            filter_clause = or_(*ip_ranges)
+            logging.info('[SwitchList][get] networks %s',
+                         switch_ip_networks)
+
+        def get_query(session):
+            """Get the query of the listed switches."""
+            query = session.query(ModelSwitch)
+            if filter_clause is not None:
+                query = query.filter(filter_clause)
+
+            return query
+
+        def to_dict(switch):
+            """Get the dict of a listed switch."""
+            return {
+                'id': switch.id,
+                'ip': switch.ip,
+                'state': switch.state,
+                'link': {
                     'rel': 'self',
-                    'href': '/'.join((self.ENDPOINT, str(switch.id)))}
-                switch_list.append(switch_res)
-        logging.info('get switch list: %s', switch_list)
+                    'href': '/'.join((self.ENDPOINT, str(switch.id)))}}
 
-        return util.make_json_response(
-            200, {"status": 'OK',
-                  "switches": switch_list})
+        return util.make_page_response(
+            'switches', get_query, ModelSwitch.id, marker, limit,
+            self.ENDPOINT, to_dict)
 
     def post(self):
         """
@@ -178,6 +178,115 @@ class SwitchList(Resource):
             )
 
 
+@app.route("/switches/batch", methods=['POST'])
+def add_switches():
+    """Insert a batch of switch IPs and their credentials to db.
+
+    The valid switches are inserted in one transaction, and their first
+    polls are scheduled in batches of POLLSWITCH_BATCH_SIZE switches,
+    each batch POLLSWITCH_BATCH_INTERVAL seconds after the previous one.
+
+    :param switches: list of dict of ip and credential.
+
+    :returns: the result of each requested switch in request order. Its
+              status is 'accepted', 'invalid' or 'conflict'.
+    """
+    logging.debug('post switches request from curl is %s', request.data)
+    json_data = json.loads(request.data)
+    switches = json_data.get('switches')
+    if not switches or not isinstance(switches, list):
+        error_msg = "No switches are provided!"
+        return errors.handle_mssing_input(
+            errors.InputMissingError(error_msg)
+            )
+
+    if len(switches) > setting.API_MAX_BATCH_SIZE:
+        error_msg = "At most %s switches are allowed in a batch!" % (
+            setting.API_MAX_BATCH_SIZE)
+        return errors.handle_invalid_usage(
+            errors.UserInvalidUsage(error_msg)
+            )
+
+    results = []
+    requested = {}
+    for item in switches:
+        ip_addr = None
+        credential = None
+        if isinstance(item, dict):
+            ip_addr = item.get('ip')
+            credential = item.get('credential')
+
+        result = {'ip': ip_addr}
+        results.append(result)
+        if not isinstance(ip_addr, basestring) or \
+                not util.is_valid_ip(ip_addr):
+            result['status'] = 'invalid'
+            result['message'] = "Invalid IP address format!"
+        elif not isinstance(credential, dict):
+            result['status'] = 'invalid'
+            result['message'] = "Invalid credential!"
+        elif ip_addr in requested:
+            result['status'] = 'invalid'
+            result['message'] = "IP address '%s' is duplicated" % ip_addr
+        else:
+            requested[ip_addr] = (result, credential)
+
+    new_ips = []
+    with database.session() as session:
+        existing = {}
+        for chunk in database.in_chunks(requested.keys()):
+            existing.update(session.query(
+                ModelSwitch.ip, ModelSwitch.id
+            ).filter(ModelSwitch.ip.in_(chunk)).all())
+
+        new_switches = []
+        for ip_addr, (result, credential) in requested.items():
+            if ip_addr in existing:
+                result['status'] = 'conflict'
+                result['message'] = "IP address '%s' already exists" % ip_addr
+                result['id'] = existing[ip_addr]
+                continue
+
+            switch = ModelSwitch(ip=ip_addr)
+            switch.credential = credential
+            new_switches.append((result, switch))
+
+        session.add_all([switch for _, switch in new_switches])
+        session.flush()
+        for result, switch in new_switches:
+            result['status'] = 'accepted'
+            result['id'] = switch.id
+            result['state'] = switch.state
+            result['link'] = {
+                'rel': 'self',
+                'href': '/'.join((SwitchList.ENDPOINT, str(switch.id)))}
+
+        new_ips = [
+            result['ip'] for result in results
+            if result.get('status') == 'accepted'
+        ]
+
+    batch_size = max(setting.POLLSWITCH_BATCH_SIZE, 1)
+    for index, start in enumerate(range(0, len(new_ips), batch_size)):
+        celery.send_task(
+            "compass.tasks.pollswitches",
+            (new_ips[start:start + batch_size],),
+            countdown=index * setting.POLLSWITCH_BATCH_INTERVAL)
+
+    logging.info('new switches added: %s', new_ips)
+    if not new_ips:
+        return util.make_json_response(
+            400, {"status": "Invalid parameters",
+                  "message": "No switch is accepted!",
+                  "switches": results}
+            )
+
+    return util.make_json_response(
+        202, {"status": "accepted",
+              "switches": results}
+        )
+
+
 class Switch(Resource):
     """Get and update a single switch information"""
     ENDPOINT = "/switches"
@@ -188,7 +297,7 @@ class Switch(Resource):
         :param switch_id: switch ID in db
         """
         switch_res = {}
-        with database.session() as session:
+        with database.read_session() as session:
             switch = session.query(ModelSwitch).filter_by(id=switch_id).first()
             logging.info('switch for id %s: %s', switch_id, switch)
 
@@ -272,6 +381,7 @@ class MachineList(Resource):
     VLANID = 'vladId'
     PORT = 'port'
     LIMIT = 'limit'
+    MARKER = 'marker'
 
     def get(self):
         """
@@ -281,64 +391,62 @@ class MachineList(Resource):
         :param switchId: the unique identifier of the switch
         :param vladId: the vlan ID
         :param port: the port number
-        :param limit: the number of records expected to return
+        :param limit: the number of records expected to return in one page
+        :param marker: the id of the last machine of the previous page
         """
-        machines_result = []
         switch_id = request.args.get(self.SWITCHID, type=int)
         vlan = request.args.get(self.VLANID, type=int)
         port = request.args.get(self.PORT, type=int)
         limit = request.args.get(self.LIMIT, 0, type=int)
+        marker = request.args.get(self.MARKER, 0, type=int)
 
-        with database.session() as session:
-            machines = []
-            filter_clause = []
-            if switch_id:
-                filter_clause.append('switch_id=%d' % switch_id)
+        filter_clause = []
+        if switch_id:
+            filter_clause.append('switch_id=%d' % switch_id)
 
-            if vlan:
-                filter_clause.append('vlan=%d' % vlan)
+        if vlan:
+            filter_clause.append('vlan=%d' % vlan)
 
-            if port:
-                filter_clause.append('port=%d' % port)
+        if port:
+            filter_clause.append('port=%d' % port)
 
-            if limit < 0:
-                error_msg = 'Limit cannot be less than 0!'
-                return errors.UserInvalidUsage(
-                    errors.UserInvalidUsage(error_msg)
-                )
+        if limit < 0:
+            error_msg = 'Limit cannot be less than 0!'
+            return errors.handle_invalid_usage(
+                errors.UserInvalidUsage(error_msg)
+            )
 
+        if marker < 0:
+            error_msg = 'Marker cannot be less than 0!'
+            return errors.handle_invalid_usage(
+                errors.UserInvalidUsage(error_msg)
+            )
+
+        def get_query(session):
+            """Get the query of the listed machines."""
+            query = session.query(ModelMachine).options(
+                joinedload(ModelMachine.switch))
             if filter_clause:
-                if limit:
-                    machines = session.query(ModelMachine)\
-                                      .filter(and_(*filter_clause))\
-                                      .limit(limit).all()
-                else:
-                    machines = session.query(ModelMachine)\
-                                      .filter(and_(*filter_clause)).all()
-            else:
-                if limit:
-                    machines = session.query(ModelMachine).limit(limit).all()
-                else:
-                    machines = session.query(ModelMachine).all()
-
-            logging.info('all machines: %s', machines)
-            for machine in machines:
-                machine_res = {}
-                machine_res['switch_ip'] = None if not machine.switch else \
-                    machine.switch.ip
-                machine_res['id'] = machine.id
-                machine_res['mac'] = machine.mac
-                machine_res['port'] = machine.port
-                machine_res['vlan'] = machine.vlan
-                machine_res['link'] = {
+                query = query.filter(and_(*filter_clause))
+
+            return query
+
+        def to_dict(machine):
+            """Get the dict of a listed machine."""
+            return {
+                'switch_ip': None if not machine.switch else machine.switch.ip,
+                'id': machine.id,
+                'mac': machine.mac,
+                'port': machine.port,
+                'vlan': machine.vlan,
+                'link': {
                     'rel': 'self',
-                    'href': '/'.join((self.ENDPOINT, str(machine.id)))}
-                machines_result.append(machine_res)
+                    'href': '/'.join((self.ENDPOINT, str(machine.id)))}}
 
-        logging.info('machines for %s: %s', switch_id, machines_result)
-        return util.make_json_response(
-            200, {"status": "OK",
-                  "machines": machines_result})
+        logging.info('list machines for %s', switch_id)
+        return util.make_page_response(
+            'machines', get_query, ModelMachine.id, marker,
+            util.get_page_size(limit), self.ENDPOINT, to_dict)
 
 
 class Machine(Resource):
@@ -352,7 +460,7 @@ class Machine(Resource):
         :param machine_id: the unique identifier of the machine
         """
         machine_res = {}
-        with database.session() as session:
+        with database.read_session() as session:
             machine = session.query(ModelMachine)\
                              .filter_by(id=machine_id)\
                              .first()
@@ -391,6 +499,7 @@ class Cluster(Resource):
     SECURITY = 'security'
     NETWORKING = 'networking'
     PARTITION = 'partition'
+    RESOURCES = [SECURITY, NETWORKING, PARTITION]
 
     def get(self, cluster_id, resource=None):
         """
@@ -402,7 +511,7 @@ class Cluster(Resource):
         """
         cluster_resp = {}
         resp = {}
-        with database.session() as session:
+        with database.read_session() as session:
             cluster = session.query(ModelCluster)\
                              .filter_by(id=cluster_id)\
                              .first()
@@ -413,6 +522,13 @@ class Cluster(Resource):
                     errors.ObjectDoesNotExist(error_msg)
                     )
 
+            etag = util.make_etag(
+                'cluster', cluster.id, cluster.name, resource,
+                getattr(cluster, '%s_config' % resource, None)
+                if resource in self.RESOURCES else None)
+            if util.is_not_modified(etag):
+                return util.make_not_modified_response(etag)
+
             if resource:
                 # List resource details
                 if resource == self.SECURITY:
@@ -440,7 +556,8 @@ class Cluster(Resource):
                         "cluster": cluster_resp}
 
         logging.info('get cluster result is %s', cluster_resp)
-        return util.make_json_response(200, resp)
+        return util.set_cache_validators(
+            util.make_json_response(200, resp), etag)
 
     def post(self):
         """Create a new cluster.
@@ -533,27 +650,80 @@ class Cluster(Resource):
             200, {"status": "OK"})
 
 
+def get_progress_result(object_id, state, progress, message, severity):
+    """Get the installing progress result of a cluster or a host.
+
+    The object without a state is reported as UNINITIALIZED.
+    """
+    if not state:
+        return {
+            'id': object_id,
+            'state': 'UNINITIALIZED',
+            'percentage': 0,
+            'message': "Waiting..............",
+            'severity': "INFO"
+        }
+
+    return {
+        'id': object_id,
+        'state': state,
+        'percentage': progress,
+        'message': message,
+        'severity': severity
+    }
+
+
 @app.route("/clusters", methods=['GET'])
 def list_clusters():
-    """Lists the details of all clusters"""
-    endpoint = '/clusters'
-    results = []
-    with database.session() as session:
-        clusters = session.query(ModelCluster).all()
+    """Lists the details of all clusters
 
-        if clusters:
-            for cluster in clusters:
-                cluster_res = {}
-                cluster_res['clusterName'] = cluster.name
-                cluster_res['id'] = cluster.id
-                cluster_res['link'] = {
-                    "href": "/".join((endpoint, str(cluster.id))),
-                    "rel": "self"}
-                results.append(cluster_res)
+    :param limit: the number of clusters expected to return in one page
+    :param marker: the id of the last cluster of the previous page
+    :param include: 'progress' to list the installing progress of each
+                    cluster as well
+    """
+    endpoint = '/clusters'
+    limit = request.args.get('limit', 0, type=int)
+    marker = request.args.get('marker', 0, type=int)
+    include = request.args.getlist('include')
+    if limit < 0 or marker < 0:
+        error_msg = 'limit and marker cannot be less than 0!'
+        return errors.handle_invalid_usage(
+            errors.UserInvalidUsage(error_msg))
 
-    return util.make_json_response(
-        200, {"status": "OK",
-              "clusters": results})
+    if set(include) - set(['progress']):
+        error_msg = 'Invalid include %s!' % include
+        return errors.handle_invalid_usage(
+            errors.UserInvalidUsage(error_msg))
+
+    def get_query(session):
+        """Get the query of the listed clusters."""
+        query = session.query(ModelCluster)
+        if 'progress' in include:
+            query = query.options(joinedload(ModelCluster.state))
+
+        return query
+
+    def to_dict(cluster):
+        """Get the dict of a listed cluster."""
+        cluster_res = {
+            'clusterName': cluster.name,
+            'id': cluster.id,
+            'link': {
+                "href": "/".join((endpoint, str(cluster.id))),
+                "rel": "self"}}
+        if 'progress' in include:
+            state = cluster.state
+            cluster_res['progress'] = get_progress_result(
+                cluster.id, state and state.state,
+                state and state.progress, state and state.message,
+                state and state.severity)
+
+        return cluster_res
+
+    return util.make_page_response(
+        'clusters', get_query, ModelCluster.id, marker,
+        util.get_page_size(limit), endpoint, to_dict)
 
 
 @app.route("/clusters/<string:cluster_id>/action", methods=['POST'])
@@ -571,29 +741,38 @@ def execute_cluster_action(cluster_id):
         """Add cluster host(s) to the cluster by cluster_id"""
 
         cluseter_hosts = []
-        available_machines = []
-        failed_machines = []
+        machine_ids = []
+        for host in hosts:
+            if host not in machine_ids:
+                machine_ids.append(host)
+
         with database.session() as session:
-            failed_machines = []
-            for host in hosts:
+            existing_machines = set()
+            used_machines = set()
+            for chunk in database.in_chunks(machine_ids):
+                existing_machines.update([
+                    machine_id for machine_id, in session.query(
+                        ModelMachine.id
+                    ).filter(ModelMachine.id.in_(chunk))
+                ])
+                used_machines.update([
+                    machine_id for machine_id, in session.query(
+                        ModelClusterHost.machine_id
+                    ).filter(ModelClusterHost.machine_id.in_(chunk))
+                ])
+
+            for host in machine_ids:
                 # Check if machine exists
-                machine = session.query(ModelMachine).filter_by(id=host)\
-                                                     .first()
-                if not machine:
+                if host not in existing_machines:
                     error_msg = "Machine id=%s does not exist!" % host
                     return errors.handle_not_exist(
                         errors.ObjectDoesNotExist(error_msg)
                         )
-                clusterhost = session.query(ModelClusterHost)\
-                                     .filter_by(machine_id=host)\
-                                     .first()
-                if clusterhost:
-                    # Machine is already used
-                    failed_machines.append(clusterhost.machine_id)
-                    continue
-                # Add the available machine to available_machines list
-                available_machines.append(machine)
 
+            # Machines already used
+            failed_machines = [
+                host for host in machine_ids if host in used_machines
+            ]
             if failed_machines:
                 value = {
                     'failedMachines': failed_machines
@@ -602,14 +781,27 @@ def execute_cluster_action(cluster_id):
                 return errors.handle_duplicate_object(
                     errors.ObjectDuplicateError(error_msg), value
                     )
-            for machine, host in zip(available_machines, hosts):
-                host = ModelClusterHost(cluster_id=cluster_id,
-                                        machine_id=machine.id)
-                session.add(host)
-                session.flush()
+
+            if machine_ids:
+                session.execute(ModelClusterHost.__table__.insert(), [
+                    {'cluster_id': cluster_id, 'machine_id': machine_id,
+                     'hostname': str(uuid.uuid4())}
+                    for machine_id in machine_ids
+                ])
+
+            host_ids = {}
+            for chunk in database.in_chunks(machine_ids):
+                host_ids.update(session.query(
+                    ModelClusterHost.machine_id, ModelClusterHost.id
+                ).filter(
+                    ModelClusterHost.cluster_id == cluster_id,
+                    ModelClusterHost.machine_id.in_(chunk)
+                ).all())
+
+            for machine_id in machine_ids:
                 cluster_res = {}
-                cluster_res['id'] = host.id
-                cluster_res['machine_id'] = machine.id
+                cluster_res['id'] = host_ids[machine_id]
+                cluster_res['machine_id'] = machine_id
                 cluseter_hosts.append(cluster_res)
 
         logging.info('cluster_hosts result is %s', cluseter_hosts)
@@ -625,21 +817,15 @@ def execute_cluster_action(cluster_id):
 
         removed_hosts = []
         with database.session() as session:
-            failed_hosts = []
-            for host_id in hosts:
-                host = session.query(ModelClusterHost).filter_by(id=host_id)\
-                                                      .first()
-
-                if not host:
-                    failed_hosts.append(host)
-                    continue
-
-                host_res = {
-                    "id": host_id,
-                    "machine_id": host.machine_id
-                }
-                removed_hosts.append(host_res)
-
+            machine_ids = {}
+            for chunk in database.in_chunks(hosts):
+                machine_ids.update(session.query(
+                    ModelClusterHost.id, ModelClusterHost.machine_id
+                ).filter(ModelClusterHost.id.in_(chunk)).all())
+
+            failed_hosts = [
+                host_id for host_id in hosts if host_id not in machine_ids
+            ]
             if failed_hosts:
                 error_msg = 'Cluster hosts do not exist!'
                 value = {
@@ -649,13 +835,18 @@ def execute_cluster_action(cluster_id):
                     errors.ObjectDoesNotExist(error_msg), value
                     )
 
-            filter_clause = []
             for host_id in hosts:
-                filter_clause.append('id=%s' % host_id)
+                host_res = {
+                    "id": host_id,
+                    "machine_id": machine_ids[host_id]
+                }
+                removed_hosts.append(host_res)
 
             # Delete the requested hosts from database
-            session.query(ModelClusterHost).filter(or_(*filter_clause))\
-                   .delete(synchronize_session='fetch')
+            for chunk in database.in_chunks(hosts):
+                session.query(ModelClusterHost).filter(
+                    ModelClusterHost.id.in_(chunk)
+                ).delete(synchronize_session=False)
 
         return util.make_json_response(
             200, {
@@ -748,7 +939,7 @@ class ClusterHostConfig(Resource):
         :param host_id: the unique identifier of the host
         """
         config_res = {}
-        with database.session() as session:
+        with database.read_session() as session:
             host = session.query(ModelClusterHost).filter_by(id=host_id)\
                                                   .first()
             if not host:
@@ -757,12 +948,24 @@ class ClusterHostConfig(Resource):
                 return errors.handle_not_exist(
                     errors.ObjectDoesNotExist(error_msg))
 
+            cluster = host.cluster
+            machine = host.machine
+            etag = util.make_etag(
+                'host_config', host.id, host.hostname, host.config_data,
+                cluster.id if cluster else None,
+                cluster.name if cluster else None,
+                machine.mac if machine else None)
+            if util.is_not_modified(etag):
+                return util.make_not_modified_response(etag)
+
             config_res = host.config
 
         logging.debug("The config of host id=%s is %s", host_id, config_res)
-        return util.make_json_response(
-            200, {"status": "OK",
-                  "config": config_res})
+        return util.set_cache_validators(
+            util.make_json_response(
+                200, {"status": "OK",
+                      "config": config_res}),
+            etag)
 
     def put(self, host_id):
         """
@@ -850,7 +1053,7 @@ class ClusterHost(Resource):
         :param host_id: the unique identifier of the host
         """
         host_res = {}
-        with database.session() as session:
+        with database.read_session() as session:
             host = session.query(ModelClusterHost).filter_by(id=host_id)\
                                                   .first()
             if not host:
@@ -876,47 +1079,47 @@ def list_clusterhosts():
 
     :param hostname: the name of the host
     :param clstername: the name of the cluster
+    :param limit: the number of hosts expected to return in one page
+    :param marker: the id of the last host of the previous page
     """
     endpoint = '/clusterhosts'
     key_hostname = 'hostname'
     key_clustername = 'clustername'
 
-    hosts_list = []
     hostname = request.args.get(key_hostname, None, type=str)
     clustername = request.args.get(key_clustername, None, type=str)
-    with database.session() as session:
-        hosts = None
-        if hostname and clustername:
-            hosts = session.query(ModelClusterHost).join(ModelCluster)\
-                           .filter(ModelClusterHost.hostname == hostname,
-                                   ModelCluster.name == clustername)\
-                           .all()
-
-        elif hostname:
-            hosts = session.query(ModelClusterHost)\
-                           .filter_by(hostname=hostname).all()
-        elif clustername:
-            cluster = session.query(ModelCluster)\
-                             .filter_by(name=clustername).first()
-            if cluster:
-                hosts = cluster.hosts
-        else:
-            hosts = session.query(ModelClusterHost).all()
+    limit = request.args.get('limit', 0, type=int)
+    marker = request.args.get('marker', 0, type=int)
+    if limit < 0 or marker < 0:
+        error_msg = 'limit and marker cannot be less than 0!'
+        return errors.handle_invalid_usage(
+            errors.UserInvalidUsage(error_msg))
 
-        if hosts:
-            for host in hosts:
-                host_res = {}
-                host_res['hostname'] = host.hostname
-                host_res['mutable'] = host.mutable
-                host_res['id'] = host.id
-                host_res['link'] = {
-                    "href": '/'.join((endpoint, str(host.id))),
-                    "rel": "self"}
-                hosts_list.append(host_res)
+    def get_query(session):
+        """Get the query of the listed cluster hosts."""
+        query = session.query(ModelClusterHost)
+        if hostname:
+            query = query.filter(ModelClusterHost.hostname == hostname)
 
-        return util.make_json_response(
-            200, {"status": "OK",
-                  "cluster_hosts": hosts_list})
+        if clustername:
+            query = query.join(ModelCluster)\
+                         .filter(ModelCluster.name == clustername)
+
+        return query
+
+    def to_dict(host):
+        """Get the dict of a listed cluster host."""
+        return {
+            'hostname': host.hostname,
+            'mutable': host.mutable,
+            'id': host.id,
+            'link': {
+                "href": '/'.join((endpoint, str(host.id))),
+                "rel": "self"}}
+
+    return util.make_page_response(
+        'cluster_hosts', get_query, ModelClusterHost.id, marker,
+        util.get_page_size(limit), endpoint, to_dict)
 
 
 @app.route("/adapters/<string:adapter_id>", methods=['GET'])
@@ -928,20 +1131,19 @@ def list_adapter(adapter_id):
     """
     endpoint = '/adapters'
     adapter_res = {}
-    with database.session() as session:
-        adapter = session.query(Adapter).filter_by(id=adapter_id).first()
-
-        if not adapter:
-            error_msg = "Adapter id=%s does not exist!" % adapter_id
-            return errors.handle_not_exist(
-                errors.ObjectDoesNotExist(error_msg))
-        adapter_res['name'] = adapter.name
-        adapter_res['os'] = adapter.os
-        adapter_res['id'] = adapter.id
-        adapter_res['target_system'] = adapter.target_system,
-        adapter_res['link'] = {
-            "href": "/".join((endpoint, str(adapter.id))),
-            "rel": "self"}
+    adapter = None
+    if adapter_id.isdigit():
+        adapter = catalog.ADAPTER_CATALOG.get_adapter(int(adapter_id))
+
+    if not adapter:
+        error_msg = "Adapter id=%s does not exist!" % adapter_id
+        return errors.handle_not_exist(
+            errors.ObjectDoesNotExist(error_msg))
+
+    adapter_res.update(adapter)
+    adapter_res['link'] = {
+        "href": "/".join((endpoint, str(adapter['id']))),
+        "rel": "self"}
     return util.make_json_response(
         200, {"status": "OK",
               "adapter": adapter_res})
@@ -953,29 +1155,18 @@ def list_adapter_roles(adapter_id):
 
     :param adapter_id: the unique identifier of the adapter
     """
-    roles_list = []
-    with database.session() as session:
-        adapter_q = session.query(Adapter)\
-                           .filter_by(id=adapter_id).first()
-        if not adapter_q:
-            error_msg = "Adapter id=%s does not exist!" % adapter_id
-            return errors.handle_not_exist(
-                errors.ObjectDoesNotExist(error_msg))
-
-        roles = session.query(Role, Adapter)\
-                       .filter(Adapter.id == adapter_id,
-                               Adapter.target_system == Role.target_system)\
-                       .all()
+    roles = None
+    if adapter_id.isdigit():
+        roles = catalog.ADAPTER_CATALOG.get_roles(int(adapter_id))
 
-        for role, adapter in roles:
-            role_res = {}
-            role_res['name'] = role.name
-            role_res['description'] = role.description
-            roles_list.append(role_res)
+    if roles is None:
+        error_msg = "Adapter id=%s does not exist!" % adapter_id
+        return errors.handle_not_exist(
+            errors.ObjectDoesNotExist(error_msg))
 
     return util.make_json_response(
         200, {"status": "OK",
-              "roles": roles_list})
+              "roles": roles})
 
 
 @app.route("/adapters", methods=['GET'])
@@ -987,24 +1178,12 @@ def list_adapters():
     endpoint = '/adapters'
     name = request.args.get('name', type=str)
     adapter_list = []
-    adapter_res = {}
-    with database.session() as session:
-        adapters = []
-        if name:
-            adapters = session.query(Adapter).filter_by(name=name).all()
-        else:
-            adapters = session.query(Adapter).all()
-
-        for adapter in adapters:
-            adapter_res = {}
-            adapter_res['name'] = adapter.name
-            adapter_res['os'] = adapter.os
-            adapter_res['target_system'] = adapter.target_system
-            adapter_res['id'] = adapter.id
-            adapter_res['link'] = {
-                "href": "/".join((endpoint, str(adapter.id))),
-                "rel": "self"}
-            adapter_list.append(adapter_res)
+    for adapter in catalog.ADAPTER_CATALOG.get_adapters(name):
+        adapter_res = dict(adapter)
+        adapter_res['link'] = {
+            "href": "/".join((endpoint, str(adapter['id']))),
+            "rel": "self"}
+        adapter_list.append(adapter_res)
 
     return util.make_json_response(
         200, {"status": "OK",
@@ -1020,7 +1199,8 @@ class HostInstallingProgress(Resource):
         :param host_id: the unique identifier of the host
         """
         progress_result = {}
-        with database.session() as session:
+        last_modified = None
+        with database.read_session() as session:
             host = session.query(ModelClusterHost).filter_by(id=host_id)\
                                                   .first()
             if not host:
@@ -1028,25 +1208,85 @@ class HostInstallingProgress(Resource):
                 return errors.handle_not_exist(
                     errors.ObjectDoesNotExist(error_msg))
 
-            if not host.state:
-                progress_result = {
-                    'id': host_id,
-                    'state': 'UNINITIALIZED',
-                    'percentage': 0,
-                    'message': "Waiting..............",
-                    'severity': "INFO",
-                }
+            state = host.state
+            if state:
+                last_modified = state.update_timestamp
+                etag = util.make_etag(
+                    'host_progress', host.id, state.state, state.progress,
+                    state.message, state.severity, last_modified)
             else:
-                progress_result['id'] = host_id
-                progress_result['state'] = host.state.state
-                progress_result['percentage'] = host.state.progress
-                progress_result['message'] = host.state.message
-                progress_result['severity'] = host.state.severity
+                etag = util.make_etag('host_progress', host.id)
+
+            if util.is_not_modified(etag, last_modified):
+                return util.make_not_modified_response(etag, last_modified)
+
+            progress_result = get_progress_result(
+                host_id, state and state.state, state and state.progress,
+                state and state.message, state and state.severity)
 
         logging.info('progress result for %s: %s', host_id, progress_result)
-        return util.make_json_response(
-            200, {"status": "OK",
-                  "progress": progress_result})
+        return util.set_cache_validators(
+            util.make_json_response(
+                200, {"status": "OK",
+                      "progress": progress_result}),
+            etag, last_modified)
+
+
+@app.route("/clusterhosts/progress", methods=['POST'])
+def update_hosts_installing_progress():
+    """Update installing progresses of hosts reported by progress agents.
+
+    :param progresses: list of host progresses, each of which has
+                       hostname, progress, message, severity and checkpoint.
+
+    .. note::
+       The reports are rejected unless PROGRESS_UPDATE_FROM_AGENTS is
+       set, since the central progress update calculates the progresses
+       of all the hosts otherwise.
+    """
+    if not setting.PROGRESS_UPDATE_FROM_AGENTS:
+        error_msg = "Progresses are not reported by agents!"
+        return errors.handle_invalid_usage(
+            errors.UserInvalidUsage(error_msg))
+
+    try:
+        progresses = json.loads(request.data)['progresses']
+    except Exception as error:
+        logging.exception(error)
+        error_msg = "Invalid json data: %s" % request.data
+        return errors.handle_mssing_input(
+            errors.InputMissingError(error_msg))
+
+    host_progresses = {}
+    for host_progress in progresses:
+        hostname = host_progress.get('hostname')
+        if not hostname:
+            error_msg = "hostname is missing in %s" % host_progress
+            return errors.handle_mssing_input(
+                errors.InputMissingError(error_msg))
+
+        progress = host_progress.get('progress')
+        if (not isinstance(progress, (int, float)) or
+                not 0.0 <= progress <= 1.0):
+            error_msg = "Invalid progress %s of host %s" % (
+                progress, hostname)
+            return errors.handle_invalid_usage(
+                errors.UserInvalidUsage(error_msg))
+
+        severity = host_progress.get('severity')
+        if severity not in [None, 'INFO', 'WARNING', 'ERROR']:
+            error_msg = "Invalid severity %s of host %s" % (
+                severity, hostname)
+            return errors.handle_invalid_usage(
+                errors.UserInvalidUsage(error_msg))
+
+        host_progresses[hostname] = host_progress
+
+    results = progress_update.update_hosts_progress(host_progresses)
+    logging.debug('update hosts progress results: %s', results)
+    return util.make_json_response(
+        200, {"status": "OK",
+              "progresses": results})
 
 
 class ClusterInstallingProgress(Resource):
@@ -1058,7 +1298,8 @@ class ClusterInstallingProgress(Resource):
         :param cluster_id: the unique identifier of the cluster
         """
         progress_result = {}
-        with database.session() as session:
+        last_modified = None
+        with database.read_session() as session:
             cluster = session.query(ModelCluster).filter_by(id=cluster_id)\
                                                  .first()
             if not cluster:
@@ -1066,26 +1307,212 @@ class ClusterInstallingProgress(Resource):
                 return errors.handle_not_exist(
                     errors.ObjectDoesNotExist(error_msg))
 
-            if not cluster.state:
-                progress_result = {
-                    'id': cluster_id,
-                    'state': 'UNINITIALIZED',
-                    'percentage': 0,
-                    'message': "Waiting..............",
-                    'severity': "INFO"
-                }
+            state = cluster.state
+            if state:
+                last_modified = state.update_timestamp
+                etag = util.make_etag(
+                    'cluster_progress', cluster.id, state.state,
+                    state.progress, state.message, state.severity,
+                    last_modified)
             else:
-                progress_result['id'] = cluster_id
-                progress_result['state'] = cluster.state.state
-                progress_result['percentage'] = cluster.state.progress
-                progress_result['message'] = cluster.state.message
-                progress_result['severity'] = cluster.state.severity
+                etag = util.make_etag('cluster_progress', cluster.id)
+
+            if util.is_not_modified(etag, last_modified):
+                return util.make_not_modified_response(etag, last_modified)
+
+            progress_result = get_progress_result(
+                cluster_id, state and state.state, state and state.progress,
+                state and state.message, state and state.severity)
 
         logging.info('progress result for cluster %s: %s',
                      cluster_id, progress_result)
-        return util.make_json_response(
-            200, {"status": "OK",
-                  "progress": progress_result})
+        return util.set_cache_validators(
+            util.make_json_response(
+                200, {"status": "OK",
+                      "progress": progress_result}),
+            etag, last_modified)
+
+
+@app.route("/clusters/<int:cluster_id>/hosts/progress", methods=['GET'])
+def list_cluster_hosts_installing_progress(cluster_id):
+    """Lists the installing progress of all hosts in the cluster.
+
+    :param cluster_id: the unique identifier of the cluster
+    """
+    with database.read_session() as session:
+        cluster = session.query(ModelCluster.id).filter(
+            ModelCluster.id == cluster_id).first()
+
+    if not cluster:
+        error_msg = "The cluster id=%s does not exist!" % cluster_id
+        return errors.handle_not_exist(
+            errors.ObjectDoesNotExist(error_msg))
+
+    def get_query(session):
+        """Get the query of the hosts and their states."""
+        return session.query(
+            ModelClusterHost.id, ModelClusterHost.hostname,
+            HostState.state, HostState.progress, HostState.message,
+            HostState.severity
+        ).outerjoin(
+            HostState, HostState.id == ModelClusterHost.id
+        ).filter(
+            ModelClusterHost.cluster_id == cluster_id
+        ).order_by(ModelClusterHost.id)
+
+    def to_dict(row):
+        """Get the progress dict of a host."""
+        host_id, hostname, state, progress, message, severity = row
+        progress_result = get_progress_result(
+            host_id, state, progress, message, severity)
+        progress_result['hostname'] = hostname
+        return progress_result
+
+    return util.make_json_stream_response(
+        200, {"status": "OK",
+              "progresses": util.iter_query(get_query, to_dict)},
+        'progresses')
+
+
+EVENT_ID_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def get_progress_events(cluster_id, since=None):
+    """Get the progresses of the cluster and its hosts updated since.
+
+    :param cluster_id: the unique identifier of the cluster
+    :param since: datetime, the progresses updated at or after it are
+                  returned. All the progresses are returned if it is None.
+
+    :returns: list of (update_timestamp, event, data) ordered by
+              update_timestamp.
+    """
+    events = []
+    with database.read_session() as session:
+        query = session.query(ClusterState).filter(
+            ClusterState.id == cluster_id)
+        if since:
+            query = query.filter(ClusterState.update_timestamp >= since)
+
+        for state in query:
+            events.append((state.update_timestamp, 'cluster_progress', {
+                'id': state.id,
+                'state': state.state,
+                'percentage': state.progress,
+                'message': state.message,
+                'severity': state.severity}))
+
+        query = session.query(
+            ModelClusterHost.id, ModelClusterHost.hostname,
+            HostState.state, HostState.progress, HostState.message,
+            HostState.severity, HostState.update_timestamp
+        ).join(
+            HostState, HostState.id == ModelClusterHost.id
+        ).filter(ModelClusterHost.cluster_id == cluster_id)
+        if since:
+            query = query.filter(HostState.update_timestamp >= since)
+
+        for (host_id, hostname, state, progress, message,
+             severity, update_timestamp) in query:
+            events.append((update_timestamp, 'host_progress', {
+                'id': host_id,
+                'hostname': hostname,
+                'state': state,
+                'percentage': progress,
+                'message': message,
+                'severity': severity}))
+
+    return sorted(events, key=lambda event: event[0])
+
+
+@app.route("/clusters/<int:cluster_id>/progress/stream", methods=['GET'])
+def stream_cluster_installing_progress(cluster_id):
+    """Stream the progress changes of the cluster and its hosts as
+    server-sent events.
+
+    The first events are the current progresses, then the changes are
+    sent as they are written until the stream times out. The id of
+    each event is the update time of the progress, and a reconnecting
+    client resumes from it with the Last-Event-ID header.
+
+    .. note::
+       The progresses updated in the PROGRESS_STREAM_LOOKBACK seconds
+       before the last event are read again, so the updates stamped in
+       the same second as the last event, or stamped a bit before it but
+       committed after it, are not lost. They are de-duplicated by
+       (event, id, update time) within a stream, but a resuming client
+       may receive again some progresses it already has.
+
+       Each stream holds a server worker for up to
+       PROGRESS_STREAM_TIMEOUT seconds, so the number of concurrent
+       streams is bounded by the number of workers of the server.
+
+    :param cluster_id: the unique identifier of the cluster
+    :param timeout: the seconds to keep the stream open, at most
+                    PROGRESS_STREAM_TIMEOUT.
+    :param lastEventId: the id of the last event received, used when the
+                        Last-Event-ID header can not be set.
+    """
+    last_event_id = request.headers.get(
+        'Last-Event-ID', request.args.get('lastEventId'))
+    since = None
+    if last_event_id:
+        try:
+            since = datetime.strptime(last_event_id, EVENT_ID_FORMAT)
+        except ValueError:
+            error_msg = 'Invalid last event id %s!' % last_event_id
+            return errors.handle_invalid_usage(
+                errors.UserInvalidUsage(error_msg))
+
+    timeout = request.args.get('timeout', setting.PROGRESS_STREAM_TIMEOUT,
+                               type=int)
+    timeout = min(max(timeout, 0), setting.PROGRESS_STREAM_TIMEOUT)
+    with database.read_session() as session:
+        if not session.query(ModelCluster.id).filter_by(
+            id=cluster_id
+        ).first():
+            error_msg = "The cluster id=%s does not exist!" % cluster_id
+            return errors.handle_not_exist(
+                errors.ObjectDoesNotExist(error_msg))
+
+    def generate(since):
+        """Generate the progress events until the stream times out."""
+        interval = setting.PROGRESS_STREAM_INTERVAL
+        lookback = timedelta(seconds=setting.PROGRESS_STREAM_LOOKBACK)
+        deadline = time.time() + timeout
+        sent = {}
+        yield 'retry: %d\n\n' % (interval * 1000)
+        while True:
+            events = get_progress_events(
+                cluster_id, since and since - lookback)
+            new_events = [
+                (update_timestamp, event, data)
+                for update_timestamp, event, data in events
+                if update_timestamp > sent.get(
+                    (event, data['id']), datetime.min)
+            ]
+            for update_timestamp, event, data in new_events:
+                sent[(event, data['id'])] = update_timestamp
+                yield 'id: %s\nevent: %s\ndata: %s\n\n' % (
+                    update_timestamp.strftime(EVENT_ID_FORMAT),
+                    event, util.dumps(data))
+
+            if events and (since is None or events[-1][0] > since):
+                since = events[-1][0]
+
+            if not new_events:
+                yield ': keepalive\n\n'
+
+            if time.time() + interval > deadline:
+                return
+
+            time.sleep(interval)
+
+    resp = Response(stream_with_context(generate(since)),
+                    mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
 
 
 class DashboardLinks(Resource):
@@ -1099,7 +1526,7 @@ class DashboardLinks(Resource):
         cluster_id = request.args.get('cluster_id', None)
         logging.info('get cluster links with cluster_id=%s', cluster_id)
         links = {}
-        with database.session() as session:
+        with database.read_session() as session:
             hosts = session.query(ModelClusterHost)\
                            .filter_by(cluster_id=cluster_id).all()
             if not hosts:
@@ -1126,6 +1553,90 @@ class DashboardLinks(Resource):
             )
 
 
+REQUEST_COUNTER = metrics.REGISTRY.counter(
+    'compass_api_requests_total',
+    'Number of the api requests by endpoint, method and status.')
+REQUEST_DURATION = metrics.REGISTRY.histogram(
+    'compass_api_request_duration_seconds',
+    'Seconds spent serving the api requests by endpoint and method.')
+
+
+@app.route("/metrics", methods=['GET'])
+def get_metrics():
+    """Get the metrics of the compass processes in Prometheus text format.
+
+    .. note::
+       The metrics of the celery workers and the daemons are read from
+       the files they dump to METRICS_DIR.
+    """
+    return Response(metrics.collect().render(), status=200,
+                    mimetype='text/plain; version=0.0.4')
+
+
+@app.before_request
+def start_request_timer():
+    """Record the start time of the request."""
+    g.request_start_time = time.time()
+    g.response_status = 500
+
+
+@app.before_request
+def start_query_stats():
+    """Start counting the statements executed by the request."""
+    g.query_stats = database.start_query_stats(
+        '%s %s' % (request.method, request.path))
+
+
+@app.after_request
+def add_query_stats_headers(response):
+    """Report the statements executed by the request in the headers."""
+    stats = getattr(g, 'query_stats', None)
+    if stats:
+        response.headers['X-DB-Query-Count'] = str(stats.count_)
+        response.headers['X-DB-Query-Time'] = '%.3f' % stats.duration_
+
+    return response
+
+
+@app.after_request
+def keep_response_status(response):
+    """Keep the response status for the request metrics."""
+    g.response_status = response.status_code
+    return response
+
+
+@app.teardown_request
+def record_request_metrics(_):
+    """Count the request and observe its duration.
+
+    .. note::
+       The duration of a streamed response covers the whole stream,
+       since the request context is torn down when the stream ends.
+    """
+    start_time = getattr(g, 'request_start_time', None)
+    if start_time is None:
+        return
+
+    endpoint = 'unknown'
+    if request.url_rule:
+        endpoint = request.url_rule.rule
+
+    REQUEST_COUNTER.inc(endpoint=endpoint, method=request.method,
+                        status=g.response_status)
+    REQUEST_DURATION.observe(time.time() - start_time,
+                             endpoint=endpoint, method=request.method)
+    g.request_start_time = None
+    metrics.dump_if_due()
+
+
+@app.teardown_request
+def stop_query_stats(_):
+    """Stop counting the statements executed by the request."""
+    if getattr(g, 'query_stats', None):
+        database.stop_query_stats()
+        g.query_stats = None
+
+
 util.add_resource(SwitchList, '/switches')
 util.add_resource(Switch, '/switches/<string:switch_id>')
 util.add_resource(MachineList, '/machines')
@@ -1,27 +1,291 @@
 """Utils for API usage"""
+import hashlib
 import logging
+import time
+import zlib
 
-from flask import make_response
+from datetime import datetime
+
+from flask import Response, has_request_context, make_response, request
 from flask.ext.restful import Api
+from werkzeug.urls import url_encode
 
 import re
 from netaddr import IPAddress
 import simplejson as json
 
 from compass.api import app
+from compass.db import database
+from compass.utils import setting_wrapper as setting
 
 api = Api(app)
 
 
+# number of list items encoded in one chunk of a streamed response.
+STREAM_CHUNK_SIZE = 100
+GZIP_LEVEL = 6
+
+
+def is_pretty():
+    """Check if the request asks for indented json with ?pretty=true."""
+    if not has_request_context():
+        return False
+
+    return request.args.get('pretty', '').lower() in ['1', 'true', 'yes']
+
+
+def dumps(data):
+    """Serialize data to json, compact unless pretty output is asked."""
+    if is_pretty():
+        return json.dumps(data, indent=4)
+
+    return json.dumps(data, separators=(',', ':'))
+
+
 def make_json_response(status_code, data):
     """Wrap json format to the reponse object"""
 
-    result = json.dumps(data, indent=4)
+    result = dumps(data)
     resp = make_response(result, status_code)
     resp.headers['Content-type'] = 'application/json'
     return resp
 
 
+def make_json_stream_response(status_code, data, key, get_tail=None):
+    """Wrap json format to a streamed reponse object.
+
+    :param data: the dict to respond.
+    :param key: the key of the iterable in data whose items are
+                encoded incrementally while the response is sent.
+    :param get_tail: function called after the items are encoded
+                     to get the dict of the entries sent after them.
+    """
+    items = data[key]
+    head = dict([
+        (name, value) for name, value in data.items() if name != key
+    ])
+    if is_pretty():
+        head[key] = list(items)
+        if get_tail:
+            head.update(get_tail())
+
+        return make_json_response(status_code, head)
+
+    def generate():
+        """Generate the json document chunk by chunk."""
+        prefix = dumps(head)[:-1]
+        if head:
+            prefix += ','
+
+        yield '%s%s:[' % (prefix, dumps(key))
+        separator = ''
+        chunk = []
+        for item in items:
+            chunk.append(dumps(item))
+            if len(chunk) >= STREAM_CHUNK_SIZE:
+                yield separator + ','.join(chunk)
+                separator = ','
+                chunk = []
+
+        if chunk:
+            yield separator + ','.join(chunk)
+
+        tail = get_tail() if get_tail else {}
+        if tail:
+            yield '],%s' % dumps(tail)[1:]
+        else:
+            yield ']}'
+
+    return Response(generate(), status_code, mimetype='application/json')
+
+
+def iter_query(get_query, to_dict):
+    """Generate the dicts of the rows of a query as they are fetched.
+
+    :param get_query: function to get the query from the session.
+    :param to_dict: function to get the dict of a row.
+
+    .. note::
+       The query runs in its own read session, which is open until the
+       last row is generated, so it is meant to be consumed by a
+       streamed response after the view function returns.
+    """
+    with database.read_session() as session:
+        for row in get_query(session).yield_per(STREAM_CHUNK_SIZE):
+            yield to_dict(row)
+
+
+def _gzip_chunks(chunks):
+    """Compress the chunks of a streamed response in gzip format."""
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED,
+                                  16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+
+    yield compressor.flush()
+
+
+@app.after_request
+def compress_response(response):
+    """Compress the json response if the client accepts gzip.
+
+    .. note::
+       The responses smaller than API_GZIP_MIN_SIZE bytes are sent as
+       they are. The streamed responses are always compressed, chunk
+       by chunk.
+    """
+    if (response.mimetype != 'application/json' or
+            response.direct_passthrough or
+            'Content-Encoding' in response.headers or
+            not 200 <= response.status_code < 300):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    if 'gzip' not in request.headers.get('Accept-Encoding', '').lower():
+        return response
+
+    if response.is_streamed:
+        response.response = _gzip_chunks(response.iter_encoded())
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < setting.API_GZIP_MIN_SIZE:
+            return response
+
+        response.set_data(''.join(_gzip_chunks([data])))
+
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def make_etag(*parts):
+    """Make the entity tag of a response from the parts it depends on."""
+    return hashlib.md5(repr(parts)).hexdigest()
+
+
+def to_utc(timestamp):
+    """Convert the naive local datetime stored in db to naive UTC.
+
+    The HTTP dates are in GMT, while the timestamps of the models are
+    set by datetime.now() in the local time of the server.
+    """
+    return datetime.utcfromtimestamp(time.mktime(timestamp.timetuple()))
+
+
+def is_not_modified(etag, last_modified=None):
+    """Check if the conditional request matches the current version.
+
+    :param etag: the entity tag of the current version.
+    :param last_modified: local datetime the current version is modified.
+
+    .. note::
+       If-None-Match takes precedence over If-Modified-Since. The
+       entity tags are weak since the same version can be sent
+       compressed or not.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+
+    if last_modified and request.if_modified_since:
+        return to_utc(last_modified) <= request.if_modified_since
+
+    return False
+
+
+def set_cache_validators(resp, etag, last_modified=None):
+    """Set the ETag and Last-Modified headers of the response.
+
+    :param last_modified: local datetime the current version is modified.
+    """
+    resp.set_etag(etag, weak=True)
+    if last_modified:
+        resp.last_modified = to_utc(last_modified)
+
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
+
+
+def make_not_modified_response(etag, last_modified=None):
+    """Make the response telling the client its version is current."""
+    return set_cache_validators(Response(status=304), etag, last_modified)
+
+
+def get_page_size(limit):
+    """Get the number of items in one page of a listing.
+
+    :param limit: the page size requested, 0 means the maximum.
+    """
+    if not limit or limit > setting.API_MAX_PAGE_SIZE:
+        return setting.API_MAX_PAGE_SIZE
+
+    return limit
+
+
+def get_next_link(endpoint, marker, args):
+    """Get the link to the next page of the listing.
+
+    :param args: the query strings of the current page.
+    """
+    args = args.copy()
+    args['marker'] = marker
+    return {
+        'rel': 'next',
+        'href': '%s?%s' % (endpoint, url_encode(args, sort=True))}
+
+
+def make_page_response(key, get_query, id_column, marker, limit,
+                       endpoint, to_dict):
+    """Stream one page of a listing ordered by the id column.
+
+    :param key: the key of the listed items in the response.
+    :param get_query: function to get the query of the listing
+                      from the session.
+    :param id_column: the id column of the listed model.
+    :param marker: the id of the last item of the previous page.
+    :param limit: the number of items in the page.
+    :param endpoint: the endpoint of the listing.
+    :param to_dict: function to get the dict of a listed item.
+
+    .. note::
+       The page is located by the id of the last item seen, so each page
+       is one indexed range scan however deep it is in the listing.
+       The items are encoded while they are fetched, and the link to the
+       next page, if there is one, is sent after them.
+    """
+    args = request.args.copy()
+    next_links = []
+
+    def generate_items():
+        """Generate the dicts of the items in the page."""
+        with database.read_session() as session:
+            query = get_query(session)
+            if marker:
+                query = query.filter(id_column > marker)
+
+            last_id = None
+            for count, item in enumerate(query.order_by(
+                id_column
+            ).limit(limit + 1).yield_per(STREAM_CHUNK_SIZE)):
+                if count == limit:
+                    next_links.append(get_next_link(endpoint, last_id, args))
+                    break
+
+                last_id = item.id
+                yield to_dict(item)
+
+    def get_tail():
+        """Get the link to the next page."""
+        if next_links:
+            return {'link': next_links[0]}
+
+        return {}
+
+    return make_json_stream_response(
+        200, {'status': 'OK', key: generate_items()}, key, get_tail)
+
+
 def add_resource(*args, **kwargs):
     """Add resource"""
     api.add_resource(*args, **kwargs)
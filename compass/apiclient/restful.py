@@ -5,6 +5,7 @@
 import logging
 import json
 import requests
+import urlparse
 
 
 class Client(object):
@@ -94,7 +95,41 @@ class Client(object):
         url = '%s%s' % (self.url_, relative_url)
         return self._get_response(self.session_.delete(url))
 
-    def get_switches(self, switch_ips=None, switch_networks=None, limit=None):
+    @classmethod
+    def _get_next_marker(cls, resp):
+        """get the marker of the next page from a listing response."""
+        link = resp.get('link')
+        if not link or link.get('rel') != 'next':
+            return None
+
+        query = urlparse.parse_qs(urlparse.urlparse(link['href']).query)
+        return query.get('marker', [None])[0]
+
+    def _iter_pages(self, get_page, key):
+        """iterate the items of a listing page by page.
+
+        :param get_page: callable to get the page after the marker.
+        :param key: the key of the items in the listing response.
+
+        :raises: RuntimeError if a page fails.
+        """
+        marker = None
+        while True:
+            status, resp = get_page(marker)
+            if status != 200:
+                raise RuntimeError(
+                    'failed to get %s after marker %s: %s %s' % (
+                        key, marker, status, resp))
+
+            for item in resp.get(key, []):
+                yield item
+
+            marker = self._get_next_marker(resp)
+            if not marker:
+                return
+
+    def get_switches(self, switch_ips=None, switch_networks=None, limit=None,
+                     marker=None):
         """List details for switches.
 
         .. note::
@@ -107,7 +142,9 @@ class Client(object):
         :param switch_networks: Filter switche(es) with network(s).
         :type switch_networks: list of str. Each is as 'xxx.xxx.xxx.xxx/xx'.
         :param limit: int, The maximum number of switches to return.
-        :type limit: int. 0 means unlimited.
+        :type limit: int. 0 means the maximum page size of the server.
+        :param marker: return the switches after the switch id.
+        :type marker: int.
         """
         params = {}
         if switch_ips:
@@ -118,8 +155,25 @@ class Client(object):
 
         if limit:
             params['limit'] = limit
+
+        if marker:
+            params['marker'] = marker
         return self._get('/api/switches', params=params)
 
+    def iter_switches(self, switch_ips=None, switch_networks=None,
+                      page_size=None):
+        """Iterate the switches, fetching one page at a time.
+
+        See :meth:`get_switches` for the filters.
+
+        :param page_size: the number of switches in a page.
+        :type page_size: int.
+        """
+        return self._iter_pages(
+            lambda marker: self.get_switches(
+                switch_ips, switch_networks, page_size, marker),
+            'switches')
+
     def get_switch(self, switch_id):
         """Lists details for a specified switch.
 
@@ -166,6 +220,20 @@ class Client(object):
 
         return self._post('/api/switches', data=data)
 
+    def add_switches(self, switches):
+        """Create a batch of switches in one request.
+
+        .. note::
+           The first polls of the created switches are scheduled
+           in rate limited batches.
+
+        :param switches: the switches to create.
+        :type switches: list of dict of ip and credential.
+
+        :returns: the result of each switch in the switches list.
+        """
+        return self._post('/api/switches/batch', data={'switches': switches})
+
     def update_switch(self, switch_id, ip_addr=None,
                       version=None, community=None,
                       username=None, password=None):
@@ -213,7 +281,7 @@ class Client(object):
         return self._delete('api/switches/%s' % switch_id)
 
     def get_machines(self, switch_id=None, vlan_id=None,
-                     port=None, limit=None):
+                     port=None, limit=None, marker=None):
         """Get the details of machines.
 
         .. note::
@@ -228,7 +296,9 @@ class Client(object):
         :param port: Return machine(s) connect to the port.
         :type port: int.
         :param limit: the maximum number of machines will be returned.
-        :type limit: int. 0 means no limit.
+        :type limit: int. 0 means the maximum page size of the server.
+        :param marker: return the machines after the machine id.
+        :type marker: int.
         """
         params = {}
         if switch_id:
@@ -243,8 +313,25 @@ class Client(object):
         if limit:
             params['limit'] = limit
 
+        if marker:
+            params['marker'] = marker
+
         return self._get('/api/machines', params=params)
 
+    def iter_machines(self, switch_id=None, vlan_id=None,
+                      port=None, page_size=None):
+        """Iterate the machines, fetching one page at a time.
+
+        See :meth:`get_machines` for the filters.
+
+        :param page_size: the number of machines in a page.
+        :type page_size: int.
+        """
+        return self._iter_pages(
+            lambda marker: self.get_machines(
+                switch_id, vlan_id, port, page_size, marker),
+            'machines')
+
     def get_machine(self, machine_id):
         """Lists the details for a specified machine.
 
@@ -253,10 +340,42 @@ class Client(object):
         """
         return self._get('/api/machines/%s' % machine_id)
 
-    def get_clusters(self):
+    def get_clusters(self, limit=None, marker=None, include_progress=False):
         """Lists the details for all clusters.
+
+        :param limit: the maximum number of clusters will be returned.
+        :type limit: int. 0 means the maximum page size of the server.
+        :param marker: return the clusters after the cluster id.
+        :type marker: int.
+        :param include_progress: return the installing progress of
+                                 each cluster as well.
+        :type include_progress: bool.
+        """
+        params = {}
+        if limit:
+            params['limit'] = limit
+
+        if marker:
+            params['marker'] = marker
+
+        if include_progress:
+            params['include'] = 'progress'
+
+        return self._get('/api/clusters', params=params)
+
+    def iter_clusters(self, page_size=None, include_progress=False):
+        """Iterate the clusters, fetching one page at a time.
+
+        :param page_size: the number of clusters in a page.
+        :type page_size: int.
+        :param include_progress: iterate the installing progress of
+                                 each cluster as well.
+        :type include_progress: bool.
         """
-        return self._get('/api/clusters')
+        return self._iter_pages(
+            lambda marker: self.get_clusters(
+                page_size, marker, include_progress),
+            'clusters')
 
     def get_cluster(self, cluster_id):
         """Lists the details of the specified cluster.
@@ -442,7 +561,8 @@ class Client(object):
         data['partition'] = self.parse_partition(kwargs)
         return self._put('/api/clusters/%s/partition' % cluster_id, data=data)
 
-    def get_hosts(self, hostname=None, clustername=None):
+    def get_hosts(self, hostname=None, clustername=None,
+                  limit=None, marker=None):
         """Lists the details of hosts.
 
         .. note::
@@ -454,6 +574,10 @@ class Client(object):
         :type hostname: str.
         :param clustername: The name of a cluster.
         :type clustername: str.
+        :param limit: the maximum number of hosts will be returned.
+        :type limit: int. 0 means the maximum page size of the server.
+        :param marker: return the hosts after the host id.
+        :type marker: int.
         """
         params = {}
         if hostname:
@@ -462,8 +586,27 @@ class Client(object):
         if clustername:
             params['clustername'] = clustername
 
+        if limit:
+            params['limit'] = limit
+
+        if marker:
+            params['marker'] = marker
+
         return self._get('/api/clusterhosts', params=params)
 
+    def iter_hosts(self, hostname=None, clustername=None, page_size=None):
+        """Iterate the hosts, fetching one page at a time.
+
+        See :meth:`get_hosts` for the filters.
+
+        :param page_size: the number of hosts in a page.
+        :type page_size: int.
+        """
+        return self._iter_pages(
+            lambda marker: self.get_hosts(
+                hostname, clustername, page_size, marker),
+            'cluster_hosts')
+
     def get_host(self, host_id):
         """Lists the details for the specified host.
 
@@ -599,6 +742,79 @@ class Client(object):
 
         return self._get('/api/clusters/%s/progress' % cluster_id)
 
+    def get_cluster_hosts_installing_progress(self, cluster_id):
+        """Lists the installing progress of all hosts in a cluster.
+
+        :param cluster_id: cluster id.
+        :type cluster_id: int.
+        """
+        return self._get('/api/clusters/%s/hosts/progress' % cluster_id)
+
+    def iter_cluster_installing_progress(self, cluster_id,
+                                         last_event_id=None, timeout=None):
+        """Iterate the progress changes of a cluster and its hosts.
+
+        .. note::
+           The changes are read from the server-sent events stream of
+           the cluster. The iteration ends when the stream times out,
+           call it again with the last event id to resume. A resumed
+           stream may send again the progresses updated shortly before
+           the last event.
+
+        :param cluster_id: cluster id.
+        :type cluster_id: int.
+        :param last_event_id: resume after the event with the id.
+        :type last_event_id: str.
+        :param timeout: the seconds the server keeps the stream open.
+        :type timeout: int.
+
+        :returns: generator of (event id, event name, data as dict).
+        """
+        url = '%s/api/clusters/%s/progress/stream' % (self.url_, cluster_id)
+        headers = {}
+        if last_event_id:
+            headers['Last-Event-ID'] = last_event_id
+
+        params = {}
+        if timeout is not None:
+            params['timeout'] = timeout
+
+        resp = self.session_.get(url, params=params, headers=headers,
+                                 stream=True)
+        if resp.status_code != 200:
+            raise RuntimeError(
+                'failed to stream progress of cluster %s: %s %s' % (
+                    cluster_id, resp.status_code, resp.content))
+
+        event_id, event, data = None, None, []
+        for line in resp.iter_lines():
+            if line:
+                name, _, value = line.partition(':')
+                value = value[1:] if value.startswith(' ') else value
+                if name == 'id':
+                    event_id = value
+                elif name == 'event':
+                    event = value
+                elif name == 'data':
+                    data.append(value)
+
+                continue
+
+            if data:
+                yield event_id, event, json.loads('\n'.join(data))
+
+            event, data = None, []
+
+    def update_hosts_installing_progress(self, progresses):
+        """Reports installing progresses of hosts in one request.
+
+        :param progresses: progress of each host.
+        :type progresses: list of dict with keys hostname, progress,
+                          message, severity and checkpoint.
+        """
+        return self._post('/api/clusterhosts/progress',
+                          data={'progresses': progresses})
+
     def get_dashboard_links(self, cluster_id):
         """Lists links for dashboards of deployed cluster.
 
@@ -0,0 +1,150 @@
+"""Module to cache the adapter and role catalog in process.
+
+   The catalog only changes when the adapters and roles are synced from
+   the installers, so it is loaded once and kept in memory. Each change
+   of the Adapter or Role rows increases the version of the catalog in
+   the catalog_version table in the same transaction, and the cache is
+   reloaded when the version it is loaded at is not the current one,
+   so all the processes see a sync as soon as it is committed.
+"""
+import logging
+import threading
+
+from sqlalchemy import event
+
+from compass.db import database
+from compass.db.model import Adapter, CatalogVersion, Role
+
+
+ADAPTER_CATALOG_NAME = 'adapter'
+
+
+def bump_version(connection, name=ADAPTER_CATALOG_NAME):
+    """Increase the version of the catalog.
+
+    :param connection: the connection or session of the transaction
+                       changing the catalog.
+    :param name: the catalog name.
+    """
+    table = CatalogVersion.__table__
+    result = connection.execute(table.update().where(
+        table.c.name == name
+    ).values(version=table.c.version + 1))
+    if not result.rowcount:
+        connection.execute(table.insert().values(name=name, version=1))
+
+
+def _bump_adapter_version(mapper, connection, target):
+    """Increase the adapter catalog version when a row is changed."""
+    bump_version(connection)
+
+
+for _model in [Adapter, Role]:
+    for _event in ['after_insert', 'after_update', 'after_delete']:
+        event.listen(_model, _event, _bump_adapter_version)
+
+
+class AdapterCatalog(object):
+    """In process cache of the adapters and their roles."""
+
+    def __init__(self):
+        self.lock_ = threading.Lock()
+        # (engine, version, catalog) replaced as a whole, so it is
+        # read consistently without the lock.
+        self.loaded_ = (None, None, ([], {}))
+
+    def __str__(self):
+        _, version, (adapters, _) = self.loaded_
+        return '%s[version: %s, adapters: %s]' % (
+            self.__class__.__name__, version, len(adapters))
+
+    def _get_version(self, session):
+        """Get (engine, version) of the catalog in the session."""
+        version = session.query(CatalogVersion.version).filter_by(
+            name=ADAPTER_CATALOG_NAME).scalar() or 0
+        return session.get_bind(), version
+
+    def _load(self, session):
+        """Load the catalog in the session if its version is changed."""
+        engine, version = self._get_version(session)
+        if self.loaded_[:2] == (engine, version):
+            return
+
+        adapters = []
+        for adapter in session.query(Adapter).order_by(Adapter.id):
+            adapters.append({
+                'id': adapter.id,
+                'name': adapter.name,
+                'os': adapter.os,
+                'target_system': adapter.target_system})
+
+        roles = {}
+        for role in session.query(Role).order_by(Role.id):
+            roles.setdefault(role.target_system, []).append({
+                'name': role.name,
+                'description': role.description})
+
+        self.loaded_ = (engine, version, (adapters, roles))
+        logging.info('%s is loaded', self)
+
+    def refresh(self):
+        """Reload the catalog if it is changed since it is loaded.
+
+        :returns: (adapters, roles) where adapters is a list of dict of
+                  id, name, os and target_system ordered by id, and
+                  roles is a dict of target_system to list of dict of
+                  name and description.
+
+        .. note::
+           The function should be called out of the database session
+           scope. Only the catalog version is queried if it is current,
+           without the lock, so the readers are not serialized. The lock
+           is only taken to reload a changed catalog, and the version is
+           checked again under the lock, so it is loaded once.
+           The returned catalog is shared, it should not be modified.
+        """
+        with database.read_session() as session:
+            engine_version = self._get_version(session)
+
+        loaded = self.loaded_
+        if loaded[:2] == engine_version:
+            return loaded[2]
+
+        with self.lock_:
+            with database.read_session() as session:
+                self._load(session)
+
+            return self.loaded_[2]
+
+    def get_adapters(self, name=None):
+        """Get the adapters, optionally filtered by the adapter name."""
+        adapters, _ = self.refresh()
+        return [
+            adapter for adapter in adapters
+            if name is None or adapter['name'] == name
+        ]
+
+    def get_adapter(self, adapter_id):
+        """Get the adapter by id, None if it does not exist."""
+        adapters, _ = self.refresh()
+        for adapter in adapters:
+            if adapter['id'] == adapter_id:
+                return adapter
+
+        return None
+
+    def get_roles(self, adapter_id):
+        """Get the roles of the adapter target system.
+
+        :returns: list of dict of name and description, or None if the
+                  adapter does not exist.
+        """
+        adapters, roles = self.refresh()
+        for adapter in adapters:
+            if adapter['id'] == adapter_id:
+                return roles.get(adapter['target_system'], [])
+
+        return None
+
+
+ADAPTER_CATALOG = AdapterCatalog()
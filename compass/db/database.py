@@ -1,32 +1,230 @@
 """Provider interface to manipulate database."""
 import logging
+import time
 from threading import local
 
 from contextlib import contextmanager
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine.url import make_url
 from sqlalchemy.orm import scoped_session, sessionmaker
 
 from compass.utils import setting_wrapper as setting
 from compass.db import model
 
 
-ENGINE = create_engine(setting.SQLALCHEMY_DATABASE_URI, convert_unicode=True)
+def get_engine_options(database_url):
+    """Get the create_engine options of the database url.
+
+    :param database_url: string, database url.
+
+    :returns: dict of keyword arguments to create_engine.
+
+    .. note::
+       The connection pool options only apply to the server backends,
+       e.g. mysql or postgresql. SQLite uses the default pool of
+       the sqlite dialect and waits up to SQLITE_BUSY_TIMEOUT seconds
+       when the database is locked.
+    """
+    options = {'convert_unicode': True}
+    url = make_url(database_url)
+    if url.drivername.startswith('sqlite'):
+        options['connect_args'] = {'timeout': setting.SQLITE_BUSY_TIMEOUT}
+        return options
+
+    options.update({
+        'pool_size': setting.SQLALCHEMY_POOL_SIZE,
+        'max_overflow': setting.SQLALCHEMY_MAX_OVERFLOW,
+        'pool_timeout': setting.SQLALCHEMY_POOL_TIMEOUT,
+        'pool_recycle': setting.SQLALCHEMY_POOL_RECYCLE,
+    })
+    if url.drivername.startswith('mysql'):
+        options['connect_args'] = {'charset': 'utf8'}
+
+    return options
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Set the journal and locking pragmas of a new sqlite connection."""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('PRAGMA journal_mode=%s' % setting.SQLITE_JOURNAL_MODE)
+        cursor.execute('PRAGMA synchronous=%s' % setting.SQLITE_SYNCHRONOUS)
+        cursor.execute('PRAGMA busy_timeout=%d' % (
+            setting.SQLITE_BUSY_TIMEOUT * 1000))
+    finally:
+        cursor.close()
+
+
+def _ping_connection(dbapi_connection, connection_record, connection_proxy):
+    """Check the pooled connection is alive before it is used.
+
+    .. note::
+       The pool retries with a new connection when DisconnectionError
+       is raised, so stale connections dropped by the database server
+       are not returned to the caller.
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('SELECT 1')
+    except Exception as error:
+        logging.info('pooled connection is disconnected: %s', error)
+        raise exc.DisconnectionError()
+    finally:
+        cursor.close()
+
+
+SLOW_QUERY_LOGGER = logging.getLogger('compass.db.slow_query')
+STATS_HOLDER = local()
+
+
+class QueryStats(object):
+    """Statements executed in the scope of an api request or a task."""
+
+    def __init__(self, name):
+        self.name_ = name
+        self.count_ = 0
+        self.duration_ = 0.0
+
+    def __str__(self):
+        return '%s[name: %s, count: %s, duration: %.3fs]' % (
+            self.__class__.__name__, self.name_,
+            self.count_, self.duration_)
+
+    def add(self, duration):
+        """Record one executed statement."""
+        self.count_ += 1
+        self.duration_ += duration
+
+
+def start_query_stats(name):
+    """Start counting the statements executed in the current thread.
+
+    :param name: the name of the request or task to count for.
+
+    :returns: :class:`QueryStats`
+
+    .. note::
+       The counting scopes can be nested, a statement is counted in
+       all the scopes it is executed in.
+    """
+    stats = QueryStats(name)
+    if not hasattr(STATS_HOLDER, 'stats'):
+        STATS_HOLDER.stats = []
+
+    STATS_HOLDER.stats.append(stats)
+    return stats
+
+
+def stop_query_stats():
+    """Stop the innermost statements counting of the current thread.
+
+    :returns: :class:`QueryStats` or None if it is not counting.
+    """
+    if not getattr(STATS_HOLDER, 'stats', None):
+        logging.error('statements are not counted in this thread')
+        return None
+
+    stats = STATS_HOLDER.stats.pop()
+    logging.debug('%s', stats)
+    return stats
+
+
+@contextmanager
+def query_stats(name):
+    """Count the statements executed in the scope.
+
+    :param name: the name of the request or task to count for.
+    """
+    stats = start_query_stats(name)
+    try:
+        yield stats
+    finally:
+        stop_query_stats()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters,
+                           context, executemany):
+    """Record the start time of the statement."""
+    conn.info.setdefault('query_start_time', []).append(time.time())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters,
+                          context, executemany):
+    """Count the statement and log it if it is slow."""
+    start_times = conn.info.get('query_start_time')
+    if not start_times:
+        return
+
+    duration = time.time() - start_times.pop()
+    for stats in getattr(STATS_HOLDER, 'stats', []):
+        stats.add(duration)
+
+    if (setting.SLOW_QUERY_THRESHOLD > 0 and
+            duration >= setting.SLOW_QUERY_THRESHOLD):
+        SLOW_QUERY_LOGGER.warning('slow query took %.3fs: %s %r',
+                                  duration, statement, parameters)
+
+
+def _drop_query_start_time(conn, cursor, statement, parameters,
+                           context, exception):
+    """Drop the start time of the failed statement."""
+    start_times = conn.info.get('query_start_time')
+    if start_times:
+        start_times.pop()
+
+
+def create_db_engine(database_url):
+    """Create the database engine of the database url.
+
+    :param database_url: string, database url.
+    """
+    engine = create_engine(database_url, **get_engine_options(database_url))
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', _set_sqlite_pragmas)
+    elif setting.SQLALCHEMY_POOL_PRE_PING:
+        event.listen(engine.pool, 'checkout', _ping_connection)
+
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'dbapi_error', _drop_query_start_time)
+    return engine
+
+
+ENGINE = create_db_engine(setting.SQLALCHEMY_DATABASE_URI)
 SESSION = sessionmaker(autocommit=False, autoflush=False)
 SESSION.configure(bind=ENGINE)
 SCOPED_SESSION = scoped_session(SESSION)
+if setting.SQLALCHEMY_READ_DATABASE_URI:
+    READ_ENGINE = create_db_engine(setting.SQLALCHEMY_READ_DATABASE_URI)
+else:
+    READ_ENGINE = ENGINE
+READ_SESSION = sessionmaker(autocommit=False, autoflush=False)
+READ_SESSION.configure(bind=READ_ENGINE)
+READ_SCOPED_SESSION = scoped_session(READ_SESSION)
 SESSION_HOLDER = local()
 
 
-def init(database_url):
+def init(database_url, read_database_url=None):
     """Initialize database.
 
     :param database_url: string, database url.
+    :param read_database_url: string, database url of the read replica
+                              used by :func:`read_session`. The read
+                              sessions use database_url if it is None.
     """
     global ENGINE
     global SCOPED_SESSION
-    ENGINE = create_engine(database_url, convert_unicode=True)
+    global READ_ENGINE
+    global READ_SCOPED_SESSION
+    ENGINE = create_db_engine(database_url)
     SESSION.configure(bind=ENGINE)
     SCOPED_SESSION = scoped_session(SESSION)
+    if read_database_url:
+        READ_ENGINE = create_db_engine(read_database_url)
+    else:
+        READ_ENGINE = ENGINE
+    READ_SESSION.configure(bind=READ_ENGINE)
+    READ_SCOPED_SESSION = scoped_session(READ_SESSION)
 
 
 @contextmanager
@@ -55,6 +253,45 @@ def session():
         del SESSION_HOLDER.session
 
 
+@contextmanager
+def read_session():
+    """
+    read only database session scope. The session does not flush or
+    commit, and its transaction is rolled back on exit. It is bound to
+    the read replica if there is one, so the changes just committed
+    may not be visible yet.
+
+    .. note::
+       If it is called in another session scope, the outer session is
+       used and left open.
+    """
+    if hasattr(SESSION_HOLDER, 'session'):
+        yield SESSION_HOLDER.session
+        return
+
+    new_session = READ_SCOPED_SESSION()
+    try:
+        SESSION_HOLDER.session = new_session
+        yield new_session
+    finally:
+        new_session.rollback()
+        new_session.close()
+        READ_SCOPED_SESSION.remove()
+        del SESSION_HOLDER.session
+
+
+# the maximum number of values in one IN clause, below the default
+# SQLITE_MAX_VARIABLE_NUMBER of sqlite.
+IN_CHUNK_SIZE = 500
+
+
+def in_chunks(items):
+    """Split items into lists small enough for one IN clause."""
+    items = list(items)
+    for offset in range(0, len(items), IN_CHUNK_SIZE):
+        yield items[offset:offset + IN_CHUNK_SIZE]
+
+
 def current_session():
     """Get the current session scope when it is called.
 
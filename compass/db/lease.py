@@ -0,0 +1,279 @@
+"""Module to share the work of a daemon among its running instances.
+
+   Each daemon instance keeps a row in the daemon_lease table alive by
+   heartbeats. The live instances of the same daemon are ordered by their
+   owner identities, and an instance owns the items whose id modulo the
+   number of live instances is its index. When an instance stops
+   heartbeating, its row expires and its share is rebalanced to the
+   remaining instances at their next heartbeats.
+
+   While the instances join or leave, they may not agree yet on the
+   number of live instances, so their shares may overlap. An instance
+   therefore only works on the items of its share it has claimed in the
+   daemon_claim table. A claim is taken by a conditional update, which
+   only succeeds if the item is not claimed by another live instance,
+   so an item is never worked on by two instances at the same time.
+
+   The heartbeat and claim timestamps are taken from the database clock,
+   so the clocks of the nodes running the daemons do not need to agree.
+"""
+import logging
+import os
+import socket
+import time
+
+from datetime import timedelta
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+
+from compass.db import database
+from compass.db.model import DaemonClaim, DaemonLease
+
+
+def get_default_owner():
+    """Get the identity of the current daemon instance."""
+    return '%s:%s' % (socket.gethostname(), os.getpid())
+
+
+def get_database_now(session):
+    """Get the current time of the database clock."""
+    return session.query(func.now()).scalar()
+
+
+class WorkLease(object):
+    """Lease of the share of work of one daemon instance."""
+
+    def __init__(self, daemon, expire_seconds, owner=None):
+        """Constructor
+
+        :param daemon: the daemon name.
+        :type daemon: str
+        :param expire_seconds: seconds after the last heartbeat that
+                               the instance is considered dead.
+        :type expire_seconds: int
+        :param owner: the identity of the instance.
+                      Default is hostname:pid.
+        :type owner: str
+        """
+        self.daemon_ = daemon
+        self.expire_seconds_ = expire_seconds
+        self.owner_ = owner or get_default_owner()
+        self.index_ = None
+        self.count_ = 0
+        self.heartbeat_time_ = None
+
+    def __str__(self):
+        return '%s[daemon: %s, owner: %s, share: %s/%s]' % (
+            self.__class__.__name__, self.daemon_, self.owner_,
+            self.index_, self.count_)
+
+    def check_interval(self, interval):
+        """Check the daemon heartbeats often enough to keep its lease.
+
+        :param interval: the seconds the daemon sleeps between two runs.
+
+        :raises: ValueError if the interval is more than half of
+                 expire_seconds, which leaves too little time for the
+                 run itself to heartbeat before the lease expires.
+        """
+        if interval * 2 > self.expire_seconds_:
+            raise ValueError(
+                '%s restriction is not met: interval(%s) * 2 '
+                '<= expire_seconds(%s)' % (
+                    self, interval, self.expire_seconds_))
+
+    def heartbeat(self, now=None):
+        """Renew the lease and refresh the share of the instance.
+
+        :param now: the heartbeat time. Default is the database time.
+
+        :returns: (index, count) of the instance among the live instances.
+
+        .. note::
+           The function should be called out of the database session
+           scope, and more often than expire_seconds. The claims of the
+           instance are renewed too.
+        """
+        with database.session() as session:
+            if now is None:
+                now = get_database_now(session)
+
+            expire_time = now - timedelta(seconds=self.expire_seconds_)
+            expired = session.query(DaemonLease).filter(
+                DaemonLease.daemon == self.daemon_,
+                DaemonLease.owner != self.owner_,
+                DaemonLease.heartbeat_timestamp < expire_time
+            ).delete(synchronize_session=False)
+            if expired:
+                logging.info('%s expired %s dead instances', self, expired)
+
+            renewed = session.query(DaemonLease).filter_by(
+                daemon=self.daemon_, owner=self.owner_
+            ).update({'heartbeat_timestamp': now},
+                     synchronize_session=False)
+            if not renewed:
+                session.add(DaemonLease(daemon=self.daemon_,
+                                        owner=self.owner_,
+                                        heartbeat_timestamp=now))
+                session.flush()
+
+            session.query(DaemonClaim).filter(
+                DaemonClaim.daemon == self.daemon_,
+                DaemonClaim.owner != self.owner_,
+                DaemonClaim.claim_timestamp < expire_time
+            ).delete(synchronize_session=False)
+            session.query(DaemonClaim).filter_by(
+                daemon=self.daemon_, owner=self.owner_
+            ).update({'claim_timestamp': now},
+                     synchronize_session=False)
+
+            owners = [
+                owner for owner, in session.query(
+                    DaemonLease.owner
+                ).filter_by(
+                    daemon=self.daemon_
+                ).order_by(DaemonLease.owner)
+            ]
+
+        index = owners.index(self.owner_)
+        if (index, len(owners)) != (self.index_, self.count_):
+            logging.info('%s share is rebalanced to %s/%s among %s',
+                         self, index, len(owners), owners)
+
+        self.index_ = index
+        self.count_ = len(owners)
+        self.heartbeat_time_ = time.time()
+        return self.index_, self.count_
+
+    def heartbeat_if_due(self):
+        """Heartbeat if the last one is a third of expire_seconds ago.
+
+        It is called inside the long runs of the daemon, so the lease
+        and the claims do not expire while the run is not finished.
+
+        :returns: True if the heartbeat is sent.
+        """
+        if (self.heartbeat_time_ is not None and
+                time.time() - self.heartbeat_time_ <
+                self.expire_seconds_ / 3.0):
+            return False
+
+        try:
+            self.heartbeat()
+        except Exception as error:
+            logging.error('failed to renew the lease %s', self)
+            logging.exception(error)
+            return False
+
+        return True
+
+    def owns(self, itemid):
+        """Check if the item is in the share of the instance."""
+        if not self.count_:
+            return False
+
+        return itemid % self.count_ == self.index_
+
+    def filter(self, itemids):
+        """Get the items in the share of the instance."""
+        return [itemid for itemid in itemids if self.owns(itemid)]
+
+    def claim(self, itemids, now=None):
+        """Claim the items in the share of the instance.
+
+        :param itemids: the items to share with the other instances.
+        :param now: the claim time. Default is the database time.
+
+        :returns: the items in the share claimed by the instance, in
+                  the order of itemids.
+
+        .. note::
+           The function should be called out of the database session
+           scope, after :meth:`heartbeat`. The items the instance
+           claimed before which are not in its share anymore are
+           released, so their new owner claims them at its next run.
+        """
+        share = self.filter(itemids)
+        with database.session() as session:
+            if now is None:
+                now = get_database_now(session)
+
+            claimed = set([
+                item_id for item_id, in session.query(
+                    DaemonClaim.item_id
+                ).filter_by(daemon=self.daemon_, owner=self.owner_)
+            ])
+            existing = set()
+            for chunk in database.in_chunks(share):
+                existing.update([
+                    item_id for item_id, in session.query(
+                        DaemonClaim.item_id
+                    ).filter(
+                        DaemonClaim.daemon == self.daemon_,
+                        DaemonClaim.item_id.in_(chunk))
+                ])
+
+        missing = [itemid for itemid in share if itemid not in existing]
+        if missing:
+            try:
+                with database.session() as session:
+                    session.execute(DaemonClaim.__table__.insert(), [
+                        {'daemon': self.daemon_, 'item_id': itemid,
+                         'owner': self.owner_, 'claim_timestamp': now}
+                        for itemid in missing
+                    ])
+            except IntegrityError:
+                logging.info('%s items %s are claimed by another instance',
+                             self, missing)
+
+        released = list(claimed - set(share))
+        expire_time = now - timedelta(seconds=self.expire_seconds_)
+        with database.session() as session:
+            for chunk in database.in_chunks(released):
+                session.query(DaemonClaim).filter(
+                    DaemonClaim.daemon == self.daemon_,
+                    DaemonClaim.owner == self.owner_,
+                    DaemonClaim.item_id.in_(chunk)
+                ).delete(synchronize_session=False)
+
+            claimed = set()
+            for chunk in database.in_chunks(share):
+                session.query(DaemonClaim).filter(
+                    DaemonClaim.daemon == self.daemon_,
+                    DaemonClaim.item_id.in_(chunk),
+                    or_(DaemonClaim.owner == self.owner_,
+                        DaemonClaim.owner == None,
+                        DaemonClaim.claim_timestamp < expire_time)
+                ).update({'owner': self.owner_, 'claim_timestamp': now},
+                         synchronize_session=False)
+                claimed.update([
+                    item_id for item_id, in session.query(
+                        DaemonClaim.item_id
+                    ).filter(
+                        DaemonClaim.daemon == self.daemon_,
+                        DaemonClaim.owner == self.owner_,
+                        DaemonClaim.item_id.in_(chunk))
+                ])
+
+        if released:
+            logging.info('%s released items %s', self, sorted(released))
+
+        if len(claimed) < len(share):
+            logging.info('%s items %s are still claimed by other instances',
+                         self, sorted(set(share) - claimed))
+
+        return [itemid for itemid in share if itemid in claimed]
+
+    def release(self):
+        """Release the lease so the share is rebalanced immediately."""
+        with database.session() as session:
+            session.query(DaemonLease).filter_by(
+                daemon=self.daemon_, owner=self.owner_
+            ).delete(synchronize_session=False)
+            session.query(DaemonClaim).filter_by(
+                daemon=self.daemon_, owner=self.owner_
+            ).delete(synchronize_session=False)
+
+        self.index_ = None
+        self.count_ = 0
+        self.heartbeat_time_ = None
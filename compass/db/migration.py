@@ -0,0 +1,195 @@
+"""Module to apply versioned schema migrations to the database.
+
+   Each migration has a version, a description and an upgrade function
+   taking the database connection. The applied versions are recorded in
+   the schema_version table. A database created by :func:`create_db` is
+   stamped with the latest version. A database created before the
+   schema_version table existed is treated as version 1.
+
+   To change compass/db/model.py, update the model and append a migration
+   which brings an existing database to the same schema.
+"""
+import logging
+
+from sqlalchemy import select
+from sqlalchemy.engine import reflection
+
+from compass.db import database
+from compass.db import model
+from compass.db.model import SchemaVersion
+
+
+def _create_tables(connection):
+    """Create the tables of the initial schema."""
+    for table in [
+        model.Switch, model.Machine, model.HostState, model.ClusterState,
+        model.Cluster, model.ClusterHost, model.LogProgressingHistory,
+        model.Adapter, model.Role
+    ]:
+        table.__table__.create(bind=connection, checkfirst=True)
+
+
+def _create_daemon_lease(connection):
+    """Create the daemon_lease table."""
+    model.DaemonLease.__table__.create(bind=connection, checkfirst=True)
+
+
+def _create_indexes(connection):
+    """Create the indexes of the hot query paths."""
+    inspector = reflection.Inspector.from_engine(connection)
+    for table in [
+        model.Machine, model.ClusterHost, model.HostState, model.ClusterState
+    ]:
+        table_name = table.__tablename__
+        index_names = [
+            index['name'] for index in inspector.get_indexes(table_name)
+        ]
+        for index in table.__table__.indexes:
+            if index.name not in index_names:
+                logging.info('create index %s on %s', index.name, table_name)
+                index.create(bind=connection)
+
+
+def _add_switch_ip_int(connection):
+    """Add the integer ip column to the switch table and fill it."""
+    inspector = reflection.Inspector.from_engine(connection)
+    columns = [
+        column['name'] for column in inspector.get_columns('switch')
+    ]
+    if 'ip_int' not in columns:
+        logging.info('add column ip_int to switch')
+        connection.execute('ALTER TABLE switch ADD COLUMN ip_int BIGINT')
+
+    switch_table = model.Switch.__table__
+    for switch_id, ip_addr in connection.execute(
+        select([switch_table.c.id, switch_table.c.ip]).where(
+            switch_table.c.ip_int == None)
+    ).fetchall():
+        connection.execute(switch_table.update().where(
+            switch_table.c.id == switch_id
+        ).values(ip_int=model.get_ip_int(ip_addr)))
+
+    index_names = [
+        index['name'] for index in inspector.get_indexes('switch')
+    ]
+    for index in switch_table.indexes:
+        if index.name not in index_names:
+            logging.info('create index %s on switch', index.name)
+            index.create(bind=connection)
+
+
+def _create_catalog_version(connection):
+    """Create the catalog_version table."""
+    model.CatalogVersion.__table__.create(bind=connection, checkfirst=True)
+
+
+def _create_daemon_claim(connection):
+    """Create the daemon_claim table."""
+    model.DaemonClaim.__table__.create(bind=connection, checkfirst=True)
+
+
+MIGRATIONS = [
+    (1, 'create the initial tables', _create_tables),
+    (2, 'add daemon_lease table', _create_daemon_lease),
+    (3, 'add indexes of the hot query paths', _create_indexes),
+    (4, 'add integer ip of the switches', _add_switch_ip_int),
+    (5, 'add catalog_version table', _create_catalog_version),
+    (6, 'add daemon_claim table', _create_daemon_claim),
+]
+
+
+def get_latest_version():
+    """Get the version of the latest migration."""
+    return MIGRATIONS[-1][0]
+
+
+def get_version():
+    """Get the schema version of the database.
+
+    :returns: int, 0 if the database is empty.
+    """
+    tables = reflection.Inspector.from_engine(
+        database.ENGINE).get_table_names()
+    if SchemaVersion.__tablename__ not in tables:
+        if model.Switch.__tablename__ in tables:
+            return 1
+
+        return 0
+
+    with database.session() as session:
+        versions = [
+            version for version, in session.query(SchemaVersion.version)
+        ]
+
+    if not versions:
+        return 0
+
+    return max(versions)
+
+
+def stamp(version=None):
+    """Record the database is at the version without migrating it.
+
+    :param version: the version to stamp, default is the latest version.
+    """
+    if version is None:
+        version = get_latest_version()
+
+    SchemaVersion.__table__.create(bind=database.ENGINE, checkfirst=True)
+    with database.session() as session:
+        for migration_version, description, _ in MIGRATIONS:
+            if migration_version > version:
+                break
+
+            if not session.query(SchemaVersion).filter_by(
+                version=migration_version
+            ).first():
+                session.add(SchemaVersion(version=migration_version,
+                                          description=description))
+
+
+def upgrade(version=None):
+    """Apply the pending migrations to the database.
+
+    :param version: the version to upgrade to, default is the latest.
+
+    :returns: list of the applied versions.
+
+    .. note::
+       Each migration is applied in its own transaction together with
+       the record of its version, so a failed migration is retried on
+       the next upgrade.
+    """
+    if version is None:
+        version = get_latest_version()
+
+    current_version = get_version()
+    if current_version:
+        stamp(current_version)
+    else:
+        SchemaVersion.__table__.create(bind=database.ENGINE, checkfirst=True)
+
+    applied = []
+    for migration_version, description, migrate in MIGRATIONS:
+        if migration_version <= current_version:
+            continue
+
+        if migration_version > version:
+            break
+
+        logging.info('apply migration %s: %s',
+                     migration_version, description)
+        with database.ENGINE.begin() as connection:
+            migrate(connection)
+            connection.execute(SchemaVersion.__table__.insert().values(
+                version=migration_version, description=description))
+
+        applied.append(migration_version)
+
+    return applied
+
+
+def create_db():
+    """Create all the tables and stamp the latest version."""
+    database.create_db()
+    stamp()
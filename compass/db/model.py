@@ -1,24 +1,139 @@
 """database model."""
 from datetime import datetime
+import base64
 import simplejson as json
 import logging
 import uuid
-from sqlalchemy import Column, ColumnDefault, Integer, String
+import zlib
+from netaddr import AddrFormatError, IPAddress
+from sqlalchemy import BigInteger, Column, ColumnDefault, Integer, String
 from sqlalchemy import Float, Enum, DateTime, ForeignKey, Text, Boolean
-from sqlalchemy.orm import relationship, backref
+from sqlalchemy import Index, UniqueConstraint
+from sqlalchemy.orm import relationship, backref, validates
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.types import TypeDecorator
 
+from compass.utils import setting_wrapper as setting
 from compass.utils import util
 
 
 BASE = declarative_base()
 
 
-class Switch(BASE):
+def get_ip_int(ip_addr):
+    """Get the integer value of the IP address, None if it is invalid."""
+    if not ip_addr:
+        return None
+
+    try:
+        return int(IPAddress(ip_addr))
+    except (AddrFormatError, ValueError, TypeError):
+        logging.error('invalid ip address %r', ip_addr)
+        return None
+
+
+class CompressedText(TypeDecorator):
+    """Text column compressed when the value is large.
+
+    The values not shorter than COMPRESSED_COLUMN_THRESHOLD are stored
+    as the zlib compressed, base64 encoded utf-8 text after a marker
+    prefix. Other values, and the rows written before the column is
+    compressed, are stored as plain text and read as is. Set the
+    threshold to 0 to store all the new values as plain text.
+    """
+    impl = Text
+    MARKER = '\x1fzlib:'
+
+    def process_bind_param(self, value, dialect):
+        if not value:
+            return value
+
+        threshold = setting.COMPRESSED_COLUMN_THRESHOLD
+        # the plain value starting with the marker is compressed so it
+        # is not mistaken for a compressed one when it is read back.
+        if ((not threshold or len(value) < threshold) and
+                not value.startswith(self.MARKER)):
+            return value
+
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+
+        return self.MARKER + base64.b64encode(zlib.compress(value))
+
+    def process_result_value(self, value, dialect):
+        if not value or not value.startswith(self.MARKER):
+            return value
+
+        return zlib.decompress(
+            base64.b64decode(value[len(self.MARKER):])).decode('utf-8')
+
+
+class JsonColumnMixin(object):
+    """Mixin to parse the json formatted text columns once.
+
+    The parsed value is cached in the instance together with the text
+    it is parsed from. It is reused as long as the column still holds
+    the same text object, so it is invalidated when the column is
+    assigned or the instance is expired and reloaded from database.
+
+    .. note::
+       The cached values are shared by all the callers of the getter
+       and should not be modified in place. Assign the property or the
+       column to change them.
+    """
+
+    def _get_json(self, column_name, default=None):
+        """Get the parsed value of the json column.
+
+        :param column_name: the name of the text column.
+        :param default: the value returned if the column is empty
+                        or can not be parsed.
+        """
+        data = getattr(self, column_name)
+        if not data:
+            return default
+
+        cache = self.__dict__.setdefault('_json_cache', {})
+        if column_name in cache and cache[column_name][0] is data:
+            return cache[column_name][1]
+
+        try:
+            value = json.loads(data)
+        except Exception as error:
+            logging.error('failed to load %s of %s: %s',
+                          column_name, self, data)
+            logging.exception(error)
+            return default
+
+        cache[column_name] = (data, value)
+        return value
+
+    def _set_json(self, column_name, value):
+        """Set the json column from the value.
+
+        :param column_name: the name of the text column.
+        :param value: the value to dump to the column, None to clear it.
+        """
+        self.__dict__.get('_json_cache', {}).pop(column_name, None)
+        if value is None:
+            setattr(self, column_name, None)
+            return
+
+        try:
+            setattr(self, column_name, json.dumps(value))
+        except Exception as error:
+            logging.error('failed to dump %s of %s: %s',
+                          column_name, self, value)
+            logging.exception(error)
+
+
+class Switch(BASE, JsonColumnMixin):
     """Switch table.
 
     :param id: the unique identifier of the switch. int as primary key.
     :param ip: the IP address of the switch.
+    :param ip_int: the IP address of the switch as integer, set when ip
+                   is set, to query the switches in networks by range.
     :param vendor_info: the name of the vendor
     :param credential_data: used for accessing and retrieving information
                             from the switch. Store json format as string.
@@ -28,9 +143,13 @@ class Switch(BASE):
     :param machines: refer to list of Machine connected to the switch.
     """
     __tablename__ = 'switch'
+    __table_args__ = (
+        Index('ix_switch_ip_int', 'ip_int'),
+    )
 
     id = Column(Integer, primary_key=True)
     ip = Column(String(80), unique=True)
+    ip_int = Column(BigInteger)
     credential_data = Column(Text)
     vendor_info = Column(String(256), nullable=True)
     state = Column(Enum('not_reached', 'under_monitoring',
@@ -44,6 +163,12 @@ class Switch(BASE):
         return '<Switch ip: %r, credential: %r, vendor: %r, state: %s>'\
             % (self.ip, self.credential, self.vendor, self.state)
 
+    @validates('ip')
+    def validate_ip(self, key, value):
+        """keep ip_int in sync with ip."""
+        self.ip_int = get_ip_int(value)
+        return value
+
     @property
     def vendor(self):
         """vendor property getter"""
@@ -60,18 +185,14 @@ class Switch(BASE):
 
         :returns: python primitive dictionary object.
         """
-        if self.credential_data:
-            try:
-                credential = json.loads(self.credential_data)
-                credential = dict(
-                    [(str(k).title(), str(v)) for k, v in credential.items()])
-                return credential
-            except Exception as error:
-                logging.error('failed to load credential data %s: %s',
-                              self.id, self.credential_data)
-                logging.exception(error)
-                return {}
-        else:
+        credential = self._get_json('credential_data', {})
+        try:
+            return dict(
+                [(str(k).title(), str(v)) for k, v in credential.items()])
+        except Exception as error:
+            logging.error('failed to load credential data %s: %s',
+                          self.id, self.credential_data)
+            logging.exception(error)
             return {}
 
     @credential.setter
@@ -81,20 +202,11 @@ class Switch(BASE):
         :param value: dict of configuration data needed to update.
         """
         if value:
-            try:
-                credential = {}
-                if self.credential_data:
-                    credential = json.loads(self.credential_data)
-
-                credential.update(value)
-                self.credential_data = json.dumps(credential)
-
-            except Exception as error:
-                logging.error('failed to dump credential data %s: %s',
-                              self.id, value)
-                logging.exception(error)
+            credential = dict(self._get_json('credential_data', {}))
+            credential.update(value)
+            self._set_json('credential_data', credential)
         else:
-            self.credential_data = json.dumps({})
+            self._set_json('credential_data', {})
         logging.debug('switch now is %s', self)
 
 
@@ -112,6 +224,10 @@ class Machine(BASE):
     :param switch: refer to the Switch the machine connects to.
     """
     __tablename__ = 'machine'
+    __table_args__ = (
+        Index('ix_machine_switch_port', 'switch_id', 'port'),
+        Index('ix_machine_vlan', 'vlan'),
+    )
 
     id = Column(Integer, primary_key=True)
     mac = Column(String(24), unique=True)
@@ -149,16 +265,22 @@ class HostState(BASE):
     :param host: refer to ClusterHost.
     """
     __tablename__ = "host_state"
+    __table_args__ = (
+        Index('ix_host_state_state', 'state'),
+    )
 
     id = Column(Integer, ForeignKey('cluster_host.id',
                                     onupdate='CASCADE',
                                     ondelete='CASCADE'),
                 primary_key=True)
-    state = Column(Enum('UNINITIALIZED', 'INSTALLING', 'READY', 'ERROR'),
+    state = Column(Enum('UNINITIALIZED', 'INSTALLING', 'READY', 'ERROR',
+                        name='host_state'),
                    ColumnDefault('UNINITIALIZED'))
     progress = Column(Float, ColumnDefault(0.0))
-    message = Column(String)
-    severity = Column(Enum('INFO', 'WARNING', 'ERROR'), ColumnDefault('INFO'))
+    message = Column(Text)
+    severity = Column(Enum('INFO', 'WARNING', 'ERROR',
+                           name='host_severity'),
+                      ColumnDefault('INFO'))
     update_timestamp = Column(DateTime, default=datetime.now,
                               onupdate=datetime.now)
     host = relationship('ClusterHost', backref=backref('state',
@@ -195,15 +317,21 @@ class ClusterState(BASE):
     :param cluster: refer to Cluster.
     """
     __tablename__ = 'cluster_state'
+    __table_args__ = (
+        Index('ix_cluster_state_state', 'state'),
+    )
     id = Column(Integer, ForeignKey('cluster.id',
                                     onupdate='CASCADE',
                                     ondelete='CASCADE'),
                 primary_key=True)
-    state = Column(Enum('UNINITIALIZED', 'INSTALLING', 'READY', 'ERROR'),
+    state = Column(Enum('UNINITIALIZED', 'INSTALLING', 'READY', 'ERROR',
+                        name='cluster_state'),
                    ColumnDefault('UNINITIALIZED'))
     progress = Column(Float, ColumnDefault(0.0))
-    message = Column(String)
-    severity = Column(Enum('INFO', 'WARNING', 'ERROR'), ColumnDefault('INFO'))
+    message = Column(Text)
+    severity = Column(Enum('INFO', 'WARNING', 'ERROR',
+                           name='cluster_severity'),
+                      ColumnDefault('INFO'))
     update_timestamp = Column(DateTime, default=datetime.now,
                               onupdate=datetime.now)
     cluster = relationship('Cluster', backref=backref('state',
@@ -224,7 +352,7 @@ class ClusterState(BASE):
             self.message, self.severity)
 
 
-class Cluster(BASE):
+class Cluster(BASE, JsonColumnMixin):
     """Cluster configuration information.
 
     :param id: int, identity as primary key.
@@ -241,13 +369,13 @@ class Cluster(BASE):
     __tablename__ = 'cluster'
 
     id = Column(Integer, primary_key=True)
-    name = Column(String, unique=True)
+    name = Column(String(80), unique=True)
     mutable = Column(Boolean, default=True)
     security_config = Column(Text)
     networking_config = Column(Text)
     partition_config = Column(Text)
     adapter_id = Column(Integer, ForeignKey('adapter.id'))
-    raw_config = Column(Text)
+    raw_config = Column(CompressedText)
     adapter = relationship("Adapter", backref=backref('clusters',
                                                       lazy='dynamic'))
 
@@ -264,98 +392,41 @@ class Cluster(BASE):
     @property
     def partition(self):
         """partition getter"""
-        if self.partition_config:
-            try:
-                return json.loads(self.partition_config)
-            except Exception as error:
-                logging.error('failed to load security config %s: %s',
-                              self.id, self.partition_config)
-                logging.exception(error)
-                return {}
-        else:
-            return {}
+        return self._get_json('partition_config', {})
 
     @partition.setter
     def partition(self, value):
         """partition setter"""
         logging.debug('cluster %s set partition %s', self.id, value)
-        if value:
-            try:
-                self.partition_config = json.dumps(value)
-            except Exception as error:
-                logging.error('failed to dump partition config %s: %s',
-                              self.id, value)
-                logging.exception(error)
-        else:
-            self.partition_config = None
+        self._set_json('partition_config', value or None)
 
     @property
     def security(self):
         """security getter"""
-        if self.security_config:
-            try:
-                return json.loads(self.security_config)
-            except Exception as error:
-                logging.error('failed to load security config %s: %s',
-                              self.id, self.security_config)
-                logging.exception(error)
-                return {}
-        else:
-            return {}
+        return self._get_json('security_config', {})
 
     @security.setter
     def security(self, value):
         """security setter"""
         logging.debug('cluster %s set security %s', self.id, value)
-        if value:
-            try:
-                self.security_config = json.dumps(value)
-            except Exception as error:
-                logging.error('failed to dump security config %s: %s',
-                              self.id, value)
-                logging.exception(error)
-        else:
-            self.security_config = None
+        self._set_json('security_config', value or None)
 
     @property
     def networking(self):
         """networking getter"""
-        if self.networking_config:
-            try:
-                return json.loads(self.networking_config)
-            except Exception as error:
-                logging.error('failed to load networking config %s: %s',
-                              self.id, self.networking_config)
-                logging.exception(error)
-                return {}
-        else:
-            return {}
+        return self._get_json('networking_config', {})
 
     @networking.setter
     def networking(self, value):
         """networking setter"""
         logging.debug('cluster %s set networking %s', self.id, value)
-        if value:
-            try:
-                self.networking_config = json.dumps(value)
-            except Exception as error:
-                logging.error('failed to dump networking config %s: %s',
-                              self.id, value)
-                logging.exception(error)
-        else:
-            self.networking_config = None
+        self._set_json('networking_config', value or None)
 
     @property
     def config(self):
         """get config from security, networking, partition"""
         config = {}
-        if self.raw_config:
-            try:
-                config = json.loads(self.raw_config)
-            except Exception as error:
-                logging.error('failed to load raw config %s: %s',
-                              self.id, self.raw_config)
-                logging.exception(error)
+        util.merge_dict(config, self._get_json('raw_config', {}))
         util.merge_dict(config, {'security': self.security})
         util.merge_dict(config, {'networking': self.networking})
         util.merge_dict(config, {'partition': self.partition})
@@ -371,20 +442,15 @@ class Cluster(BASE):
             self.security = None
             self.networking = None
             self.partition = None
-            self.raw_config = None
+            self._set_json('raw_config', None)
             return
         self.security = value.get('security')
         self.networking = value.get('networking')
         self.partition = value.get('partition')
-        try:
-            self.raw_config = json.dumps(value)
-        except Exception as error:
-            logging.error('failed to dump raw config %s: %s',
-                          self.id, value)
-            logging.exception(error)
+        self._set_json('raw_config', value)
 
 
-class ClusterHost(BASE):
+class ClusterHost(BASE, JsonColumnMixin):
     """ClusterHost information.
 
     :param id: int, identity as primary key.
@@ -398,6 +464,10 @@ class ClusterHost(BASE):
     :param state: refer to HostState indicates the host state.
     """
     __tablename__ = 'cluster_host'
+    __table_args__ = (
+        Index('ix_cluster_host_cluster_id', 'cluster_id'),
+        Index('ix_cluster_host_machine_id', 'machine_id'),
+    )
 
     id = Column(Integer, primary_key=True)
 
@@ -411,8 +481,8 @@ class ClusterHost(BASE):
                                             ondelete='SET NULL'),
                         nullable=True)
 
-    hostname = Column(String, unique=True)
-    config_data = Column(Text)
+    hostname = Column(String(80), unique=True)
+    config_data = Column(CompressedText)
     mutable = Column(Boolean, default=True)
 
     cluster = relationship("Cluster", backref=backref('hosts', lazy='dynamic'))
@@ -433,48 +503,37 @@ class ClusterHost(BASE):
     def config(self):
         """config getter."""
         config = {}
-        if self.config_data:
-            try:
-                config.update(json.loads(self.config_data))
-                config.update({'hostid': self.id, 'hostname': self.hostname})
-                if self.cluster:
-                    config.update({'clusterid': self.cluster.id,
-                                   'clustername': self.cluster.name})
-                if self.machine:
-                    util.merge_dict(
-                        config, {
-                            'networking': {
-                                'interfaces': {
-                                    'management': {
-                                        'mac': self.machine.mac
-                                    }
-                                }
+        host_config = self._get_json('config_data')
+        if host_config is None:
+            return config
+
+        util.merge_dict(config, host_config)
+        config.update({'hostid': self.id, 'hostname': self.hostname})
+        if self.cluster:
+            config.update({'clusterid': self.cluster.id,
+                           'clustername': self.cluster.name})
+        if self.machine:
+            util.merge_dict(
+                config, {
+                    'networking': {
+                        'interfaces': {
+                            'management': {
+                                'mac': self.machine.mac
                             }
-                        })
-            except Exception as error:
-                logging.error('failed to load config %s: %s',
-                              self.hostname, self.config_data)
-                logging.exception(error)
+                        }
+                    }
+                })
         return config
 
     @config.setter
     def config(self, value):
         """config setter"""
-        if not self.config_data:
-            config = {
-            }
-            self.config_data = json.dumps(config)
-
+        config = {}
+        util.merge_dict(config, self._get_json('config_data', {}))
         if value:
-            try:
-                config = json.loads(self.config_data)
-                util.merge_dict(config, value)
+            util.merge_dict(config, value)
 
-                self.config_data = json.dumps(config)
-            except Exception as error:
-                logging.error('failed to dump config %s: %s',
-                              self.hostname, value)
-                logging.exception(error)
+        self._set_json('config_data', config)
 
 
 class LogProgressingHistory(BASE):
@@ -493,13 +552,14 @@ class LogProgressingHistory(BASE):
     """
     __tablename__ = 'log_progressing_history'
     id = Column(Integer, primary_key=True)
-    pathname = Column(String, unique=True)
+    pathname = Column(String(255), unique=True)
     position = Column(Integer, ColumnDefault(0))
-    partial_line = Column(Text)
+    partial_line = Column(CompressedText)
     progress = Column(Float, ColumnDefault(0.0))
-    message = Column(Text)
-    severity = Column(Enum('ERROR', 'WARNING', 'INFO'), ColumnDefault('INFO'))
-    line_matcher_name = Column(String, ColumnDefault('start'))
+    message = Column(CompressedText)
+    severity = Column(Enum('ERROR', 'WARNING', 'INFO', name='log_severity'),
+                      ColumnDefault('INFO'))
+    line_matcher_name = Column(String(80), ColumnDefault('start'))
     update_timestamp = Column(DateTime, default=datetime.now,
                               onupdate=datetime.now)
 
@@ -528,9 +588,9 @@ class Adapter(BASE):
     """
     __tablename__ = 'adapter'
     id = Column(Integer, primary_key=True)
-    name = Column(String, unique=True)
-    os = Column(String)
-    target_system = Column(String)
+    name = Column(String(80), unique=True)
+    os = Column(String(80))
+    target_system = Column(String(80))
 
     def __init__(self, **kwargs):
         super(Adapter, self).__init__(**kwargs)
@@ -552,8 +612,8 @@ class Role(BASE):
     """
     __tablename__ = 'role'
     id = Column(Integer, primary_key=True)
-    name = Column(String, unique=True)
-    target_system = Column(String)
+    name = Column(String(80), unique=True)
+    target_system = Column(String(80))
     description = Column(Text)
 
     def __init__(self, **kwargs):
@@ -562,3 +622,91 @@ class Role(BASE):
     def __repr__(self):
         return '<Role %r : target_system %r, description:%r>' % (
             self.name, self.target_system, self.description)
+
+
+class DaemonLease(BASE):
+    """Table stores the live instances of each daemon.
+
+    :param id: int, identity as primary key.
+    :param daemon: str, the daemon name, e.g. poll_switch.
+    :param owner: str, the identity of the daemon instance.
+    :param heartbeat_timestamp: datetime, the latest heartbeat of the
+                                daemon instance.
+    """
+    __tablename__ = 'daemon_lease'
+    __table_args__ = (UniqueConstraint('daemon', 'owner'),)
+    id = Column(Integer, primary_key=True)
+    daemon = Column(String(80))
+    owner = Column(String(160))
+    heartbeat_timestamp = Column(DateTime, default=datetime.now)
+
+    def __init__(self, **kwargs):
+        super(DaemonLease, self).__init__(**kwargs)
+
+    def __repr__(self):
+        return '<DaemonLease %r: owner=%r, heartbeat_timestamp=%s>' % (
+            self.daemon, self.owner, self.heartbeat_timestamp)
+
+
+class DaemonClaim(BASE):
+    """Table stores which daemon instance works on each item.
+
+    :param id: int, identity as primary key.
+    :param daemon: str, the daemon name, e.g. poll_switch.
+    :param item_id: int, the id of the item, e.g. the switch id.
+    :param owner: str, the identity of the daemon instance.
+    :param claim_timestamp: datetime, the latest time the claim is renewed.
+    """
+    __tablename__ = 'daemon_claim'
+    __table_args__ = (UniqueConstraint('daemon', 'item_id'),)
+    id = Column(Integer, primary_key=True)
+    daemon = Column(String(80))
+    item_id = Column(Integer)
+    owner = Column(String(160))
+    claim_timestamp = Column(DateTime)
+
+    def __init__(self, **kwargs):
+        super(DaemonClaim, self).__init__(**kwargs)
+
+    def __repr__(self):
+        return '<DaemonClaim %r %r: owner=%r, claim_timestamp=%s>' % (
+            self.daemon, self.item_id, self.owner, self.claim_timestamp)
+
+
+class SchemaVersion(BASE):
+    """Table stores the schema migrations applied to the database.
+
+    :param version: int, the version of the migration as primary key.
+    :param description: str, the description of the migration.
+    :param update_timestamp: datetime, the timestamp it is applied.
+    """
+    __tablename__ = 'schema_version'
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    description = Column(String(256))
+    update_timestamp = Column(DateTime, default=datetime.now)
+
+    def __init__(self, **kwargs):
+        super(SchemaVersion, self).__init__(**kwargs)
+
+    def __repr__(self):
+        return '<SchemaVersion %r: %r>' % (self.version, self.description)
+
+
+class CatalogVersion(BASE):
+    """Table stores the version of the catalogs cached in process.
+
+    :param name: str, the catalog name as primary key.
+    :param version: int, increased each time the catalog is changed.
+    :param update_timestamp: datetime, the timestamp it is changed.
+    """
+    __tablename__ = 'catalog_version'
+    name = Column(String(80), primary_key=True)
+    version = Column(Integer, ColumnDefault(0))
+    update_timestamp = Column(DateTime, default=datetime.now,
+                              onupdate=datetime.now)
+
+    def __init__(self, **kwargs):
+        super(CatalogVersion, self).__init__(**kwargs)
+
+    def __repr__(self):
+        return '<CatalogVersion %r: %r>' % (self.name, self.version)
@@ -3,11 +3,295 @@
    .. moduleauthor:: Xiaodong Wang <xiaodongwang@huawei.com>
 """
 import logging
+import multiprocessing
+import os
 import re
+import threading
+
+from multiprocessing.pool import ThreadPool
+from sqlalchemy.sql import and_, bindparam
 
 from compass.db import database
-from compass.db.model import Cluster, ClusterHost
+from compass.db.model import Cluster, ClusterHost, ClusterState, HostState
 from compass.log_analyzor.line_matcher import Progress
+from compass.utils import setting_wrapper as setting
+
+
+SEVERITY_ORDER = {'ERROR': 0, 'WARNING': 1, 'INFO': 2}
+POOLS = {}
+POOLS_LOCK = threading.Lock()
+
+
+def _update_host_progress(args):
+    """Update the progress of one host from its installing logs.
+
+    :param args: (os_matcher, package_matcher, hostname, progress)
+
+    :returns: the updated Progress instance.
+
+    .. note::
+       It is a module level function so it can be pickled and run
+       in a worker process.
+    """
+    os_matcher, package_matcher, hostname, progress = args
+    os_matcher.update_progress(hostname, progress)
+    package_matcher.update_progress(hostname, progress)
+    return progress
+
+
+def _init_process_worker():
+    """Drop the database connections inherited from the parent process."""
+    database.ENGINE.dispose()
+
+
+def get_pool(workers, pool_type):
+    """Get the long-lived worker pool of the current process.
+
+    :param workers: the number of workers in the pool.
+    :type workers: int
+    :param pool_type: 'thread' or 'process'.
+    :type pool_type: str
+
+    :returns: the pool, created at the first call in the process.
+
+    .. note::
+       A 'thread' pool only overlaps the log file reads, since the line
+       matching holds the GIL, so it does not use more than one cpu.
+       A 'process' pool uses all the workers' cpus, but it can only be
+       created out of the daemonic processes, e.g. in the progress_update
+       daemon run with --noasync, not in the celery prefork workers.
+       A 'thread' pool is used instead in the daemonic processes.
+    """
+    if (pool_type == 'process' and
+            multiprocessing.current_process().daemon):
+        logging.error('process pool is not allowed in daemonic process '
+                      '%s, use thread pool instead',
+                      multiprocessing.current_process().name)
+        pool_type = 'thread'
+
+    if pool_type not in ['thread', 'process']:
+        raise ValueError('unsupported pool type %s' % pool_type)
+
+    # the pools created before a fork belong to the parent process.
+    key = (os.getpid(), pool_type, workers)
+    with POOLS_LOCK:
+        if key not in POOLS:
+            logging.info('create %s pool of %s workers', pool_type, workers)
+            if pool_type == 'process':
+                POOLS[key] = multiprocessing.Pool(
+                    workers, _init_process_worker)
+            else:
+                POOLS[key] = ThreadPool(workers)
+
+        return POOLS[key]
+
+
+def close_pools():
+    """Close the worker pools of the current process.
+
+    .. note::
+       The daemon should call it before it exits.
+    """
+    with POOLS_LOCK:
+        for (pid, _, _), pool in POOLS.items():
+            if pid == os.getpid():
+                pool.close()
+                pool.join()
+
+        POOLS.clear()
+
+
+def get_state_update(name, state, old_progress, progress):
+    """Get the state columns to write back to database.
+
+    :param name: the name of the updated object, used in logging.
+    :param state: the state loaded from database.
+    :param old_progress: the progress loaded from database.
+    :param progress: the calculated progress.
+
+    :returns: dict of state, progress, message and severity,
+              or None if there is nothing to update.
+    """
+    if state != 'INSTALLING':
+        logging.error('%s is not in INSTALLING state', name)
+        return None
+
+    if old_progress.progress > progress.progress:
+        logging.error(
+            '%s progress is not increased from %s to %s',
+            name, old_progress, progress)
+        return None
+
+    if (old_progress.progress == progress.progress and
+        old_progress.message == progress.message and
+        (not progress.severity or
+         old_progress.severity == progress.severity)):
+        logging.info(
+            'ignore update %s progress %s to %s',
+            name, progress, old_progress)
+        return None
+
+    new_state = state
+    if progress.progress >= 1.0:
+        new_state = 'READY'
+
+    severity = old_progress.severity
+    if progress.severity:
+        severity = progress.severity
+
+    if progress.severity == 'ERROR':
+        new_state = 'ERROR'
+
+    return {
+        'state': new_state,
+        'progress': progress.progress,
+        'message': progress.message,
+        'severity': severity,
+    }
+
+
+def get_cluster_message(host_progresses, max_length):
+    """Aggregate the hosts messages into the cluster message.
+
+    :param host_progresses: the progresses of the hosts in the cluster.
+    :type host_progresses: list of Progress
+    :param max_length: the max length of the cluster message.
+    :type max_length: int
+
+    :returns: str, the identical host messages are grouped with the
+              number of hosts and ordered by severity. The messages
+              not fit in max_length are summarized in the last line.
+
+    .. note::
+       The detailed messages of each host are still available in
+       the host progress.
+    """
+    counts = {}
+    for host_progress in host_progresses:
+        if host_progress.message:
+            key = (host_progress.severity, host_progress.message)
+            counts[key] = counts.get(key, 0) + 1
+
+    groups = sorted(
+        counts.items(),
+        key=lambda item: (
+            SEVERITY_ORDER.get(item[0][0], len(SEVERITY_ORDER)),
+            -item[1], item[0][1]))
+    lines = []
+    length = 0
+    for index, ((_, message), count) in enumerate(groups):
+        if count > 1:
+            line = '%s (%s hosts)' % (message, count)
+        else:
+            line = message
+
+        if lines:
+            # leave room for the summary line of the remaining messages.
+            more = ''
+            if index + 1 < len(groups):
+                more = '\n... %s more messages' % (len(groups) - index - 1)
+
+            if length + 1 + len(line) + len(more) > max_length:
+                lines.append('... %s more messages' % (len(groups) - index))
+                break
+
+            length += 1
+
+        lines.append(line)
+        length += len(line)
+
+    return '\n'.join(lines)[:max_length]
+
+
+def get_cluster_progress(cluster_progress, host_progresses, host_count):
+    """Aggregate the cluster progress from its hosts progresses.
+
+    :param cluster_progress: the cluster progress loaded from database.
+    :type cluster_progress: Progress
+    :param host_progresses: the progresses of the hosts in the cluster.
+    :type host_progresses: list of Progress
+    :param host_count: the number of hosts the progress is averaged on.
+    :type host_count: int
+
+    :returns: the aggregated Progress instance.
+    """
+    progress = Progress(cluster_progress.progress,
+                        cluster_progress.message,
+                        cluster_progress.severity)
+    if not host_count:
+        return progress
+
+    progress_data = 0.0
+    for host_progress in host_progresses:
+        progress_data += host_progress.progress
+
+    progress.progress = progress_data / host_count
+    message = get_cluster_message(
+        host_progresses, setting.PROGRESS_CLUSTER_MESSAGE_MAX_LENGTH)
+    if message:
+        progress.message = message
+
+    for severity in ['ERROR', 'WARNING', 'INFO']:
+        cluster_severity = None
+        for host_progress in host_progresses:
+            if host_progress.severity == severity:
+                cluster_severity = severity
+                break
+
+        if cluster_severity:
+            progress.severity = cluster_severity
+            break
+
+    return progress
+
+
+def update_states(session, cluster_updates, host_updates):
+    """Write changed cluster and host states in the given session.
+
+    :param session: the database session.
+    :param cluster_updates: state columns to update for each changed cluster.
+    :type cluster_updates: dict of clusterid to dict
+    :param host_updates: state columns to update for each changed host.
+    :type host_updates: dict of hostid to dict
+
+    .. note::
+       All changed hosts are written in one bulk UPDATE. The rows are
+       only updated if they are still INSTALLING and their progress
+       does not go backward, in case they are changed since they
+       were loaded.
+    """
+    if host_updates:
+        host_table = HostState.__table__
+        session.execute(
+            host_table.update().where(and_(
+                host_table.c.id == bindparam('hostid'),
+                host_table.c.state == 'INSTALLING',
+                host_table.c.progress <= bindparam('new_progress')
+            )).values(
+                state=bindparam('new_state'),
+                progress=bindparam('new_progress'),
+                message=bindparam('new_message'),
+                severity=bindparam('new_severity')),
+            [
+                {
+                    'hostid': hostid,
+                    'new_state': host_update['state'],
+                    'new_progress': host_update['progress'],
+                    'new_message': host_update['message'],
+                    'new_severity': host_update['severity'],
+                } for hostid, host_update in host_updates.items()
+            ])
+        logging.debug('update hosts %s state %s',
+                      host_updates.keys(), host_updates)
+
+    for clusterid, cluster_update in cluster_updates.items():
+        session.query(ClusterState).filter(
+            ClusterState.id == clusterid,
+            ClusterState.state == 'INSTALLING',
+            ClusterState.progress <= cluster_update['progress']
+        ).update(cluster_update, synchronize_session=False)
+        logging.debug('update cluster %s state %s',
+                      clusterid, cluster_update)
 
 
 class AdapterItemMatcher(object):
@@ -15,31 +299,29 @@ class AdapterItemMatcher(object):
 
     def __init__(self, file_matchers):
         self.file_matchers_ = file_matchers
-        self.min_progress_ = 0.0
-        self.max_progress_ = 1.0
-
-    def update_progress_range(self, min_progress, max_progress):
-        """update min_progress and max_progress."""
-        self.min_progress_ = min_progress
-        self.max_progress_ = max_progress
-        for file_matcher in self.file_matchers_:
-            file_matcher.update_absolute_progress_range(
-                self.min_progress_, self.max_progress_)
 
     def __str__(self):
-        return '%s[file_matchers: %s, min_progress: %s, max_progress: %s]' % (
-            self.__class__.__name__, self.file_matchers_,
-            self.min_progress_, self.max_progress_)
+        return '%s[file_matchers: %s]' % (
+            self.__class__.__name__, self.file_matchers_)
 
-    def update_progress(self, hostname, progress):
+    def update_progress(self, hostname, progress,
+                        min_progress=0.0, max_progress=1.0):
         """Update progress.
 
         :param hostname: the hostname of the installing host.
         :type hostname: str
         :param progress: Progress instance to update.
+        :param min_progress: the min progress of the installing item.
+        :param max_progress: the max progress of the installing item.
+
+        .. note::
+           The progress range is passed in on each call instead of
+           being stored in the matcher, so the same item matcher can be
+           shared by several adapters and across threads.
         """
         for file_matcher in self.file_matchers_:
-            file_matcher.update_progress(hostname, progress)
+            file_matcher.update_progress(
+                hostname, progress, min_progress, max_progress)
 
 
 class OSMatcher(object):
@@ -57,12 +339,15 @@ class OSMatcher(object):
         self.name_ = os_installer_name
         self.os_regex_ = re.compile(os_pattern)
         self.matcher_ = item_matcher
-        self.matcher_.update_progress_range(min_progress, max_progress)
+        self.min_progress_ = min_progress
+        self.max_progress_ = max_progress
 
     def __repr__(self):
-        return '%s[name:%s, os_pattern:%s, matcher:%s]' % (
+        return ('%s[name:%s, os_pattern:%s, matcher:%s, '
+                'min_progress:%s, max_progress:%s]') % (
             self.__class__.__name__, self.name_,
-            self.os_regex_.pattern, self.matcher_)
+            self.os_regex_.pattern, self.matcher_,
+            self.min_progress_, self.max_progress_)
 
     def match(self, os_installer_name, os_name):
         """Check if the os matcher is acceptable."""
@@ -72,7 +357,8 @@ class OSMatcher(object):
 
     def update_progress(self, hostname, progress):
         """Update progress."""
-        self.matcher_.update_progress(hostname, progress)
+        self.matcher_.update_progress(
+            hostname, progress, self.min_progress_, self.max_progress_)
 
 
 class PackageMatcher(object):
@@ -90,12 +376,15 @@ class PackageMatcher(object):
         self.name_ = package_installer_name
         self.target_system_ = target_system
         self.matcher_ = item_matcher
-        self.matcher_.update_progress_range(min_progress, max_progress)
+        self.min_progress_ = min_progress
+        self.max_progress_ = max_progress
 
     def __repr__(self):
-        return '%s[name:%s, target_system:%s, matcher:%s]' % (
+        return ('%s[name:%s, target_system:%s, matcher:%s, '
+                'min_progress:%s, max_progress:%s]') % (
             self.__class__.__name__, self.name_,
-            self.target_system_, self.matcher_)
+            self.target_system_, self.matcher_,
+            self.min_progress_, self.max_progress_)
 
     def match(self, package_installer_name, target_system):
         """Check if the package matcher is acceptable."""
@@ -105,7 +394,8 @@ class PackageMatcher(object):
 
     def update_progress(self, hostname, progress):
         """Update progress."""
-        self.matcher_.update_progress(hostname, progress)
+        self.matcher_.update_progress(
+            hostname, progress, self.min_progress_, self.max_progress_)
 
 
 class AdapterMatcher(object):
@@ -145,176 +435,109 @@ class AdapterMatcher(object):
             self.os_matcher_, self.package_matcher_)
 
     @classmethod
-    def _get_host_progress(cls, hostid):
-        """Get Host Progress from database.
-
-        .. notes::
-           The function should be called out of database session.
-        """
-        with database.session() as session:
-            host = session.query(
-                ClusterHost).filter_by(
-                id=hostid).first()
-            if not host:
-                logging.error(
-                    'there is no host for %s in ClusterHost', hostid)
-                return None, None, None
-
-            if not host.state:
-                logging.error('there is no related HostState for %s',
-                              hostid)
-                return host.hostname, None, None
-
-            return (
-                host.hostname,
-                host.state.state,
-                Progress(host.state.progress,
-                         host.state.message,
-                         host.state.severity))
-
-    @classmethod
-    def _update_host_progress(cls, hostid, progress):
-        """Update host progress to database.
+    def _get_cluster_and_hosts_progress(cls, clusterid, hostids):
+        """Get cluster progress and hosts progresses from database.
 
-        .. note::
-           The function should be called out of the database session.
-        """
-        with database.session() as session:
-            host = session.query(
-                ClusterHost).filter_by(id=hostid).first()
-            if not host:
-                logging.error(
-                    'there is no host for %s in ClusterHost', hostid)
-                return
-
-            if not host.state:
-                logging.error(
-                    'there is no related HostState for %s', hostid)
-                return
-
-            if host.state.state != 'INSTALLING':
-                logging.error(
-                    'host %s is not in INSTALLING state',
-                    hostid)
-                return
-
-            if host.state.progress > progress.progress:
-                logging.error(
-                    'host %s progress is not increased '
-                    'from %s to %s',
-                    hostid, host.state, progress)
-                return
-
-            if (host.state.progress == progress.progress and
-                host.state.message == progress.message):
-                logging.info(
-                    'ignore update host %s progress %s to %s',
-                    hostid, progress, host.state)
-                return
-
-            if progress.progress >= 1.0:
-                host.state.state = 'READY'
-
-            host.state.progress = progress.progress
-            host.state.message = progress.message
-
-            if progress.severity:
-                host.state.severity = progress.severity
-
-            if progress.severity == 'ERROR':
-                host.state.state = 'ERROR'
-                logging.debug(
-                    'update host %s state %s',
-                    hostid, host.state)
+        :param clusterid: the cluster id.
+        :type clusterid: int
+        :param hostids: the host ids.
+        :type hostids: list of int
 
-    @classmethod
-    def _get_cluster_progress(cls, clusterid):
-        """Get cluster progress from database.
+        :returns: (cluster_state, cluster_progress, host_progresses) where
+                  host_progresses is a dict of hostid to
+                  (hostname, host_state, host_progress).
 
         .. notes::
            The function should be called out of database session.
+           The states of all hosts in the cluster are loaded in one
+           joined query instead of one session per host.
         """
-        with database.session() as session:
-            cluster = session.query(Cluster).filter_by(id=clusterid).first()
+        with database.read_session() as session:
+            cluster = session.query(
+                Cluster.id, ClusterState.state, ClusterState.progress,
+                ClusterState.message, ClusterState.severity).outerjoin(
+                ClusterState, ClusterState.id == Cluster.id).filter(
+                Cluster.id == clusterid).first()
             if not cluster:
                 logging.error('there is no Cluster for %s', clusterid)
-                return None, None
+                return None, None, {}
 
-            if not cluster.state:
+            _, cluster_state, progress, message, severity = cluster
+            if not cluster_state:
                 logging.error('there is no ClusterState for %s', clusterid)
-                return None, None
-
-            return (
-                cluster.state.state,
-                Progress(cluster.state.progress,
-                         cluster.state.message,
-                         cluster.state.severity))
-
-    @classmethod
-    def _update_cluster_progress(cls, clusterid, progress):
-        """Update cluster installing progress to database.
-
-        .. note::
-           The function should be called out of the database session.
-        """
-        with database.session() as session:
-            cluster = session.query(
-                Cluster).filter_by(id=clusterid).first()
-            if not cluster:
-                logging.error(
-                    'there is no cluster for %s in Cluster',
-                    clusterid)
-                return
+                return None, None, {}
 
-            if not cluster.state:
-                logging.error(
-                    'there is no ClusterState for %s',
-                    clusterid)
-
-            if cluster.state.state != 'INSTALLING':
-                logging.error('cluster %s is not in INSTALLING state',
-                              clusterid)
-                return
+            cluster_progress = Progress(progress, message, severity)
+            hosts = session.query(
+                ClusterHost.id, ClusterHost.hostname, HostState.state,
+                HostState.progress, HostState.message,
+                HostState.severity).outerjoin(
+                HostState, HostState.id == ClusterHost.id).filter(
+                ClusterHost.cluster_id == clusterid).all()
 
-            if cluster.state.progress > progress.progress:
+        host_rows = dict([(host[0], host[1:]) for host in hosts])
+        host_progresses = {}
+        for hostid in hostids:
+            if hostid not in host_rows:
                 logging.error(
-                    'cluster %s progress is not increased from %s to %s',
-                    clusterid, cluster.state, progress)
-                return
-
-            if (cluster.state.progress == progress.progress and
-                cluster.state.message == progress.message):
-                logging.info(
-                    'ignore update cluster  %s progress %s to %s',
-                    clusterid, progress, cluster.state)
-                return
+                    'there is no host for %s in ClusterHost', hostid)
+                continue
 
-            if progress.progress >= 1.0:
-                cluster.state.state = 'READY'
+            hostname, host_state, progress, message, severity = (
+                host_rows[hostid])
+            if not host_state:
+                logging.error('there is no related HostState for %s',
+                              hostid)
+                continue
 
-            cluster.state.progress = progress.progress
-            cluster.state.message = progress.message
+            host_progresses[hostid] = (
+                hostname, host_state, Progress(progress, message, severity))
 
-            if progress.severity:
-                cluster.state.severity = progress.severity
+        return cluster_state, cluster_progress, host_progresses
 
-            if progress.severity == 'ERROR':
-                cluster.state.state = 'ERROR'
+    def _update_hosts_progress(self, hosts, workers, pool_type):
+        """Update hosts progresses from their installing logs.
 
-            logging.debug(
-                'update cluster %s state %s',
-                clusterid, cluster.state)
+        :param hosts: list of (hostname, Progress instance).
+        :param workers: the number of workers to process the hosts.
+                        0 means the number of cpus, 1 means serial.
+        :type workers: int
+        :param pool_type: 'thread' or 'process', see :func:`get_pool`.
+        :type pool_type: str
 
-    def update_progress(self, clusterid, hostids):
+        :returns: list of updated Progress instances in the order of hosts.
+        """
+        args = [
+            (self.os_matcher_, self.package_matcher_, hostname, progress)
+            for hostname, progress in hosts
+        ]
+        if workers <= 0:
+            workers = multiprocessing.cpu_count()
+
+        if workers <= 1 or len(args) <= 1:
+            return [_update_host_progress(arg) for arg in args]
+
+        logging.debug('update %s hosts progress in %s %s workers',
+                      len(args), workers, pool_type)
+        return get_pool(workers, pool_type).map(_update_host_progress, args)
+
+    def update_progress(self, clusterid, hostids,
+                        workers=1, pool_type='thread'):
         """Update cluster progress and hosts progresses.
 
         :param clusterid: the cluster id.
         :type clusterid: int
         :param hostids: the host ids.
         :type hostids: list of int
+        :param workers: the number of workers to process host logs.
+                        0 means the number of cpus, 1 means serial.
+        :type workers: int
+        :param pool_type: the worker pool type, 'thread' or 'process',
+                          see :func:`get_pool`.
+        :type pool_type: str
         """
-        cluster_state, cluster_progress = self._get_cluster_progress(
-            clusterid)
+        cluster_state, cluster_progress, host_progresses = (
+            self._get_cluster_and_hosts_progress(clusterid, hostids))
         if not cluster_progress:
             logging.error(
                 'nothing to update cluster %s => state %s progress %s',
@@ -323,57 +546,59 @@ class AdapterMatcher(object):
 
         logging.debug('got cluster %s state %s progress %s',
                       clusterid, cluster_state, cluster_progress)
-        host_progresses = {}
-        for hostid in hostids:
-            hostname, host_state, host_progress = self._get_host_progress(
-                hostid)
-            if not hostname or not host_progress:
-                logging.error(
-                    'nothing to update host %s => hostname %s '
-                    'state %s progress %s',
-                    hostid, hostname, host_state, host_progress)
-                continue
-
-            logging.debug('got host %s hostname %s state %s progress %s',
-                          hostid, hostname, host_state, host_progress)
-            host_progresses[hostid] = (hostname, host_state, host_progress)
-
+        updating_hostids = []
+        old_host_progresses = {}
         for hostid, host_value in host_progresses.items():
             hostname, host_state, host_progress = host_value
+            logging.debug('got host %s hostname %s state %s progress %s',
+                          hostid, hostname, host_state, host_progress)
             if host_state == 'INSTALLING' and host_progress.progress < 1.0:
-                self.os_matcher_.update_progress(
-                    hostname, host_progress)
-                self.package_matcher_.update_progress(
-                    hostname, host_progress)
-                self._update_host_progress(hostid, host_progress)
+                updating_hostids.append(hostid)
+                old_host_progresses[hostid] = Progress(
+                    host_progress.progress,
+                    host_progress.message,
+                    host_progress.severity)
             else:
                 logging.error(
                     'there is no need to update host %s '
                     'progress: hostname %s state %s progress %s',
                     hostid, hostname, host_state, host_progress)
 
-        cluster_progress_data = 0.0
-        for _, _, host_progress in host_progresses.values():
-            cluster_progress_data += host_progress.progress
-
-        cluster_progress.progress = cluster_progress_data / len(hostids)
-        messages = []
-        for _, _, host_progress in host_progresses.values():
-            if host_progress.message:
-                messages.append(host_progress.message)
-
-        if messages:
-            cluster_progress.message = '\n'.join(messages)
-
-        for severity in ['ERROR', 'WARNING', 'INFO']:
-            cluster_severity = None
-            for _, _, host_progress in host_progresses.values():
-                if host_progress.severity == severity:
-                    cluster_severity = severity
-                    break
+        updated_progresses = self._update_hosts_progress(
+            [
+                (host_progresses[hostid][0], host_progresses[hostid][2])
+                for hostid in updating_hostids
+            ],
+            workers, pool_type)
+
+        host_updates = {}
+        for hostid, host_progress in zip(updating_hostids,
+                                         updated_progresses):
+            hostname, host_state, _ = host_progresses[hostid]
+            host_progresses[hostid] = (hostname, host_state, host_progress)
+            host_update = get_state_update(
+                'host %s' % hostid, host_state,
+                old_host_progresses[hostid], host_progress)
+            if host_update:
+                host_updates[hostid] = host_update
+
+        new_cluster_progress = get_cluster_progress(
+            cluster_progress,
+            [
+                host_progress
+                for _, _, host_progress in host_progresses.values()
+            ],
+            len(hostids))
+        cluster_update = get_state_update(
+            'cluster %s' % clusterid, cluster_state,
+            cluster_progress, new_cluster_progress)
+        if not host_updates and not cluster_update:
+            logging.info('nothing changed for cluster %s', clusterid)
+            return
 
-            if cluster_severity:
-                cluster_progress.severity = cluster_severity
-                break
+        cluster_updates = {}
+        if cluster_update:
+            cluster_updates[clusterid] = cluster_update
 
-        self._update_cluster_progress(clusterid, cluster_progress)
+        with database.session() as session:
+            update_states(session, cluster_updates, host_updates)
@@ -69,6 +69,8 @@ class FileReader(object):
     it has read last time. and update the position when it finish
     reading the log.
     """
+    BLOCK_SIZE = 65536
+
     def __init__(self, pathname):
         self.pathname_ = pathname
         self.position_ = 0
@@ -154,6 +156,58 @@ class FileReader(object):
             logging.debug('update file %s to history %s',
                           self.pathname_, history)
 
+    def readline_reversed(self, max_bytes):
+        """Generate each complete line of the log file from the end backwards.
+
+        :param max_bytes: the max bytes to read from the end of the file.
+        :type max_bytes: int
+
+        .. note::
+           The position is moved to the end of the last complete line
+           in the log file, so the following :func:`readline` starts
+           from there. The file is read backwards block by block, and
+           only as far as the lines are consumed by the caller.
+        """
+        try:
+            with open(self.pathname_) as logfile:
+                logfile.seek(0, os.SEEK_END)
+                position = logfile.tell()
+                line_end = None
+                remainder = ''
+                read_bytes = 0
+                while position > 0:
+                    size = min(self.BLOCK_SIZE, position)
+                    position -= size
+                    logfile.seek(position)
+                    data = logfile.read(size) + remainder
+                    if line_end is None:
+                        index = data.rfind('\n')
+                        if index < 0:
+                            remainder = data
+                            continue
+
+                        line_end = position + index + 1
+                        self.position_ = line_end
+                        self.partial_line_ = ''
+                        data = data[:index]
+
+                    lines = data.split('\n')
+                    remainder = lines[0]
+                    for line in reversed(lines[1:]):
+                        read_bytes += len(line) + 1
+                        if read_bytes > max_bytes:
+                            return
+
+                        yield line + '\n'
+
+                if (line_end is not None and
+                        read_bytes + len(remainder) + 1 <= max_bytes):
+                    yield remainder + '\n'
+
+        except Exception as error:
+            logging.error('failed to processing file %s', self.pathname_)
+            raise error
+
     def readline(self):
         """Generate each line of the log file."""
         old_position = self.position_
@@ -236,43 +290,53 @@ class FileMatcher(object):
         self.line_matchers_ = line_matchers
         self.min_progress_ = min_progress
         self.max_progress_ = max_progress
-        self.absolute_min_progress_ = 0.0
-        self.absolute_max_progress_ = 1.0
-        self.absolute_progress_diff_ = 1.0
         self.filename_ = filename
 
-    def update_absolute_progress_range(self, min_progress, max_progress):
-        """update the min progress and max progress the log file indicates."""
+    def get_absolute_progress_range(self, min_progress, max_progress):
+        """Get the min progress and max progress the log file indicates.
+
+        :param min_progress: the min progress of the item the file is in.
+        :param max_progress: the max progress of the item the file is in.
+
+        :returns: (absolute_min_progress, absolute_max_progress)
+        """
         progress_diff = max_progress - min_progress
-        self.absolute_min_progress_ = (
-            min_progress + self.min_progress_ * progress_diff)
-        self.absolute_max_progress_ = (
+        return (
+            min_progress + self.min_progress_ * progress_diff,
             min_progress + self.max_progress_ * progress_diff)
-        self.absolute_progress_diff_ = (
-            self.absolute_max_progress_ - self.absolute_min_progress_)
 
     def __str__(self):
         return (
             '%s[ filename: %s, progress range: [%s:%s], '
             'line_matchers: %s]' % (
                 self.__class__.__name__, self.filename_,
-                self.absolute_min_progress_,
-                self.absolute_max_progress_, self.line_matchers_)
+                self.min_progress_,
+                self.max_progress_, self.line_matchers_)
         )
 
-    def update_total_progress(self, file_progress, total_progress):
-        """Get the total progress from file progress."""
+    def update_total_progress(self, file_progress, total_progress,
+                              min_progress=0.0, max_progress=1.0):
+        """Get the total progress from file progress.
+
+        :param file_progress: Progress instance read from the file.
+        :param total_progress: Progress instance to update.
+        :param min_progress: the min progress of the item the file is in.
+        :param max_progress: the max progress of the item the file is in.
+        """
         if not file_progress.message:
             logging.info(
                 'ignore update file %s progress %s to total progress',
                 self.filename_, file_progress)
             return
 
+        absolute_min_progress, absolute_max_progress = (
+            self.get_absolute_progress_range(min_progress, max_progress))
         total_progress_data = min(
-            self.absolute_min_progress_
+            absolute_min_progress
                 +
-            file_progress.progress * self.absolute_progress_diff_,
-            self.absolute_max_progress_)
+            file_progress.progress * (
+                absolute_max_progress - absolute_min_progress),
+            absolute_max_progress)
 
         # total progress should only be updated when the new calculated
         # progress is greater than the recored total progress or the
@@ -290,12 +354,104 @@ class FileMatcher(object):
                 'ignore update file %s progress %s to total progress %s',
                 self.filename_, file_progress, total_progress)
 
-    def update_progress(self, hostname, total_progress):
+    def update_lines_progress(self, lines, line_matcher_name, file_progress):
+        """Update file progress by the lines through the line matchers.
+
+        :param lines: iterator of the log lines.
+        :param line_matcher_name: the name of the current line matcher.
+        :param file_progress: Progress instance to update.
+
+        :returns: the name of the line matcher after the lines.
+        """
+        for line in lines:
+            if line_matcher_name not in self.line_matchers_:
+                logging.debug('early exit at\n%s\nbecause %s is not in %s',
+                              line, line_matcher_name, self.line_matchers_)
+                break
+
+            index = line_matcher_name
+            while index in self.line_matchers_:
+                line_matcher = self.line_matchers_[index]
+                index, line_matcher_name = line_matcher.update_progress(
+                    line, file_progress)
+
+        return line_matcher_name
+
+    def get_milestones(self):
+        """Get the milestone line matcher names, the latest one first.
+
+        A milestone is a line matcher which sets the progress to
+        a fixed value, so the progress does not depend on the lines
+        before it.
+        """
+        milestones = [
+            (line_matcher.get_milestone_progress(), name)
+            for name, line_matcher in self.line_matchers_.items()
+            if line_matcher.is_milestone()
+        ]
+        return [name for _, name in sorted(milestones, reverse=True)]
+
+    def cold_start(self, file_reader, file_progress, max_bytes):
+        """Catch up a log file which has no progressing history.
+
+        :param file_reader: :class:`FileReader` instance of the log file.
+        :param file_progress: Progress instance to update.
+        :param max_bytes: the max bytes to scan from the end of the file.
+
+        :returns: the name of the line matcher at the end of the file.
+
+        The file is scanned backwards from the end for the latest line
+        matching a milestone. The line matchers continue from that
+        milestone with the lines after it, instead of replaying the whole
+        file from the beginning. If there is no milestone in the last
+        max_bytes of the file, the position is moved back to the
+        beginning of the file, so the whole file is replayed from the
+        start line matcher.
+        """
+        milestones = self.get_milestones()
+        lines = []
+        line_matcher_name = 'start'
+        milestone = None
+        for line in file_reader.readline_reversed(max_bytes):
+            lines.append(line)
+            milestone = None
+            for name in milestones:
+                if self.line_matchers_[name].match(line):
+                    milestone = name
+                    break
+
+            if milestone:
+                logging.debug('file %s cold start from milestone %s at\n%s',
+                              file_reader.pathname_, milestone, line)
+                line_matcher_name = milestone
+                break
+
+        if (not milestone and
+                sum([len(line) for line in lines]) < file_reader.position_):
+            logging.debug('file %s has no milestone in the last %s bytes, '
+                          'replay it from the beginning',
+                          file_reader.pathname_, max_bytes)
+            file_reader.position_ = 0
+            file_reader.partial_line_ = ''
+            return line_matcher_name
+
+        lines.reverse()
+        line_matcher_name = self.update_lines_progress(
+            lines, line_matcher_name, file_progress)
+        logging.debug('file %s cold start with %s lines to position %s',
+                      file_reader.pathname_, len(lines),
+                      file_reader.position_)
+        return line_matcher_name
+
+    def update_progress(self, hostname, total_progress,
+                        min_progress=0.0, max_progress=1.0):
         """update progress from file.
 
         :param hostname: the hostname of the installing host.
         :type hostname: str
         :param total_progress: Progress instance to update.
+        :param min_progress: the min progress of the item the file is in.
+        :param max_progress: the max progress of the item the file is in.
 
         the function update installing progress by reading the log file.
         It contains a list of line matcher, when one log line matches
@@ -312,17 +468,14 @@ class FileMatcher(object):
             return
 
         line_matcher_name, file_progress = file_reader.get_history()
-        for line in file_reader.readline():
-            if line_matcher_name not in self.line_matchers_:
-                logging.debug('early exit at\n%s\nbecause %s is not in %s',
-                              line, line_matcher_name, self.line_matchers_)
-                break
-
-            index = line_matcher_name
-            while index in self.line_matchers_:
-                line_matcher = self.line_matchers_[index]
-                index, line_matcher_name = line_matcher.update_progress(
-                    line, file_progress)
-
+        if (file_reader.position_ == 0 and line_matcher_name == 'start' and
+                setting.PROGRESS_UPDATE_COLD_START_BYTES > 0):
+            line_matcher_name = self.cold_start(
+                file_reader, file_progress,
+                setting.PROGRESS_UPDATE_COLD_START_BYTES)
+
+        line_matcher_name = self.update_lines_progress(
+            file_reader.readline(), line_matcher_name, file_progress)
         file_reader.update_history(line_matcher_name, file_progress)
-        self.update_total_progress(file_progress, total_progress)
+        self.update_total_progress(file_progress, total_progress,
+                                   min_progress, max_progress)
@@ -180,6 +180,18 @@ class LineMatcher(object):
             self.__class__.__name__, self.regex_.pattern,
             self.message_template_, self.severity_)
 
+    def is_milestone(self):
+        """Check if the line matcher sets the progress to a fixed value."""
+        return isinstance(self.progress_, RelativeProgress)
+
+    def get_milestone_progress(self):
+        """Get the fixed progress the milestone line matcher sets."""
+        return self.progress_.progress_
+
+    def match(self, line):
+        """Check if the line matches the line matcher pattern."""
+        return self.regex_.search(line) is not None
+
     def update_progress(self, line, progress):
         """Update progress by the line.
 
@@ -0,0 +1,188 @@
+"""Module to generate synthetic installing logs.
+
+   The generated logs look like the logs the installing hosts send to
+   the compass server during a CentOS installation by cobbler followed by
+   an openstack deployment by chef: sys.log, anaconda.log, install.log and
+   chef-client.log under <logdir>/<hostname>/. The logs are appended step
+   by step to simulate an in-flight installation, so they can be used to
+   test and benchmark the log analyzer.
+"""
+import os
+import os.path
+import random
+
+
+ANACONDA_STEPS = [
+    'setting up kickstart',
+    'starting STEP_STAGE2',
+    'Running anaconda script /usr/bin/anaconda',
+    'Running kickstart %pre script(s)',
+    'All kickstart %pre script(s) have been run',
+    'moving (1) to step enablefilesystems',
+    'leaving (1) step enablefilesystems',
+    'moving (1) to step reposetup',
+    'leaving (1) step reposetup',
+    'moving (1) to step postselection',
+    'leaving (1) step postselection',
+    'moving (1) to step installpackages',
+]
+
+ANACONDA_FINAL_STEPS = [
+    'leaving (1) step installpackages',
+    'moving (1) to step instbootloader',
+    'leaving (1) step instbootloader',
+]
+
+ANACONDA_NOISE = [
+    'DEBUG   : checking for device %(device)s',
+    'INFO    : looking for iscsi disk %(device)s',
+    'DEBUG   : added partition %(device)s1 (%(size)s MB) to tree',
+    'WARNING : no swap partition found on %(device)s',
+]
+
+SYSLOG_NOISE = [
+    'INFO kernel: %(device)s: %(size)s 512-byte logical blocks',
+    'INFO kernel: e1000: eth0 NIC Link is Up 1000 Mbps Full Duplex',
+    'DEBUG dhclient[%(size)s]: DHCPREQUEST on eth0 to 10.145.88.1',
+]
+
+CHEF_RESOURCES = [
+    'package[%(name)s] action install',
+    'template[/etc/%(name)s/%(name)s.conf] action create',
+    'service[%(name)s] action enable',
+    'execute[%(name)s-manage db_sync] action run',
+]
+
+CHEF_NOISE = [
+    'DEBUG: Loading cookbook %(name)s\'s recipes',
+    'DEBUG: Sending HTTP Request via GET to compass:443/nodes/%(name)s',
+    'INFO: Storing updated cookbooks/%(name)s/recipes/default.rb in cache',
+]
+
+
+def _get_os_events(rand, noise_lines, os_packages):
+    """Get (filename, line) events of the os installing in order."""
+    events = []
+    for i in range(3):
+        events.append(('sys.log', 'NOTICE starting installation stage %s' % i))
+
+    def noise(filename, templates):
+        for _ in range(rand.randint(0, noise_lines)):
+            events.append((filename, rand.choice(templates) % {
+                'device': rand.choice(['sda', 'sdb', 'vda']),
+                'size': rand.randint(1, 100000)}))
+
+    for step in ANACONDA_STEPS:
+        noise('sys.log', SYSLOG_NOISE)
+        noise('anaconda.log', ANACONDA_NOISE)
+        events.append(('anaconda.log', 'INFO    : %s' % step))
+
+    for i in range(os_packages):
+        events.append((
+            'install.log',
+            'Installing package-%s-1.%s.el6.x86_64' % (i, rand.randint(0, 9))
+        ))
+        if i % 10 == 0:
+            noise('anaconda.log', ANACONDA_NOISE)
+
+    events.append(('install.log', '*** FINISHED INSTALLING PACKAGES ***'))
+    for step in ANACONDA_FINAL_STEPS:
+        noise('anaconda.log', ANACONDA_NOISE)
+        events.append(('anaconda.log', 'INFO    : %s' % step))
+
+    return events
+
+
+def _get_package_events(rand, noise_lines, chef_resources):
+    """Get (filename, line) events of the package installing in order."""
+    events = [('chef-client.log', 'INFO: *** Chef 11.8.0 ***')]
+    names = ['nova', 'glance', 'keystone', 'mysql', 'rabbitmq', 'horizon']
+    for i in range(chef_resources):
+        name = rand.choice(names)
+        for _ in range(rand.randint(0, noise_lines)):
+            events.append(('chef-client.log',
+                           rand.choice(CHEF_NOISE) % {'name': name}))
+
+        events.append((
+            'chef-client.log',
+            'INFO: Processing %s (%s::default line %s)' % (
+                rand.choice(CHEF_RESOURCES) % {'name': name}, name, i)))
+
+    events.append(('chef-client.log',
+                   'INFO: Chef Run complete in %s seconds' % (
+                       rand.randint(100, 1000))))
+    return events
+
+
+def get_host_events(hostname, noise_lines=5, os_packages=200,
+                    chef_resources=150, seed=None):
+    """Get all (filename, line) events of a host installation in order.
+
+    :param hostname: the hostname of the installing host.
+    :param noise_lines: max noise lines between two progress lines.
+    :param os_packages: the number of packages in install.log.
+    :param chef_resources: the number of resources chef processes.
+    :param seed: the random seed, defaults to the hostname.
+    """
+    if seed is None:
+        seed = hostname
+
+    rand = random.Random(seed)
+    return (_get_os_events(rand, noise_lines, os_packages) +
+            _get_package_events(rand, noise_lines, chef_resources))
+
+
+class LogGenerator(object):
+    """Class to append synthetic installing logs for hosts step by step."""
+
+    def __init__(self, logdir, hostnames, steps=20, **kwargs):
+        """Constructor
+
+        :param logdir: the directory to write <hostname>/<logfile> to.
+        :param hostnames: the hostnames of the installing hosts.
+        :param steps: the number of steps to finish the installations.
+        :param kwargs: extra arguments passed to :func:`get_host_events`.
+        """
+        self.logdir_ = logdir
+        self.steps_ = steps
+        self.step_ = 0
+        self.host_events_ = {}
+        for hostname in hostnames:
+            hostdir = os.path.join(logdir, hostname)
+            if not os.path.exists(hostdir):
+                os.makedirs(hostdir)
+
+            self.host_events_[hostname] = get_host_events(hostname, **kwargs)
+
+    def __repr__(self):
+        return '%s[logdir: %s, hosts: %s, step: %s/%s]' % (
+            self.__class__.__name__, self.logdir_,
+            len(self.host_events_), self.step_, self.steps_)
+
+    def is_finished(self):
+        """Check if all the logs are written."""
+        return self.step_ >= self.steps_
+
+    def advance(self, steps=1):
+        """Append the log lines of the next steps for every host.
+
+        :returns: the number of lines written.
+        """
+        old_step = self.step_
+        self.step_ = min(self.steps_, self.step_ + steps)
+        written = 0
+        for hostname, events in self.host_events_.items():
+            start = len(events) * old_step // self.steps_
+            end = len(events) * self.step_ // self.steps_
+            lines = {}
+            for filename, line in events[start:end]:
+                lines.setdefault(filename, []).append('%s\n' % line)
+
+            for filename, file_lines in lines.items():
+                with open(os.path.join(self.logdir_, hostname, filename),
+                          'a') as logfile:
+                    logfile.write(''.join(file_lines))
+
+                written += len(file_lines)
+
+        return written
@@ -0,0 +1,185 @@
+"""Module to run the progress calculation next to the installing logs.
+
+   The agent evaluates the file matchers of the adapter on the host log
+   directories it can read locally, and only reports the compact per
+   host progress deltas to the compass server, which applies them to
+   the host and cluster states in one transaction.
+
+   The agent keeps the positions it has processed in its own
+   log_progressing_history table, so the database it is initialized
+   with should be local to the agent, not the central compass database.
+"""
+import logging
+import os
+
+from compass.log_analyzor import file_matcher
+from compass.log_analyzor.line_matcher import Progress
+
+
+class HostProgressState(object):
+    """Progress of one host known by the agent."""
+
+    def __init__(self):
+        self.checkpoint_ = None
+        self.progress_ = Progress(0.0, '', None)
+        self.reported_ = None
+
+    def __str__(self):
+        return '%s[checkpoint: %s, progress: %s, reported: %s]' % (
+            self.__class__.__name__, self.checkpoint_,
+            self.progress_, self.reported_)
+
+    def get_delta(self, hostname):
+        """Get the progress to report if it is changed since last report.
+
+        :returns: dict of hostname, progress, message, severity and
+                  checkpoint, or None if nothing changed.
+        """
+        delta = {
+            'hostname': hostname,
+            'progress': self.progress_.progress,
+            'message': self.progress_.message,
+            'severity': self.progress_.severity,
+        }
+        if delta == self.reported_:
+            return None
+
+        delta['checkpoint'] = self.checkpoint_
+        return delta
+
+
+class ProgressAgent(object):
+    """Agent to calculate hosts progresses from local installing logs."""
+
+    def __init__(self, adapter_matcher, client):
+        """Constructor
+
+        :param adapter_matcher: the adapter matcher to evaluate the logs.
+        :type adapter_matcher: :class:`AdapterMatcher`
+        :param client: compass api client to report the progresses.
+        :type client: :class:`compass.apiclient.restful.Client`
+        """
+        self.adapter_matcher_ = adapter_matcher
+        self.client_ = client
+        self.hosts_ = {}
+
+    def __str__(self):
+        return '%s[adapter_matcher: %s, hosts: %s]' % (
+            self.__class__.__name__, self.adapter_matcher_,
+            len(self.hosts_))
+
+    @classmethod
+    def get_hostnames(cls):
+        """Get the hostnames which have installing logs locally."""
+        logdir = file_matcher.FILE_READER_FACTORY.logdir_
+        try:
+            return sorted([
+                hostname for hostname in os.listdir(logdir)
+                if os.path.isdir(os.path.join(logdir, hostname))
+            ])
+        except OSError as error:
+            logging.error('failed to list host log dirs in %s', logdir)
+            logging.exception(error)
+            return []
+
+    @classmethod
+    def get_checkpoint(cls, hostname):
+        """Get the checkpoint of the host installing logs.
+
+        The checkpoint is the total size of the host log files, so the
+        logs of the host only need to be evaluated when it is changed.
+        """
+        hostdir = os.path.join(
+            file_matcher.FILE_READER_FACTORY.logdir_, hostname)
+        checkpoint = 0
+        for filename in os.listdir(hostdir):
+            pathname = os.path.join(hostdir, filename)
+            if os.path.isfile(pathname):
+                checkpoint += os.path.getsize(pathname)
+
+        return checkpoint
+
+    def update_progress(self, hostname):
+        """Update the host progress if its installing logs grew.
+
+        :returns: True if the host logs are evaluated.
+        """
+        host = self.hosts_.setdefault(hostname, HostProgressState())
+        checkpoint = self.get_checkpoint(hostname)
+        if checkpoint == host.checkpoint_:
+            logging.debug('host %s logs are not changed since %s',
+                          hostname, checkpoint)
+            return False
+
+        self.adapter_matcher_.os_matcher_.update_progress(
+            hostname, host.progress_)
+        self.adapter_matcher_.package_matcher_.update_progress(
+            hostname, host.progress_)
+        host.checkpoint_ = checkpoint
+        logging.debug('host %s progress is updated: %s', hostname, host)
+        return True
+
+    def get_deltas(self):
+        """Evaluate local host logs and get the changed progresses.
+
+        :returns: list of dict of hostname, progress, message, severity
+                  and checkpoint.
+        """
+        deltas = []
+        for hostname in self.get_hostnames():
+            try:
+                self.update_progress(hostname)
+            except Exception as error:
+                logging.error('failed to update progress of host %s',
+                              hostname)
+                logging.exception(error)
+                continue
+
+            delta = self.hosts_[hostname].get_delta(hostname)
+            if delta:
+                deltas.append(delta)
+
+        return deltas
+
+    def run_once(self):
+        """Evaluate local host logs and report the changed progresses.
+
+        :returns: the number of host progresses accepted by the server.
+
+        .. note::
+           A host progress is only marked as reported when the server
+           has processed it, otherwise it is sent again in the next run.
+           The progress of a host the server does not know yet is not
+           marked as reported either.
+        """
+        deltas = self.get_deltas()
+        if not deltas:
+            logging.info('no host progress is changed')
+            return 0
+
+        status, resp = self.client_.update_hosts_installing_progress(deltas)
+        if status != 200:
+            logging.error('failed to report hosts progresses: %s %s',
+                          status, resp)
+            return 0
+
+        results = resp.get('progresses', {})
+        reported = 0
+        for delta in deltas:
+            hostname = delta['hostname']
+            result = results.get(hostname)
+            if not result:
+                logging.error('no result for host %s', hostname)
+                continue
+
+            if result['status'] == 'not found':
+                logging.info('host %s is not found in compass', hostname)
+                continue
+
+            del delta['checkpoint']
+            self.hosts_[hostname].reported_ = delta
+            reported += 1
+
+        logging.info('reported %s of %s host progresses',
+                     reported, len(deltas))
+        return reported
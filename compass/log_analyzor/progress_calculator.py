@@ -246,7 +246,7 @@ ADAPTER_CONFIGURATIONS = [
 ]
 
 
-def _get_adapter_matcher(os_installer, os_name,
+def get_adapter_matcher(os_installer, os_name,
                         package_installer, target_system):
     """Get adapter matcher by os name and package installer name."""
     for configuration in ADAPTER_CONFIGURATIONS:
@@ -261,7 +261,7 @@ def _get_adapter_matcher(os_installer, os_name,
 
 
 def update_progress(os_installer, os_name, package_installer, target_system,
-                    clusterid, hostids):
+                    clusterid, hostids, workers=1, pool_type='thread'):
     """Update adapter installing progress.
 
     :param os_installer: os installer name
@@ -269,10 +269,15 @@ def update_progress(os_installer, os_name, package_installer, target_system,
     :param package_installer: package installer name.
     :param clusterid: cluster id.
     :param hostids: hosts ids.
+    :param workers: number of workers to process host logs in parallel.
+                    0 means the number of cpus, 1 means serial.
+    :param pool_type: worker pool type, 'thread' or 'process',
+                      see :func:`adapter_matcher.get_pool`.
     """
-    adapter = _get_adapter_matcher(os_installer, os_name,
-                                   package_installer, target_system)
+    adapter = get_adapter_matcher(os_installer, os_name,
+                                  package_installer, target_system)
     if not adapter:
         return
 
-    adapter.update_progress(clusterid, hostids)
+    adapter.update_progress(clusterid, hostids,
+                            workers=workers, pool_type=pool_type)
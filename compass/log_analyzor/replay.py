@@ -0,0 +1,150 @@
+"""Module to replay captured installing logs through the file matchers.
+
+   The replay runs offline: it reads the log files directly and does not
+   touch the log_progressing_history table. It collects how often each
+   line matcher is evaluated and matched, the time spent in its regex,
+   and the progress timeline of the log.
+"""
+import logging
+import time
+
+from compass.log_analyzor.file_matcher import FileMatcher
+from compass.log_analyzor.line_matcher import Progress
+
+
+class LineMatcherProfile(object):
+    """Line matcher wrapper to collect the matching statistics."""
+
+    def __init__(self, name, line_matcher):
+        self.name_ = name
+        self.line_matcher_ = line_matcher
+        self.evaluations_ = 0
+        self.matches_ = 0
+        self.regex_seconds_ = 0.0
+
+    def __str__(self):
+        return '%s[name: %s, evaluations: %s, matches: %s, seconds: %s]' % (
+            self.__class__.__name__, self.name_, self.evaluations_,
+            self.matches_, self.regex_seconds_)
+
+    def update_progress(self, line, progress):
+        """Update progress by the line and record the statistics.
+
+        .. note::
+           Only the regex search is timed. The line is passed to
+           the wrapped line matcher only when it matches, so unmatched
+           lines are searched once.
+        """
+        line_matcher = self.line_matcher_
+        start = time.time()
+        matched = line_matcher.match(line)
+        self.regex_seconds_ += time.time() - start
+        self.evaluations_ += 1
+        if not matched:
+            return (
+                line_matcher.unmatch_sameline_,
+                line_matcher.unmatch_nextline_)
+
+        self.matches_ += 1
+        return line_matcher.update_progress(line, progress)
+
+
+class FileReplayResult(object):
+    """Result of replaying one log file."""
+
+    def __init__(self, pathname, file_matcher, profiles):
+        self.pathname_ = pathname
+        self.file_matcher_ = file_matcher
+        self.profiles_ = profiles
+        self.lines_ = 0
+        self.seconds_ = 0.0
+        self.line_matcher_name_ = 'start'
+        self.file_progress_ = Progress(0.0, '', None)
+        self.total_progress_ = Progress(0.0, '', None)
+        self.timeline_ = []
+
+    def __str__(self):
+        return '%s[pathname: %s, lines: %s, seconds: %s, progress: %s]' % (
+            self.__class__.__name__, self.pathname_, self.lines_,
+            self.seconds_, self.total_progress_)
+
+    def get_lines_per_second(self):
+        """Get the number of log lines replayed per second."""
+        if not self.seconds_:
+            return 0.0
+
+        return self.lines_ / self.seconds_
+
+
+def replay_file(file_matcher, pathname,
+                min_progress=0.0, max_progress=1.0):
+    """Replay a log file through the file matcher.
+
+    :param file_matcher: :class:`FileMatcher` instance to replay with.
+    :param pathname: the path of the captured log file.
+    :param min_progress: the min progress of the item the file is in.
+    :param max_progress: the max progress of the item the file is in.
+
+    :returns: :class:`FileReplayResult` instance.
+    """
+    profiles = dict([
+        (name, LineMatcherProfile(name, line_matcher))
+        for name, line_matcher in file_matcher.line_matchers_.items()
+    ])
+    profiled_file_matcher = FileMatcher(
+        line_matchers=profiles,
+        min_progress=file_matcher.min_progress_,
+        max_progress=file_matcher.max_progress_,
+        filename=file_matcher.filename_)
+    result = FileReplayResult(pathname, file_matcher, profiles)
+    file_progress = result.file_progress_
+    total_progress = result.total_progress_
+    line_matcher_name = 'start'
+    start = time.time()
+    with open(pathname) as logfile:
+        for line in logfile:
+            result.lines_ += 1
+            if line_matcher_name not in profiles:
+                logging.debug('%s exits at line %s with line matcher %s',
+                              pathname, result.lines_, line_matcher_name)
+                break
+
+            line_matcher_name = profiled_file_matcher.update_lines_progress(
+                [line], line_matcher_name, file_progress)
+            old_total_progress = (total_progress.progress,
+                                  total_progress.message)
+            profiled_file_matcher.update_total_progress(
+                file_progress, total_progress, min_progress, max_progress)
+            if old_total_progress != (total_progress.progress,
+                                      total_progress.message):
+                result.timeline_.append((
+                    result.lines_, line_matcher_name,
+                    Progress(file_progress.progress,
+                             file_progress.message,
+                             file_progress.severity),
+                    Progress(total_progress.progress,
+                             total_progress.message,
+                             total_progress.severity)))
+
+    result.seconds_ = time.time() - start
+    result.line_matcher_name_ = line_matcher_name
+    return result
+
+
+def get_file_matchers(adapter):
+    """Get all file matchers of the adapter matcher.
+
+    :param adapter: :class:`AdapterMatcher` instance.
+
+    :returns: dict of log filename to (file_matcher, min_progress,
+              max_progress), where the progress range is the range
+              of the os or package installing the file belongs to.
+    """
+    file_matchers = {}
+    for item_matcher in [adapter.os_matcher_, adapter.package_matcher_]:
+        for file_matcher in item_matcher.matcher_.file_matchers_:
+            file_matchers[file_matcher.filename_] = (
+                file_matcher, item_matcher.min_progress_,
+                item_matcher.max_progress_)
+
+    return file_matchers
@@ -2,7 +2,10 @@
 
    .. moduleauthor:: Xiaodong Wang <xiaodongwang@huawei.com>
 """
-from celery.signals import setup_logging
+import logging
+import time
+
+from celery.signals import setup_logging, task_postrun, task_prerun
 
 from compass.actions import poll_switch
 from compass.actions import trigger_install
@@ -11,6 +14,7 @@ from compass.db import database
 from compass.tasks.client import celery
 from compass.utils import flags
 from compass.utils import logsetting
+from compass.utils import metrics
 from compass.utils import setting_wrapper as setting
 
 
@@ -24,6 +28,46 @@ def tasks_setup_logging(**_):
 setup_logging.connect(tasks_setup_logging)
 
 
+TASK_COUNTER = metrics.REGISTRY.counter(
+    'compass_tasks_total',
+    'Number of the finished celery tasks by task and state.')
+TASK_DURATION = metrics.REGISTRY.histogram(
+    'compass_task_duration_seconds',
+    'Seconds spent running the celery tasks by task.')
+TASK_START_TIMES = {}
+
+
+def tasks_start_query_stats(task=None, **_):
+    """Start counting the statements executed by the task."""
+    database.start_query_stats(task.name)
+
+
+def tasks_stop_query_stats(task=None, **_):
+    """Stop counting the statements executed by the task."""
+    database.stop_query_stats()
+
+
+def tasks_start_timer(task_id=None, **_):
+    """Record the start time of the task."""
+    TASK_START_TIMES[task_id] = time.time()
+
+
+def tasks_record_metrics(task_id=None, task=None, state=None, **_):
+    """Count the finished task and observe its duration."""
+    start_time = TASK_START_TIMES.pop(task_id, None)
+    TASK_COUNTER.inc(task=task.name, state=state or 'UNKNOWN')
+    if start_time is not None:
+        TASK_DURATION.observe(time.time() - start_time, task=task.name)
+
+    metrics.dump_if_due()
+
+
+task_prerun.connect(tasks_start_query_stats)
+task_prerun.connect(tasks_start_timer)
+task_postrun.connect(tasks_stop_query_stats)
+task_postrun.connect(tasks_record_metrics)
+
+
 @celery.task(name="compass.tasks.pollswitch")
 def pollswitch(ip_addr, req_obj='mac', oper="SCAN"):
     """Query switch and return expected result.
@@ -39,6 +83,26 @@ def pollswitch(ip_addr, req_obj='mac', oper="SCAN"):
         poll_switch.poll_switch(ip_addr, req_obj='mac', oper="SCAN")
 
 
+@celery.task(name="compass.tasks.pollswitches")
+def pollswitches(ip_addrs, req_obj='mac', oper="SCAN"):
+    """Query the switches one after another.
+
+    :param ip_addrs: the switch ip addresses.
+    :type ip_addrs: list of str
+    :param reqObj: the object requested to query from switch.
+    :type reqObj: str
+    :param oper: the operation to query the switch (SCAN, GET, SET).
+    :type oper: str
+    """
+    for ip_addr in ip_addrs:
+        try:
+            with database.session():
+                poll_switch.poll_switch(ip_addr, req_obj=req_obj, oper=oper)
+        except Exception as error:
+            logging.error('failed to poll switch %s', ip_addr)
+            logging.exception(error)
+
+
 @celery.task(name="compass.tasks.trigger_install")
 def triggerinstall(clusterid):
     """Deploy the given cluster.
@@ -58,3 +122,13 @@ def progressupdate(clusterid):
     :type clusterid: int
     """
     progress_update.update_progress(clusterid)
+
+
+@celery.task(name="compass.tasks.progress_update_clusters")
+def progressupdateclusters(clusterids):
+    """Calculate the installing progress of the given clusters.
+
+    :param clusterids: the ids of the clusters to get the progress.
+    :type clusterids: list of int
+    """
+    progress_update.update_clusters_progress(clusterids)
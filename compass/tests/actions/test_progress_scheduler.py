@@ -0,0 +1,95 @@
+from mock import Mock
+import unittest2
+
+from compass.actions.progress_scheduler import ProgressUpdateScheduler
+from compass.db import database
+from compass.db.lease import WorkLease
+from compass.db.model import Cluster
+from compass.db.model import ClusterState
+
+
+class TestProgressUpdateScheduler(unittest2.TestCase):
+
+    def setUp(self):
+        super(TestProgressUpdateScheduler, self).setUp()
+        database.init('sqlite://')
+        database.create_db()
+        with database.session() as session:
+            for name, state in [('cluster_01', 'INSTALLING'),
+                                ('cluster_02', 'INSTALLING'),
+                                ('cluster_03', 'READY'),
+                                ('cluster_04', 'INSTALLING')]:
+                cluster = Cluster(name=name)
+                cluster.state = ClusterState(state=state)
+                session.add(cluster)
+
+        self.result = Mock()
+        self.result.ready.return_value = True
+        self.send_task = Mock(return_value=self.result)
+        self.scheduler = ProgressUpdateScheduler(
+            30, 10, 120, workers=2, send_task=self.send_task)
+
+    def tearDown(self):
+        database.drop_db()
+        super(TestProgressUpdateScheduler, self).tearDown()
+
+    def _set_progress(self, clusterid, progress):
+        with database.session() as session:
+            session.query(ClusterState).filter_by(id=clusterid).update(
+                {'progress': progress})
+
+    def test_dispatch_installing_clusters(self):
+        self.assertEqual([[1, 4], [2]], self.scheduler.dispatch(now=0))
+        self.assertEqual(2, self.send_task.call_count)
+        self.assertEqual([], self.scheduler.dispatch(now=10))
+
+    def test_skip_in_flight(self):
+        self.result.ready.return_value = False
+        self.scheduler.dispatch(now=0)
+        self.assertEqual([], self.scheduler.dispatch(now=60))
+        # the update is not in flight anymore after the task timeout.
+        self.assertEqual([[1, 4], [2]], self.scheduler.dispatch(now=180))
+
+    def test_adaptive_interval(self):
+        self.scheduler.dispatch(now=0)
+        self._set_progress(1, 0.5)
+        self.scheduler.dispatch(now=1)
+        schedules = self.scheduler.schedules_
+        self.assertEqual(15, schedules[1].interval_)
+        self.assertEqual(60, schedules[2].interval_)
+        self.assertEqual([[1]], self.scheduler.dispatch(now=15))
+        self.assertEqual(10, self.scheduler.get_sleep_seconds(now=15))
+
+        for now in range(16, 1000):
+            self.scheduler.dispatch(now=now)
+
+        self.assertEqual(120, schedules[1].interval_)
+        self.assertEqual(120, schedules[2].interval_)
+
+    def test_cluster_finished(self):
+        self.scheduler.dispatch(now=0)
+        with database.session() as session:
+            session.query(ClusterState).filter_by(id=1).update(
+                {'state': 'READY'})
+
+        self.scheduler.dispatch(now=1)
+        self.assertItemsEqual([2, 4], self.scheduler.schedules_.keys())
+
+    def test_lease(self):
+        WorkLease('progress_update', 60, owner='node1:1').heartbeat()
+        scheduler = ProgressUpdateScheduler(
+            30, 10, 120, workers=2, send_task=self.send_task,
+            lease=WorkLease('progress_update', 60, owner='node2:1'))
+        self.assertEqual([[1]], scheduler.dispatch(now=0))
+
+    def test_no_installing_clusters(self):
+        with database.session() as session:
+            session.query(ClusterState).update({'state': 'READY'})
+
+        self.assertEqual([], self.scheduler.dispatch(now=0))
+        self.assertEqual(30, self.scheduler.get_sleep_seconds(now=0))
+        self.assertFalse(self.send_task.called)
+
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -1,20 +1,28 @@
 import logging
+import os
 import simplejson as json
+import time
+import zlib
 from copy import deepcopy
+from datetime import datetime, timedelta
 from celery import current_app
 
 from mock import Mock
 import unittest2
 
 from compass.api import app
+from compass.api import util
 from compass.db import database
 from compass.db.model import Switch
 from compass.db.model import Machine
 from compass.db.model import Cluster
 from compass.db.model import ClusterHost
 from compass.db.model import HostState
+from compass.db.model import ClusterState
 from compass.db.model import Adapter
 from compass.db.model import Role
+from compass.utils import metrics
+from compass.utils import setting_wrapper as setting
 
 
 class ApiTestCase(unittest2.TestCase):
@@ -43,6 +51,15 @@ class ApiTestCase(unittest2.TestCase):
         database.drop_db()
         super(ApiTestCase, self).tearDown()
 
+    def assertMaxQueryCount(self, resp, max_count):
+        """Assert the request executed at most max_count statements."""
+        count = int(resp.headers['X-DB-Query-Count'])
+        self.assertLessEqual(
+            count, max_count,
+            '%s statements are executed, expected at most %s' % (
+                count, max_count))
+        self.assertIn('X-DB-Query-Time', resp.headers)
+
 
 class TestSwtichMachineAPI(ApiTestCase):
 
@@ -151,6 +168,50 @@ class TestSwtichMachineAPI(ApiTestCase):
         rv = self.app.post(url, data=json.dumps(data))
         self.assertEqual(rv.status_code, 400)
 
+    def test_post_switches_batch(self):
+        url = '/switches/batch'
+        ips = ['10.20.0.%s' % index for index in range(1, 46)]
+        switches = [
+            {'ip': ip_addr, 'credential': self.SWITCH_CREDENTIAL}
+            for ip_addr in ips
+        ]
+        switches.extend([
+            {'ip': '192.543.1.1', 'credential': self.SWITCH_CREDENTIAL},
+            {'ip': ips[0], 'credential': self.SWITCH_CREDENTIAL},
+            {'ip': self.SWITCH_IP_ADDRESS1,
+             'credential': self.SWITCH_CREDENTIAL},
+            {'ip': '10.20.1.1'}])
+        rv = self.app.post(url, data=json.dumps({'switches': switches}))
+        self.assertEqual(rv.status_code, 202)
+        self.assertMaxQueryCount(rv, 50)
+        results = json.loads(rv.get_data())['switches']
+        self.assertEqual(
+            [result['status'] for result in results],
+            ['accepted'] * 45 + ['invalid', 'invalid', 'conflict', 'invalid'])
+        self.assertEqual(results[-2]['id'], 1)
+
+        with database.session() as session:
+            self.assertEqual(
+                session.query(Switch).filter(Switch.ip.in_(ips)).count(), 45)
+
+        # First polls are sent in batches, each one delayed more
+        calls = current_app.send_task.call_args_list
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(
+            [ip_addr for call in calls for ip_addr in call[0][1][0]], ips)
+        countdowns = [call[1]['countdown'] for call in calls]
+        self.assertEqual(countdowns, sorted(countdowns))
+        self.assertLess(countdowns[0], countdowns[-1])
+
+        # Nothing is accepted
+        rv = self.app.post(url, data=json.dumps({'switches': switches[:1]}))
+        self.assertEqual(rv.status_code, 400)
+        results = json.loads(rv.get_data())['switches']
+        self.assertEqual(results[0]['status'], 'conflict')
+
+        rv = self.app.post(url, data=json.dumps({'switches': []}))
+        self.assertEqual(rv.status_code, 400)
+
     def test_get_switch_by_id(self):
         # Test Get /switches/{id}
         # Non-exist switch id
@@ -245,6 +306,176 @@ class TestSwtichMachineAPI(ApiTestCase):
             count = len(data['machines'])
             self.assertEqual(rv.status_code, 200)
             self.assertEqual(count, expected)
+            self.assertMaxQueryCount(rv, 1)
+
+    def test_get_machineList_pages(self):
+        with database.session() as session:
+            session.add_all([
+                Machine(mac='00:27:88:0c:%02x' % index, port=str(index),
+                        vlan='1', switch_id=1)
+                for index in range(7)])
+
+        url = '/machines?vladId=1&limit=3'
+        macs = []
+        while url:
+            rv = self.app.get(url)
+            self.assertEqual(rv.status_code, 200)
+            data = json.loads(rv.get_data())
+            self.assertLessEqual(len(data['machines']), 3)
+            macs.extend([machine['mac'] for machine in data['machines']])
+            url = data.get('link', {}).get('href')
+
+        self.assertEqual(['00:27:88:0c:%02x' % index for index in range(7)],
+                         macs)
+
+        rv = self.app.get('/machines?marker=-1')
+        self.assertEqual(rv.status_code, 400)
+
+    def test_get_switchList_networks(self):
+        with database.session() as session:
+            session.add_all([
+                Switch(ip='10.%s.%s.1' % (second, third))
+                for second in range(3) for third in range(3)])
+
+        for url, expected in [
+            ('/switches?switchIpNetwork=10.1.0.0/16', 3),
+            ('/switches?switchIpNetwork=10.1.2.0/24', 1),
+            ('/switches?switchIpNetwork=10.0.0.0/16'
+             '&switchIpNetwork=10.2.1.0/24', 4),
+            ('/switches?switchIpNetwork=10.0.0.0/8', 10),
+            ('/switches?switchIpNetwork=10.3.0.0/16', 0),
+        ]:
+            rv = self.app.get(url)
+            self.assertEqual(200, rv.status_code)
+            self.assertEqual(
+                expected, len(json.loads(rv.get_data())['switches']))
+
+        with database.session() as session:
+            switch = session.query(Switch).filter_by(ip='10.1.2.1').first()
+            switch.ip = '10.3.0.1'
+
+        rv = self.app.get('/switches?switchIpNetwork=10.3.0.0/16')
+        self.assertEqual(1, len(json.loads(rv.get_data())['switches']))
+
+        rv = self.app.get('/switches?switchIpNetwork=10.3.0.0/16'
+                          '&switchIpNetwork=10.3.0')
+        self.assertEqual(400, rv.status_code)
+
+    def test_get_switchList_pages(self):
+        with database.session() as session:
+            session.add_all([
+                Switch(ip='192.168.1.%s' % index) for index in range(1, 6)])
+
+        for url, expected in [
+            ('/switches?switchIpNetwork=192.168.1.0/24&limit=2',
+             ['192.168.1.%s' % index for index in range(1, 6)]),
+            ('/switches?limit=4',
+             [self.SWITCH_IP_ADDRESS1] +
+             ['192.168.1.%s' % index for index in range(1, 6)])
+        ]:
+            ips = []
+            while url:
+                rv = self.app.get(url)
+                self.assertEqual(rv.status_code, 200)
+                data = json.loads(rv.get_data())
+                ips.extend([switch['ip'] for switch in data['switches']])
+                url = data.get('link', {}).get('href')
+
+            self.assertEqual(expected, ips)
+
+
+class TestResponseFormat(ApiTestCase):
+
+    def setUp(self):
+        super(TestResponseFormat, self).setUp()
+        with database.session() as session:
+            session.add_all([
+                Switch(ip='192.168.%s.%s' % (index / 250, index % 250 + 1))
+                for index in range(300)])
+
+    def tearDown(self):
+        super(TestResponseFormat, self).tearDown()
+
+    def test_compact(self):
+        rv = self.app.get('/switches')
+        self.assertEqual(rv.status_code, 200)
+        self.assertTrue(rv.is_streamed)
+        self.assertNotIn('\n', rv.get_data())
+        self.assertEqual(300, len(json.loads(rv.get_data())['switches']))
+
+        rv = self.app.get('/switches/1')
+        self.assertNotIn('\n', rv.get_data())
+
+    def test_pretty(self):
+        rv = self.app.get('/switches?pretty=true')
+        self.assertIn('\n    ', rv.get_data())
+        self.assertEqual(300, len(json.loads(rv.get_data())['switches']))
+
+    def test_gzip(self):
+        rv = self.app.get('/switches',
+                          headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual('gzip', rv.headers['Content-Encoding'])
+        self.assertIn('Accept-Encoding', rv.headers['Vary'])
+        data = zlib.decompress(rv.get_data(), 16 + zlib.MAX_WBITS)
+        self.assertEqual(300, len(json.loads(data)['switches']))
+
+        rv = self.app.get('/switches/1',
+                          headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', rv.headers)
+        self.assertEqual(1, json.loads(rv.get_data())['switch']['id'])
+
+        rv = self.app.get('/switches')
+        self.assertNotIn('Content-Encoding', rv.headers)
+
+    def test_stream_with_link(self):
+        rv = self.app.get('/switches?limit=100')
+        data = json.loads(rv.get_data())
+        self.assertEqual(100, len(data['switches']))
+        self.assertEqual('next', data['link']['rel'])
+
+    def test_stream_items_as_generated(self):
+        generated = []
+
+        def generate_items():
+            for index in range(250):
+                generated.append(index)
+                yield {'id': index}
+
+        with app.test_request_context('/'):
+            rv = util.make_json_stream_response(
+                200, {'status': 'OK', 'items': generate_items()}, 'items',
+                lambda: {'count': len(generated)})
+
+        self.assertEqual([], generated)
+        chunks = iter(rv.response)
+        self.assertEqual('{"status":"OK","items":[', next(chunks))
+        self.assertEqual([], generated)
+        first_chunk = next(chunks)
+        self.assertEqual(util.STREAM_CHUNK_SIZE, len(generated))
+        chunks = [first_chunk] + list(chunks)
+        data = json.loads('{"status":"OK","items":[' + ''.join(chunks))
+        self.assertEqual(range(250), [item['id'] for item in data['items']])
+        self.assertEqual(250, data['count'])
+
+    def test_metrics(self):
+        self.app.get('/switches/1')
+        self.app.get('/switches/1')
+        self.app.get('/switches/1000')
+        rv = self.app.get('/metrics')
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.mimetype, 'text/plain')
+        text = rv.get_data()
+        self.assertIn('# TYPE compass_api_requests_total counter', text)
+        self.assertIn(
+            '# TYPE compass_api_request_duration_seconds histogram', text)
+        labels = 'pid="%s",process="%s"' % (
+            os.getpid(), metrics.get_process_name())
+        self.assertIn(
+            'compass_api_requests_total{endpoint="/switches/<string:'
+            'switch_id>",method="GET",%s,status="404"}' % labels, text)
+        self.assertIn(
+            'compass_api_request_duration_seconds_count{endpoint='
+            '"/switches/<string:switch_id>",method="GET",%s}' % labels, text)
 
 
 class TestClusterAPI(ApiTestCase):
@@ -503,6 +734,54 @@ class TestClusterAPI(ApiTestCase):
         rv = self.app.post(url, data=json.dumps(request))
         self.assertEqual(rv.status_code, 404)
 
+    def test_cluster_action_bulk_hosts(self):
+        with database.session() as session:
+            session.add_all([
+                Machine(mac='00:27:88:0d:%02x' % index)
+                for index in range(1, 51)
+            ])
+            session.add(ClusterHost(cluster_id=1, machine_id=50,
+                                    hostname='host_c1_50'))
+
+        url = '/clusters/1/action'
+        # Machines already used are reported in request order
+        request = {'addHosts': [50, 1, 2]}
+        rv = self.app.post(url, data=json.dumps(request))
+        self.assertEqual(rv.status_code, 409)
+        data = json.loads(rv.get_data())
+        self.assertEqual(data['failedMachines'], [50])
+
+        # Adding hosts does not query per machine
+        machine_ids = range(1, 50)
+        request = {'addHosts': machine_ids}
+        rv = self.app.post(url, data=json.dumps(request))
+        self.assertEqual(rv.status_code, 200)
+        self.assertMaxQueryCount(rv, 6)
+        data = json.loads(rv.get_data())
+        self.assertEqual(
+            [host['machine_id'] for host in data['cluster_hosts']],
+            machine_ids)
+        host_ids = [host['id'] for host in data['cluster_hosts']]
+        self.assertEqual(len(set(host_ids)), len(machine_ids))
+
+        # Missing hosts are listed and nothing is removed
+        request = {'removeHosts': host_ids[:2] + [1000]}
+        rv = self.app.post(url, data=json.dumps(request))
+        self.assertEqual(rv.status_code, 404)
+        data = json.loads(rv.get_data())
+        self.assertEqual(data['failedHosts'], [1000])
+
+        request = {'removeHosts': host_ids}
+        rv = self.app.post(url, data=json.dumps(request))
+        self.assertEqual(rv.status_code, 200)
+        self.assertMaxQueryCount(rv, 4)
+        data = json.loads(rv.get_data())
+        self.assertEqual(len(data['cluster_hosts']), len(machine_ids))
+        with database.session() as session:
+            self.assertEqual(
+                session.query(ClusterHost).filter_by(cluster_id=1).count(),
+                1)
+
 
 class ClusterHostAPITest(ApiTestCase):
 
@@ -688,6 +967,281 @@ class ClusterHostAPITest(ApiTestCase):
         self.assertEqual('INSTALLING', data['progress']['state'])
         self.assertEqual(0.3, data['progress']['percentage'])
 
+    def test_host_installing_progress_not_modified(self):
+        url = '/clusterhosts/1/progress'
+        with database.session() as session:
+            session.add(HostState(id=1, state='INSTALLING', progress=0.3))
+
+        rv = self.app.get(url)
+        self.assertEqual(200, rv.status_code)
+        etag = rv.headers['ETag']
+        last_modified = rv.headers['Last-Modified']
+
+        rv = self.app.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(304, rv.status_code)
+        self.assertEqual('', rv.get_data())
+        self.assertEqual(etag, rv.headers['ETag'])
+
+        rv = self.app.get(url, headers={'If-Modified-Since': last_modified})
+        self.assertEqual(304, rv.status_code)
+
+        with database.session() as session:
+            session.query(HostState).filter_by(id=1).update(
+                {'progress': 0.5}, synchronize_session=False)
+
+        rv = self.app.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(200, rv.status_code)
+        self.assertNotEqual(etag, rv.headers['ETag'])
+        self.assertEqual(
+            0.5, json.loads(rv.get_data())['progress']['percentage'])
+
+    def test_last_modified_in_utc(self):
+        url = '/clusterhosts/1/progress'
+        old_tz = os.environ.get('TZ')
+        os.environ['TZ'] = 'Asia/Shanghai'
+        time.tzset()
+        try:
+            with database.session() as session:
+                session.add(HostState(
+                    id=1, state='INSTALLING', progress=0.3,
+                    update_timestamp=datetime(2014, 1, 1, 8, 0, 0)))
+
+            rv = self.app.get(url)
+            self.assertEqual('Wed, 01 Jan 2014 00:00:00 GMT',
+                             rv.headers['Last-Modified'])
+
+            rv = self.app.get(url, headers={
+                'If-Modified-Since': 'Wed, 01 Jan 2014 00:00:00 GMT'})
+            self.assertEqual(304, rv.status_code)
+            rv = self.app.get(url, headers={
+                'If-Modified-Since': 'Tue, 31 Dec 2013 23:59:59 GMT'})
+            self.assertEqual(200, rv.status_code)
+        finally:
+            if old_tz is None:
+                del os.environ['TZ']
+            else:
+                os.environ['TZ'] = old_tz
+
+            time.tzset()
+
+    def test_list_cluster_hosts_installing_progress(self):
+        with database.session() as session:
+            session.add(HostState(id=1, state='INSTALLING', progress=0.2,
+                                  message='Configuring...'))
+            session.add(HostState(id=4, state='READY', progress=1.0))
+            session.add(Cluster(name='cluster_03'))
+
+        rv = self.app.get('/clusters/1/hosts/progress')
+        self.assertEqual(200, rv.status_code)
+        self.assertMaxQueryCount(rv, 1)
+        progresses = json.loads(rv.get_data())['progresses']
+        self.assertEqual(
+            [(1, 'host_01', 'INSTALLING', 0.2, 'Configuring...'),
+             (2, 'host_02', 'UNINITIALIZED', 0, 'Waiting..............'),
+             (3, 'host_03', 'UNINITIALIZED', 0, 'Waiting..............')],
+            [(progress['id'], progress['hostname'], progress['state'],
+              progress['percentage'], progress['message'])
+             for progress in progresses])
+
+        rv = self.app.get('/clusters/3/hosts/progress')
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual([], json.loads(rv.get_data())['progresses'])
+
+        rv = self.app.get('/clusters/1000/hosts/progress')
+        self.assertEqual(404, rv.status_code)
+
+    def test_list_clusters_with_progress(self):
+        with database.session() as session:
+            session.add(ClusterState(id=2, state='INSTALLING', progress=0.4))
+
+        rv = self.app.get('/clusters?include=progress')
+        self.assertEqual(200, rv.status_code)
+        self.assertMaxQueryCount(rv, 1)
+        clusters = json.loads(rv.get_data())['clusters']
+        self.assertEqual(
+            [(1, 'UNINITIALIZED', 0), (2, 'INSTALLING', 0.4)],
+            [(cluster['id'], cluster['progress']['state'],
+              cluster['progress']['percentage']) for cluster in clusters])
+
+        rv = self.app.get('/clusters')
+        self.assertNotIn('progress', json.loads(rv.get_data())['clusters'][0])
+
+        rv = self.app.get('/clusters?include=xxx')
+        self.assertEqual(400, rv.status_code)
+
+    def _get_stream_events(self, url, headers=None):
+        rv = self.app.get(url, headers=headers)
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual('text/event-stream', rv.mimetype)
+        events = []
+        for block in rv.get_data().split('\n\n'):
+            fields = dict([
+                line.split(': ', 1) for line in block.split('\n')
+                if line and not line.startswith(':')
+            ])
+            if 'data' in fields:
+                events.append((fields['id'], fields['event'],
+                               json.loads(fields['data'])))
+        return events
+
+    def test_stream_cluster_installing_progress(self):
+        url = '/clusters/1/progress/stream?timeout=0'
+        with database.session() as session:
+            session.add(ClusterState(id=1, state='INSTALLING', progress=0.1))
+            session.add(HostState(id=1, state='INSTALLING', progress=0.2))
+            session.add(HostState(id=4, state='INSTALLING', progress=0.3))
+
+        events = self._get_stream_events(url)
+        self.assertEqual(
+            [('cluster_progress', 1, 0.1), ('host_progress', 1, 0.2)],
+            sorted([(event, data['id'], data['percentage'])
+                    for _, event, data in events]))
+
+        last_event_id = max([event_id for event_id, _, _ in events])
+
+        with database.session() as session:
+            session.query(HostState).filter_by(id=1).update(
+                {'progress': 0.5}, synchronize_session=False)
+
+        events = self._get_stream_events(
+            url, {'Last-Event-ID': last_event_id})
+        self.assertEqual('host_01', events[-1][2]['hostname'])
+        self.assertEqual(0.5, events[-1][2]['percentage'])
+
+        rv = self.app.get(url, headers={'Last-Event-ID': 'xxx'})
+        self.assertEqual(400, rv.status_code)
+        rv = self.app.get('/clusters/1000/progress/stream')
+        self.assertEqual(404, rv.status_code)
+
+    def test_stream_cluster_installing_progress_same_second(self):
+        url = '/clusters/1/progress/stream?timeout=0'
+        timestamp = datetime(2014, 1, 1, 12, 0, 0)
+        with database.session() as session:
+            session.add(ClusterState(
+                id=1, state='INSTALLING', progress=0.1,
+                update_timestamp=timestamp - timedelta(seconds=60)))
+            session.add(HostState(id=1, state='INSTALLING', progress=0.2,
+                                  update_timestamp=timestamp))
+
+        events = self._get_stream_events(url)
+        self.assertEqual(2, len(events))
+        last_event_id = events[-1][0]
+
+        # only the progresses in the lookback window are read again.
+        events = self._get_stream_events(
+            url, {'Last-Event-ID': last_event_id})
+        self.assertEqual(
+            [(last_event_id, 'host_progress', 1)],
+            [(event_id, event, data['id'])
+             for event_id, event, data in events])
+
+        # an update in the same second as the last event and an update
+        # stamped before it but committed after it are not lost.
+        with database.session() as session:
+            session.add(HostState(id=2, state='INSTALLING', progress=0.3,
+                                  update_timestamp=timestamp))
+            session.query(ClusterState).filter_by(id=1).update({
+                'progress': 0.2,
+                'update_timestamp': timestamp - timedelta(seconds=5)
+            }, synchronize_session=False)
+
+        events = self._get_stream_events(
+            url, {'Last-Event-ID': last_event_id})
+        self.assertEqual(
+            [('cluster_progress', 1), ('host_progress', 1),
+             ('host_progress', 2)],
+            sorted([(event, data['id']) for _, event, data in events]))
+
+    def test_stream_cluster_installing_progress_deduplicated(self):
+        with database.session() as session:
+            session.add(ClusterState(id=1, state='INSTALLING', progress=0.1))
+            session.add(HostState(id=1, state='INSTALLING', progress=0.2))
+
+        old_interval = setting.PROGRESS_STREAM_INTERVAL
+        setting.PROGRESS_STREAM_INTERVAL = 0.1
+        self.addCleanup(setattr, setting, 'PROGRESS_STREAM_INTERVAL',
+                        old_interval)
+        events = self._get_stream_events(
+            '/clusters/1/progress/stream?timeout=1')
+        self.assertEqual(
+            [('cluster_progress', 1), ('host_progress', 1)],
+            sorted([(event, data['id']) for _, event, data in events]))
+
+    def test_clusterHost_config_not_modified(self):
+        url = '/clusterhosts/1/config'
+        rv = self.app.get(url)
+        etag = rv.headers['ETag']
+        rv = self.app.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(304, rv.status_code)
+
+        rv = self.app.put(url, data=json.dumps({'roles': ['base']}))
+        self.assertEqual(200, rv.status_code)
+        rv = self.app.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual(
+            ['base'], json.loads(rv.get_data())['config']['roles'])
+
+
+    def test_update_hosts_installing_progress(self):
+        url = '/clusterhosts/progress'
+        with database.session() as session:
+            cluster = session.query(Cluster).filter_by(id=1).first()
+            cluster.state = ClusterState(state='INSTALLING')
+            for host in session.query(ClusterHost).filter_by(cluster_id=1):
+                host.state = HostState(state='INSTALLING')
+
+        # 0. Reports are rejected if progresses are not from agents
+        request = {'progresses': [{'hostname': 'host_01', 'progress': 0.6}]}
+        rv = self.app.post(url, data=json.dumps(request))
+        self.assertEqual(400, rv.status_code)
+        with database.session() as session:
+            host = session.query(HostState).filter_by(id=1).first()
+            self.assertEqual(0.0, host.progress)
+
+        old_from_agents = setting.PROGRESS_UPDATE_FROM_AGENTS
+        setting.PROGRESS_UPDATE_FROM_AGENTS = True
+        self.addCleanup(setattr, setting, 'PROGRESS_UPDATE_FROM_AGENTS',
+                        old_from_agents)
+
+        # 1. Invalid progress
+        request = {'progresses': [{'hostname': 'host_01', 'progress': 2}]}
+        rv = self.app.post(url, data=json.dumps(request))
+        self.assertEqual(400, rv.status_code)
+
+        # 2. Update progresses of existing and non-existing hosts
+        request = {'progresses': [
+            {'hostname': 'host_01', 'progress': 0.6,
+             'message': 'Installing', 'severity': 'INFO', 'checkpoint': 10},
+            {'hostname': 'host_02', 'progress': 1.0,
+             'message': 'Done', 'severity': 'INFO', 'checkpoint': 20},
+            {'hostname': 'host_04', 'progress': 0.5,
+             'message': 'Installing', 'severity': 'INFO', 'checkpoint': 30},
+            {'hostname': 'host_10', 'progress': 0.5,
+             'message': 'Installing', 'severity': 'INFO', 'checkpoint': 40}]}
+        rv = self.app.post(url, data=json.dumps(request))
+        self.assertEqual(200, rv.status_code)
+        results = json.loads(rv.get_data())['progresses']
+        self.assertEqual(
+            {'status': 'updated', 'checkpoint': 10}, results['host_01'])
+        self.assertEqual('updated', results['host_02']['status'])
+        self.assertEqual('unchanged', results['host_04']['status'])
+        self.assertEqual('not found', results['host_10']['status'])
+        with database.session() as session:
+            host = session.query(HostState).filter_by(id=1).first()
+            self.assertEqual('INSTALLING', host.state)
+            self.assertEqual(0.6, host.progress)
+            host = session.query(HostState).filter_by(id=2).first()
+            self.assertEqual('READY', host.state)
+            cluster = session.query(ClusterState).filter_by(id=1).first()
+            self.assertAlmostEqual(1.6 / 3, cluster.progress)
+
+        # 3. Progress going backward is ignored
+        request = {'progresses': [{'hostname': 'host_01', 'progress': 0.2}]}
+        rv = self.app.post(url, data=json.dumps(request))
+        self.assertEqual(200, rv.status_code)
+        results = json.loads(rv.get_data())['progresses']
+        self.assertEqual('unchanged', results['host_01']['status'])
+
 
 class TestAdapterAPI(ApiTestCase):
 
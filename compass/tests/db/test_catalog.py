@@ -0,0 +1,94 @@
+import unittest2
+
+from mock import MagicMock
+
+from compass.db import catalog
+from compass.db import database
+from compass.db.model import Adapter, Role
+
+
+class TestAdapterCatalog(unittest2.TestCase):
+
+    def setUp(self):
+        super(TestAdapterCatalog, self).setUp()
+        database.init('sqlite://')
+        database.create_db()
+        with database.session() as session:
+            session.add_all([
+                Adapter(name='Centos_openstack', os='Centos',
+                        target_system='openstack'),
+                Adapter(name='Centos_hadoop', os='Centos',
+                        target_system='hadoop')])
+            session.add_all([
+                Role(name='Control', target_system='openstack'),
+                Role(name='Compute', target_system='openstack')])
+
+        self.catalog = catalog.AdapterCatalog()
+
+    def tearDown(self):
+        database.drop_db()
+        super(TestAdapterCatalog, self).tearDown()
+
+    def test_get(self):
+        self.assertEqual(['Centos_openstack', 'Centos_hadoop'],
+                         [adapter['name']
+                          for adapter in self.catalog.get_adapters()])
+        self.assertEqual(
+            [{'id': 2, 'name': 'Centos_hadoop', 'os': 'Centos',
+              'target_system': 'hadoop'}],
+            self.catalog.get_adapters('Centos_hadoop'))
+        self.assertEqual('Centos_hadoop',
+                         self.catalog.get_adapter(2)['name'])
+        self.assertIsNone(self.catalog.get_adapter(3))
+        self.assertEqual(['Control', 'Compute'],
+                         [role['name'] for role in self.catalog.get_roles(1)])
+        self.assertEqual([], self.catalog.get_roles(2))
+        self.assertIsNone(self.catalog.get_roles(3))
+
+    def test_cached(self):
+        self.catalog.refresh()
+        with database.query_stats('test') as stats:
+            self.catalog.get_adapters()
+            self.catalog.get_roles(1)
+
+        # only the catalog version is queried.
+        self.assertEqual(2, stats.count_)
+
+    def test_cached_without_lock(self):
+        self.catalog.refresh()
+        self.catalog.lock_ = MagicMock()
+        self.assertEqual(2, len(self.catalog.get_adapters()))
+        self.assertFalse(self.catalog.lock_.__enter__.called)
+
+        with database.session() as session:
+            session.add(Adapter(name='Ubuntu_openstack', os='Ubuntu',
+                                target_system='openstack'))
+
+        self.assertEqual(3, len(self.catalog.get_adapters()))
+        self.assertTrue(self.catalog.lock_.__enter__.called)
+
+    def test_invalidated(self):
+        self.assertEqual(2, len(self.catalog.get_adapters()))
+        with database.session() as session:
+            session.add(Adapter(name='Ubuntu_openstack', os='Ubuntu',
+                                target_system='openstack'))
+
+        self.assertEqual(3, len(self.catalog.get_adapters()))
+
+        with database.session() as session:
+            session.query(Adapter).delete()
+            session.query(Role).delete()
+            catalog.bump_version(session)
+
+        self.assertEqual([], self.catalog.get_adapters())
+        self.assertIsNone(self.catalog.get_roles(1))
+
+    def test_database_changed(self):
+        self.assertEqual(2, len(self.catalog.get_adapters()))
+        database.init('sqlite://')
+        database.create_db()
+        self.assertEqual([], self.catalog.get_adapters())
+
+
+if __name__ == '__main__':
+    unittest2.main()
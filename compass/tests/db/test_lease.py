@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta
+
+import unittest2
+
+from compass.db import database
+from compass.db.lease import WorkLease
+from compass.db.model import DaemonClaim
+from compass.db.model import DaemonLease
+
+
+class TestWorkLease(unittest2.TestCase):
+
+    def setUp(self):
+        super(TestWorkLease, self).setUp()
+        database.init('sqlite://')
+        database.create_db()
+        self.now = datetime(2014, 1, 1)
+
+    def tearDown(self):
+        database.drop_db()
+        super(TestWorkLease, self).tearDown()
+
+    def test_single_instance(self):
+        lease = WorkLease('poll_switch', 60, owner='node1:1')
+        self.assertEqual((0, 1), lease.heartbeat(self.now))
+        self.assertEqual([1, 2, 3], lease.filter([1, 2, 3]))
+
+    def test_partition(self):
+        leases = [
+            WorkLease('poll_switch', 60, owner='node%s:1' % index)
+            for index in range(3)
+        ]
+        for lease in leases:
+            lease.heartbeat(self.now)
+
+        for lease in leases:
+            lease.heartbeat(self.now)
+
+        itemids = range(1, 101)
+        shares = [lease.filter(itemids) for lease in leases]
+        self.assertEqual(sorted(sum(shares, [])), itemids)
+        for share in shares:
+            self.assertGreater(len(share), 30)
+
+        # other daemons do not share the work.
+        other = WorkLease('progress_update', 60, owner='node0:1')
+        self.assertEqual((0, 1), other.heartbeat(self.now))
+
+    def test_rebalance(self):
+        lease1 = WorkLease('poll_switch', 60, owner='node1:1')
+        lease2 = WorkLease('poll_switch', 60, owner='node2:1')
+        lease1.heartbeat(self.now)
+        self.assertEqual((1, 2), lease2.heartbeat(self.now))
+
+        # node1 dies and its lease expires.
+        self.assertEqual(
+            (1, 2), lease2.heartbeat(self.now + timedelta(seconds=30)))
+        self.assertEqual(
+            (0, 1), lease2.heartbeat(self.now + timedelta(seconds=70)))
+        self.assertEqual([1, 2], lease2.filter([1, 2]))
+
+        # node1 comes back.
+        self.assertEqual(
+            (0, 2), lease1.heartbeat(self.now + timedelta(seconds=80)))
+
+    def test_release(self):
+        lease1 = WorkLease('poll_switch', 60, owner='node1:1')
+        lease2 = WorkLease('poll_switch', 60, owner='node2:1')
+        lease1.heartbeat(self.now)
+        lease2.heartbeat(self.now)
+        lease1.release()
+        self.assertEqual([], lease1.filter([1, 2]))
+        self.assertEqual((0, 1), lease2.heartbeat(self.now))
+        with database.session() as session:
+            self.assertEqual(1, session.query(DaemonLease).count())
+
+    def test_claim_overlapping_shares(self):
+        lease1 = WorkLease('poll_switch', 60, owner='node1:1')
+        lease2 = WorkLease('poll_switch', 60, owner='node2:1')
+        itemids = range(1, 11)
+        self.assertEqual((0, 1), lease1.heartbeat(self.now))
+        self.assertEqual(itemids, lease1.claim(itemids, self.now))
+
+        # node2 joins while node1 still thinks it is alone.
+        self.assertEqual((1, 2), lease2.heartbeat(self.now))
+        self.assertEqual([1, 3, 5, 7, 9], lease2.filter(itemids))
+        self.assertEqual([], lease2.claim(itemids, self.now))
+        self.assertEqual(itemids, lease1.claim(itemids, self.now))
+
+        # node1 catches up and hands over the share of node2.
+        self.assertEqual((0, 2), lease1.heartbeat(self.now))
+        self.assertEqual([2, 4, 6, 8, 10], lease1.claim(itemids, self.now))
+        self.assertEqual([1, 3, 5, 7, 9], lease2.claim(itemids, self.now))
+
+    def test_claim_expired(self):
+        lease1 = WorkLease('poll_switch', 60, owner='node1:1')
+        lease2 = WorkLease('poll_switch', 60, owner='node2:1')
+        lease1.heartbeat(self.now)
+        self.assertEqual([1, 2], lease1.claim([1, 2], self.now))
+        lease2.heartbeat(self.now)
+        self.assertEqual([], lease2.claim([1, 2], self.now))
+
+        # node1 dies, its claims are taken after they expire.
+        later = self.now + timedelta(seconds=30)
+        self.assertEqual((1, 2), lease2.heartbeat(later))
+        self.assertEqual([], lease2.claim([1, 2], later))
+        later = self.now + timedelta(seconds=70)
+        self.assertEqual((0, 1), lease2.heartbeat(later))
+        self.assertEqual([1, 2], lease2.claim([1, 2], later))
+
+    def test_release_claims(self):
+        lease1 = WorkLease('poll_switch', 60, owner='node1:1')
+        lease2 = WorkLease('poll_switch', 60, owner='node2:1')
+        lease1.heartbeat()
+        self.assertEqual([1, 2], lease1.claim([1, 2]))
+        lease2.heartbeat()
+        lease1.release()
+        self.assertEqual((0, 1), lease2.heartbeat())
+        self.assertEqual([1, 2], lease2.claim([1, 2]))
+        with database.session() as session:
+            self.assertEqual(
+                ['node2:1', 'node2:1'],
+                [owner for owner, in session.query(DaemonClaim.owner)])
+
+    def test_check_interval(self):
+        lease = WorkLease('poll_switch', 180, owner='node1:1')
+        lease.check_interval(60)
+        lease.check_interval(90)
+        self.assertRaises(ValueError, lease.check_interval, 120)
+
+    def test_heartbeat_if_due(self):
+        lease = WorkLease('poll_switch', 60, owner='node1:1')
+        self.assertTrue(lease.heartbeat_if_due())
+        self.assertFalse(lease.heartbeat_if_due())
+        lease.heartbeat_time_ -= 30
+        self.assertTrue(lease.heartbeat_if_due())
+
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -0,0 +1,75 @@
+from sqlalchemy.engine import reflection
+import unittest2
+
+from compass.db import database
+from compass.db import migration
+from compass.db import model
+
+
+class TestMigration(unittest2.TestCase):
+
+    def setUp(self):
+        super(TestMigration, self).setUp()
+        database.init('sqlite://')
+
+    def tearDown(self):
+        database.drop_db()
+        super(TestMigration, self).tearDown()
+
+    def _get_table_names(self):
+        return reflection.Inspector.from_engine(
+            database.ENGINE).get_table_names()
+
+    def test_empty_database(self):
+        self.assertEqual(0, migration.get_version())
+        applied = migration.upgrade()
+        self.assertEqual(
+            [version for version, _, _ in migration.MIGRATIONS], applied)
+        self.assertEqual(migration.get_latest_version(),
+                         migration.get_version())
+        self.assertIn('daemon_lease', self._get_table_names())
+        self.assertEqual([], migration.upgrade())
+
+    def test_legacy_database(self):
+        # database created before the schema version is recorded.
+        for table in model.BASE.metadata.sorted_tables:
+            if table.name not in ['daemon_lease', 'schema_version',
+                                  'catalog_version', 'daemon_claim']:
+                table.create(bind=database.ENGINE)
+
+        for table in model.BASE.metadata.sorted_tables:
+            for index in table.indexes:
+                index.drop(bind=database.ENGINE)
+
+        self.assertEqual(1, migration.get_version())
+        self.assertEqual([2, 3, 4, 5, 6], migration.upgrade())
+        self.assertIn('daemon_lease', self._get_table_names())
+        self.assertIn('ix_machine_switch_port', [
+            index['name'] for index in reflection.Inspector.from_engine(
+                database.ENGINE).get_indexes('machine')
+        ])
+        self.assertEqual(6, migration.get_version())
+
+    def test_create_db(self):
+        migration.create_db()
+        self.assertEqual(migration.get_latest_version(),
+                         migration.get_version())
+        self.assertEqual([], migration.upgrade())
+
+    def test_upgrade_to_version(self):
+        self.assertEqual([1], migration.upgrade(1))
+        self.assertNotIn('daemon_lease', self._get_table_names())
+        self.assertEqual([2, 3, 4, 5, 6], migration.upgrade())
+
+    def test_switch_ip_int(self):
+        self.assertEqual([1, 2, 3], migration.upgrade(3))
+        database.ENGINE.execute(
+            "INSERT INTO switch (ip) VALUES ('10.145.8.10')")
+        self.assertEqual([4, 5, 6], migration.upgrade())
+        with database.session() as session:
+            switch = session.query(model.Switch).first()
+            self.assertEqual(0x0a91080a, switch.ip_int)
+
+
+if __name__ == '__main__':
+    unittest2.main()
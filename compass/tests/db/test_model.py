@@ -0,0 +1,186 @@
+import simplejson as json
+
+from mock import patch
+import unittest2
+
+from compass.db import database
+from compass.db import model
+from compass.db.model import Cluster
+from compass.db.model import CompressedText
+from compass.db.model import ClusterHost
+from compass.db.model import Machine
+from compass.db.model import LogProgressingHistory
+from compass.db.model import Switch
+from compass.utils import setting_wrapper as setting
+
+
+class TestJsonColumns(unittest2.TestCase):
+
+    def setUp(self):
+        super(TestJsonColumns, self).setUp()
+        database.init('sqlite://')
+        database.create_db()
+        with database.session() as session:
+            cluster = Cluster(name='cluster_01')
+            cluster.security = {'server_credentials': {'username': 'root'}}
+            cluster.networking = {'global': {'gateway': '192.168.1.1'}}
+            cluster.partition = '/var 20%'
+            host = ClusterHost(hostname='host_01')
+            host.cluster = cluster
+            host.machine = Machine(mac='00:01:02:03:04:05')
+            host.config = {'networking': {'interfaces': {
+                'management': {'ip': '192.168.1.10'}}}}
+            switch = Switch(ip='192.168.1.2')
+            switch.credential = {'version': 'v2c', 'community': 'public'}
+            session.add_all([cluster, host, switch])
+
+    def tearDown(self):
+        database.drop_db()
+        super(TestJsonColumns, self).tearDown()
+
+    def test_parse_once(self):
+        with database.session() as session:
+            host = session.query(ClusterHost).first()
+            cluster = host.cluster
+            switch = session.query(Switch).first()
+            with patch.object(model.json, 'loads',
+                              wraps=json.loads) as loads:
+                for _ in range(3):
+                    cluster.config
+                    host.config
+                    switch.credential
+
+                # security, networking, partition, host config and
+                # switch credential, the raw config is not set.
+                self.assertEqual(5, loads.call_count)
+
+    def test_invalidate_on_write(self):
+        with database.session() as session:
+            host = session.query(ClusterHost).first()
+            self.assertEqual(
+                '192.168.1.10',
+                host.config['networking']['interfaces']['management']['ip'])
+            host.config = {'networking': {'interfaces': {
+                'management': {'ip': '192.168.1.11'}}}}
+            config = host.config
+            self.assertEqual(
+                '192.168.1.11',
+                config['networking']['interfaces']['management']['ip'])
+            self.assertEqual(
+                '00:01:02:03:04:05',
+                config['networking']['interfaces']['management']['mac'])
+
+            # the returned config is a copy of the cached one.
+            config['networking']['interfaces']['management']['ip'] = ''
+            self.assertEqual(
+                '192.168.1.11',
+                host.config['networking']['interfaces']['management']['ip'])
+
+            host.config_data = json.dumps({'roles': ['compute']})
+            self.assertEqual(['compute'], host.config['roles'])
+
+        with database.session() as session:
+            host = session.query(ClusterHost).first()
+            self.assertEqual(['compute'], host.config['roles'])
+
+    def test_cluster_config(self):
+        with database.session() as session:
+            cluster = session.query(Cluster).first()
+            self.assertEqual('/var 20%', cluster.partition)
+            cluster.config = {
+                'security': {'server_credentials': {'username': 'admin'}},
+                'roles': ['compute']}
+            config = cluster.config
+            self.assertEqual(
+                'admin', config['security']['server_credentials']['username'])
+            self.assertEqual({}, config['networking'])
+            self.assertEqual(['compute'], config['roles'])
+            self.assertEqual('cluster_01', config['clustername'])
+
+    def test_switch_credential(self):
+        with database.session() as session:
+            switch = session.query(Switch).first()
+            switch.credential = {'community': 'private'}
+            self.assertEqual({'Version': 'v2c', 'Community': 'private'},
+                             switch.credential)
+
+
+class TestCompressedText(unittest2.TestCase):
+
+    def setUp(self):
+        super(TestCompressedText, self).setUp()
+        database.init('sqlite://')
+        database.create_db()
+        self.config = {'ignore_proxy': [
+            '192.168.1.%s' % index for index in range(1000)]}
+
+    def tearDown(self):
+        database.drop_db()
+        super(TestCompressedText, self).tearDown()
+
+    def _get_raw_config_data(self):
+        with database.session() as session:
+            return session.execute(
+                'select config_data from cluster_host').scalar()
+
+    def test_compress_large_value(self):
+        with database.session() as session:
+            host = ClusterHost(hostname='host_01')
+            host.config = self.config
+            session.add(host)
+
+        config_data = self._get_raw_config_data()
+        self.assertTrue(config_data.startswith(CompressedText.MARKER))
+        self.assertLess(len(config_data), len(json.dumps(self.config)) / 4)
+        with database.session() as session:
+            host = session.query(ClusterHost).first()
+            self.assertEqual(self.config['ignore_proxy'],
+                             host.config['ignore_proxy'])
+
+    def test_small_value_not_compressed(self):
+        with database.session() as session:
+            host = ClusterHost(hostname='host_01')
+            host.config = {'roles': ['compute']}
+            session.add(host)
+
+        self.assertEqual({'roles': ['compute']},
+                         json.loads(self._get_raw_config_data()))
+
+    def test_threshold_disabled(self):
+        with patch.object(setting, 'COMPRESSED_COLUMN_THRESHOLD', 0):
+            with database.session() as session:
+                host = ClusterHost(hostname='host_01')
+                host.config = self.config
+                session.add(host)
+
+        self.assertEqual(self.config,
+                         json.loads(self._get_raw_config_data()))
+
+    def test_legacy_plain_rows(self):
+        with database.session() as session:
+            session.execute(
+                'insert into log_progressing_history '
+                '(pathname, partial_line, message) values '
+                '(:pathname, :partial_line, :message)',
+                {'pathname': '/var/log/host_01/sys.log',
+                 'partial_line': 'NOTICE kernel' * 1000,
+                 'message': 'kernel booted'})
+
+        with database.session() as session:
+            history = session.query(LogProgressingHistory).first()
+            self.assertEqual('NOTICE kernel' * 1000, history.partial_line)
+            self.assertEqual('kernel booted', history.message)
+
+    def test_value_like_marker(self):
+        message = CompressedText.MARKER + 'abc'
+        with database.session() as session:
+            session.add(LogProgressingHistory(
+                pathname='/var/log/host_01/sys.log', message=message))
+
+        with database.session() as session:
+            self.assertEqual(
+                message, session.query(LogProgressingHistory).first().message)
+
+
+if __name__ == '__main__':
+    unittest2.main()
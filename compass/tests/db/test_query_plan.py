@@ -0,0 +1,85 @@
+import unittest2
+
+from compass.db import database
+from compass.db.model import ClusterHost
+from compass.db.model import ClusterState
+from compass.db.model import HostState
+from compass.db.model import Machine
+from compass.db.model import Switch
+
+
+class TestQueryPlan(unittest2.TestCase):
+    """Make sure the hot queries are not table scans."""
+
+    def setUp(self):
+        super(TestQueryPlan, self).setUp()
+        database.init('sqlite://')
+        database.create_db()
+
+    def tearDown(self):
+        database.drop_db()
+        super(TestQueryPlan, self).tearDown()
+
+    def _get_query_plan(self, query):
+        compiled = query.statement.compile(database.ENGINE)
+        params = [
+            compiled.params[name] for name in compiled.positiontup
+        ]
+        connection = database.ENGINE.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute('EXPLAIN QUERY PLAN %s' % compiled, params)
+            return '\n'.join([row[-1] for row in cursor.fetchall()])
+        finally:
+            connection.close()
+
+    def _assert_use_index(self, query, index_name):
+        plan = self._get_query_plan(query)
+        self.assertIn('INDEX %s' % index_name, plan)
+
+    def test_machine_queries(self):
+        with database.session() as session:
+            self._assert_use_index(
+                session.query(Machine).filter_by(switch_id=1),
+                'ix_machine_switch_port')
+            self._assert_use_index(
+                session.query(Machine).filter_by(switch_id=1, port=10),
+                'ix_machine_switch_port')
+            self._assert_use_index(
+                session.query(Machine).filter_by(vlan=1),
+                'ix_machine_vlan')
+
+    def test_switch_queries(self):
+        with database.session() as session:
+            self._assert_use_index(
+                session.query(Switch).filter(
+                    Switch.ip_int.between(0x0a000000, 0x0affffff)),
+                'ix_switch_ip_int')
+
+    def test_cluster_host_queries(self):
+        with database.session() as session:
+            self._assert_use_index(
+                session.query(ClusterHost).filter_by(cluster_id=1),
+                'ix_cluster_host_cluster_id')
+            self._assert_use_index(
+                session.query(ClusterHost).filter_by(machine_id=1),
+                'ix_cluster_host_machine_id')
+            self._assert_use_index(
+                session.query(ClusterHost.id, ClusterHost.cluster_id).filter(
+                    ClusterHost.cluster_id.in_([1, 2])),
+                'ix_cluster_host_cluster_id')
+
+    def test_state_queries(self):
+        with database.session() as session:
+            self._assert_use_index(
+                session.query(
+                    ClusterState.id, ClusterState.progress
+                ).filter(ClusterState.state == 'INSTALLING'),
+                'ix_cluster_state_state')
+            self._assert_use_index(
+                session.query(HostState).filter_by(state='INSTALLING'),
+                'ix_host_state_state')
+
+
+if __name__ == '__main__':
+    unittest2.main()
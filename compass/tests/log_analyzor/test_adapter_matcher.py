@@ -0,0 +1,202 @@
+import os
+import shutil
+import tempfile
+
+import unittest2
+
+from mock import patch
+
+from compass.db import database
+from compass.db.model import Adapter
+from compass.db.model import Cluster
+from compass.db.model import ClusterHost
+from compass.db.model import ClusterState
+from compass.db.model import HostState
+from compass.db.model import LogProgressingHistory
+from compass.log_analyzor import adapter_matcher
+from compass.log_analyzor import file_matcher
+from compass.log_analyzor import progress_calculator
+from compass.log_analyzor.line_matcher import Progress
+
+
+class TestAdapterMatcher(unittest2.TestCase):
+    HOSTNAMES = ['host_01', 'host_02', 'host_03']
+
+    def setUp(self):
+        super(TestAdapterMatcher, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        # use a database file so it is shared by the worker threads
+        # and processes in parallel mode.
+        database.init('sqlite:///%s' % os.path.join(self.tmpdir, 'app.db'))
+        database.create_db()
+        self.logdir = os.path.join(self.tmpdir, 'anamon')
+        os.mkdir(self.logdir)
+        self.old_logdir = file_matcher.FILE_READER_FACTORY.logdir_
+        file_matcher.FILE_READER_FACTORY.logdir_ = self.logdir
+        with database.session() as session:
+            adapter = Adapter(name='CentOS_openstack', os='CentOS',
+                              target_system='openstack')
+            cluster = Cluster(name='cluster_01')
+            cluster.adapter = adapter
+            cluster.state = ClusterState(state='INSTALLING')
+            session.add(cluster)
+            for hostname in self.HOSTNAMES:
+                host = ClusterHost(hostname=hostname)
+                host.cluster = cluster
+                host.state = HostState(state='INSTALLING')
+                session.add(host)
+
+        for hostname in self.HOSTNAMES:
+            os.mkdir(os.path.join(self.logdir, hostname))
+
+    def tearDown(self):
+        adapter_matcher.close_pools()
+        file_matcher.FILE_READER_FACTORY.logdir_ = self.old_logdir
+        database.drop_db()
+        shutil.rmtree(self.tmpdir)
+        super(TestAdapterMatcher, self).tearDown()
+
+    def _append_log(self, hostname, filename, lines):
+        with open(os.path.join(self.logdir, hostname, filename), 'a') as log:
+            log.write(''.join(['%s\n' % line for line in lines]))
+
+    def _update_progress(self, workers=1, pool_type='thread'):
+        progress_calculator.update_progress(
+            'cobbler', 'CentOS', 'chef', 'openstack', 1, [1, 2, 3],
+            workers=workers, pool_type=pool_type)
+
+    def _get_states(self):
+        with database.session() as session:
+            return dict([
+                (state.id, (state.state, state.progress, state.message,
+                            state.update_timestamp))
+                for state in session.query(HostState)])
+
+    def _get_progresses(self):
+        with database.session() as session:
+            cluster_state = session.query(ClusterState).first()
+            return (
+                dict([
+                    (state.id, (state.state, state.progress,
+                                state.message, state.severity))
+                    for state in session.query(HostState)]),
+                (cluster_state.state, cluster_state.progress,
+                 cluster_state.message, cluster_state.severity))
+
+    def _reset_progresses(self):
+        with database.session() as session:
+            session.query(LogProgressingHistory).delete()
+            session.query(HostState).update(
+                {'state': 'INSTALLING', 'progress': 0.0,
+                 'message': None, 'severity': 'INFO'})
+            session.query(ClusterState).update(
+                {'state': 'INSTALLING', 'progress': 0.0,
+                 'message': None, 'severity': 'INFO'})
+
+    def test_update_progress(self):
+        self._append_log('host_01', 'anaconda.log', [
+            'setting up kickstart',
+            'starting STEP_STAGE2'])
+        self._update_progress()
+        states = self._get_states()
+        self.assertEqual(
+            'Downloading installation images from server', states[1][2])
+        self.assertGreater(states[1][1], 0.0)
+        self.assertEqual(0.0, states[2][1])
+        with database.session() as session:
+            cluster_state = session.query(ClusterState).first()
+            self.assertEqual('INSTALLING', cluster_state.state)
+            self.assertAlmostEqual(states[1][1] / 3, cluster_state.progress)
+
+    def test_unchanged_hosts_not_written(self):
+        self._append_log('host_01', 'anaconda.log', ['setting up kickstart'])
+        self._append_log('host_02', 'anaconda.log', ['setting up kickstart'])
+        self._update_progress()
+        states = self._get_states()
+        self._append_log('host_02', 'anaconda.log', ['starting STEP_STAGE2'])
+        self._update_progress()
+        new_states = self._get_states()
+        self.assertEqual(states[1], new_states[1])
+        self.assertEqual(states[3], new_states[3])
+        self.assertGreater(new_states[2][1], states[2][1])
+        self.assertGreater(new_states[2][3], states[2][3])
+
+    def test_host_finished(self):
+        with database.session() as session:
+            session.query(HostState).filter_by(id=3).update(
+                {'state': 'READY', 'progress': 1.0})
+        self._append_log('host_03', 'anaconda.log', ['setting up kickstart'])
+        self._update_progress()
+        states = self._get_states()
+        self.assertEqual('READY', states[3][0])
+        self.assertEqual(1.0, states[3][1])
+        with database.session() as session:
+            cluster_state = session.query(ClusterState).first()
+            self.assertAlmostEqual(1.0 / 3, cluster_state.progress)
+
+    def test_parallel_same_as_serial(self):
+        self._append_log('host_01', 'sys.log', ['NOTICE kernel booted'])
+        self._append_log('host_01', 'anaconda.log', [
+            'setting up kickstart',
+            'starting STEP_STAGE2',
+            'Running anaconda script'])
+        self._append_log('host_02', 'anaconda.log', [
+            'setting up kickstart',
+            'starting STEP_STAGE2'])
+        self._append_log('host_03', 'anaconda.log', [
+            'setting up kickstart',
+            'starting STEP_STAGE2',
+            'Running anaconda script',
+            'moving (1) to step enablefilesystems',
+            'leaving (1) step enablefilesystems'])
+        self._update_progress()
+        expected = self._get_progresses()
+        for pool_type in ['thread', 'process']:
+            self._reset_progresses()
+            self._update_progress(workers=3, pool_type=pool_type)
+            self.assertEqual(expected, self._get_progresses())
+
+    def test_pool_reused(self):
+        pool = adapter_matcher.get_pool(2, 'thread')
+        self.assertIs(pool, adapter_matcher.get_pool(2, 'thread'))
+        adapter_matcher.close_pools()
+        self.assertIsNot(pool, adapter_matcher.get_pool(2, 'thread'))
+
+    def test_process_pool_in_daemonic_process(self):
+        with patch('multiprocessing.current_process') as current_process:
+            current_process.return_value.daemon = True
+            pool = adapter_matcher.get_pool(2, 'process')
+
+        self.assertIs(pool, adapter_matcher.get_pool(2, 'thread'))
+
+
+class TestGetClusterMessage(unittest2.TestCase):
+
+    def test_group_by_severity(self):
+        host_progresses = [
+            Progress(0.5, 'Installing', 'INFO'),
+            Progress(0.5, 'Installing', 'INFO'),
+            Progress(0.1, 'Disk failure', 'ERROR'),
+            Progress(0.3, 'Retrying', 'WARNING'),
+            Progress(0.0, '', None),
+            Progress(0.5, 'Installing', 'INFO')]
+        self.assertEqual(
+            'Disk failure\nRetrying\nInstalling (3 hosts)',
+            adapter_matcher.get_cluster_message(host_progresses, 1024))
+
+    def test_max_length(self):
+        host_progresses = [
+            Progress(0.5, 'Installing package %s' % i, 'INFO')
+            for i in range(1000)
+        ]
+        message = adapter_matcher.get_cluster_message(host_progresses, 100)
+        self.assertLessEqual(len(message), 100)
+        self.assertTrue(message.startswith('Installing package 0\n'))
+        self.assertTrue(message.endswith('more messages'))
+        self.assertEqual(
+            'Install',
+            adapter_matcher.get_cluster_message(host_progresses[:1], 7))
+
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -0,0 +1,126 @@
+import os
+import shutil
+import tempfile
+
+import unittest2
+
+from compass.db import database
+from compass.log_analyzor import file_matcher
+from compass.log_analyzor import progress_calculator
+from compass.log_analyzor.line_matcher import Progress
+from compass.utils import setting_wrapper as setting
+
+
+class TestFileReader(unittest2.TestCase):
+    def setUp(self):
+        super(TestFileReader, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.pathname = os.path.join(self.tmpdir, 'test.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        super(TestFileReader, self).tearDown()
+
+    def _get_reader(self, content):
+        with open(self.pathname, 'w') as log:
+            log.write(content)
+
+        reader = file_matcher.FileReader(self.pathname)
+        reader.BLOCK_SIZE = 4
+        return reader
+
+    def test_readline_reversed(self):
+        reader = self._get_reader('line1\nline22\n\nline333\npartial')
+        lines = list(reader.readline_reversed(1024))
+        self.assertEqual(['line333\n', '\n', 'line22\n', 'line1\n'], lines)
+        self.assertEqual(len('line1\nline22\n\nline333\n'), reader.position_)
+        self.assertEqual(['partial'], list(reader.readline()))
+
+    def test_readline_reversed_max_bytes(self):
+        reader = self._get_reader('line1\nline22\n\nline333\n')
+        lines = list(reader.readline_reversed(10))
+        self.assertEqual(['line333\n', '\n'], lines)
+
+    def test_readline_reversed_no_complete_line(self):
+        reader = self._get_reader('partial')
+        self.assertEqual([], list(reader.readline_reversed(1024)))
+        self.assertEqual(0, reader.position_)
+
+
+class TestFileMatcherColdStart(unittest2.TestCase):
+    ANACONDA_LOG = [
+        'setting up kickstart',
+        'starting STEP_STAGE2',
+        'Running anaconda script',
+        'Running kickstart pre script',
+        'All kickstart pre script have been run',
+        'moving (1) to step enablefilesystems',
+        'leaving (1) step enablefilesystems',
+        'moving (1) to step reposetup',
+        'leaving (1) step reposetup',
+    ]
+    INSTALL_LOG = ['Installing package-%s' % i for i in range(50)]
+
+    def setUp(self):
+        super(TestFileMatcherColdStart, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        database.init('sqlite://')
+        database.create_db()
+        self.old_logdir = file_matcher.FILE_READER_FACTORY.logdir_
+        file_matcher.FILE_READER_FACTORY.logdir_ = self.tmpdir
+        self.old_cold_start_bytes = setting.PROGRESS_UPDATE_COLD_START_BYTES
+        os.mkdir(os.path.join(self.tmpdir, 'host_01'))
+        self.file_matchers = dict([
+            (matcher.filename_, matcher)
+            for matcher in progress_calculator.OS_INSTALLER_CONFIGURATIONS[
+                'CentOS'].file_matchers_
+        ])
+
+    def tearDown(self):
+        setting.PROGRESS_UPDATE_COLD_START_BYTES = self.old_cold_start_bytes
+        file_matcher.FILE_READER_FACTORY.logdir_ = self.old_logdir
+        database.drop_db()
+        shutil.rmtree(self.tmpdir)
+        super(TestFileMatcherColdStart, self).tearDown()
+
+    def _update_progress(self, filename, lines, cold_start_bytes):
+        setting.PROGRESS_UPDATE_COLD_START_BYTES = cold_start_bytes
+        with open(os.path.join(self.tmpdir, 'host_01', filename), 'w') as log:
+            log.write(''.join(['%s\n' % line for line in lines]))
+
+        progress = Progress(0.0, '', None)
+        self.file_matchers[filename].update_progress('host_01', progress)
+        database.drop_db()
+        database.create_db()
+        return (progress.progress, progress.message, progress.severity)
+
+    def test_cold_start_from_milestone(self):
+        expected = self._update_progress(
+            'anaconda.log', self.ANACONDA_LOG, 0)
+        self.assertEqual(
+            expected,
+            self._update_progress('anaconda.log', self.ANACONDA_LOG, 1024))
+        self.assertEqual(
+            'Customized Repositories setting up are done', expected[1])
+
+    def test_cold_start_without_milestone(self):
+        expected = self._update_progress('install.log', self.INSTALL_LOG, 0)
+        self.assertEqual(
+            expected,
+            self._update_progress('install.log', self.INSTALL_LOG, 4096))
+        # The whole file is replayed if there is no milestone in the tail.
+        self.assertEqual(
+            expected,
+            self._update_progress('install.log', self.INSTALL_LOG, 100))
+
+    def test_cold_start_without_milestone_in_tail(self):
+        lines = self.ANACONDA_LOG[:3] + [
+            'anaconda debug %s' % i for i in range(50)]
+        expected = self._update_progress('anaconda.log', lines, 0)
+        self.assertGreater(expected[0], 0.0)
+        self.assertEqual(
+            expected, self._update_progress('anaconda.log', lines, 100))
+
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+
+import unittest2
+
+from compass.actions import progress_update
+from compass.db import database
+from compass.db.model import Adapter
+from compass.db.model import Cluster
+from compass.db.model import ClusterHost
+from compass.db.model import ClusterState
+from compass.db.model import HostState
+from compass.log_analyzor import file_matcher
+from compass.log_analyzor import log_generator
+
+
+class TestLogGenerator(unittest2.TestCase):
+    HOSTNAMES = ['host_01', 'host_02']
+
+    def setUp(self):
+        super(TestLogGenerator, self).setUp()
+        self.logdir = tempfile.mkdtemp()
+        self.old_logdir = file_matcher.FILE_READER_FACTORY.logdir_
+        file_matcher.FILE_READER_FACTORY.logdir_ = self.logdir
+        database.init('sqlite://')
+        database.create_db()
+
+    def tearDown(self):
+        database.drop_db()
+        file_matcher.FILE_READER_FACTORY.logdir_ = self.old_logdir
+        shutil.rmtree(self.logdir)
+        super(TestLogGenerator, self).tearDown()
+
+    def test_get_host_events(self):
+        events = log_generator.get_host_events('host_01')
+        self.assertEqual(events, log_generator.get_host_events('host_01'))
+        self.assertEqual(
+            set(['sys.log', 'anaconda.log', 'install.log',
+                 'chef-client.log']),
+            set([filename for filename, _ in events]))
+        self.assertEqual('chef-client.log', events[-1][0])
+
+    def test_advance(self):
+        generator = log_generator.LogGenerator(
+            self.logdir, self.HOSTNAMES, steps=3)
+        total = sum([
+            len(events) for events in generator.host_events_.values()])
+        written = 0
+        while not generator.is_finished():
+            written += generator.advance()
+
+        self.assertEqual(total, written)
+        self.assertEqual(0, generator.advance())
+        self.assertItemsEqual(
+            ['sys.log', 'anaconda.log', 'install.log', 'chef-client.log'],
+            os.listdir(os.path.join(self.logdir, 'host_01')))
+
+    def test_update_progress(self):
+        with database.session() as session:
+            adapter = Adapter(name='CentOS_openstack', os='CentOS',
+                              target_system='openstack')
+            cluster = Cluster(name='cluster_01')
+            cluster.adapter = adapter
+            cluster.state = ClusterState(state='INSTALLING')
+            for hostname in self.HOSTNAMES:
+                host = ClusterHost(hostname=hostname)
+                host.cluster = cluster
+                host.state = HostState(state='INSTALLING')
+                session.add(host)
+
+        generator = log_generator.LogGenerator(
+            self.logdir, self.HOSTNAMES, steps=2)
+        generator.advance()
+        progress_update.update_progress(1)
+        with database.session() as session:
+            state = session.query(ClusterState).first()
+            self.assertEqual('INSTALLING', state.state)
+            self.assertGreater(state.progress, 0.0)
+            self.assertLess(state.progress, 1.0)
+
+        generator.advance()
+        progress_update.update_progress(1)
+        with database.session() as session:
+            self.assertEqual(
+                ['READY', 'READY'],
+                [state.state for state in session.query(HostState)])
+            state = session.query(ClusterState).first()
+            self.assertEqual('READY', state.state)
+            self.assertEqual(1.0, state.progress)
+
+
+if __name__ == '__main__':
+    unittest2.main()
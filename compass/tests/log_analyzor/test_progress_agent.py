@@ -0,0 +1,137 @@
+import shutil
+import tempfile
+
+from mock import Mock
+import unittest2
+
+from compass.actions import progress_update
+from compass.db import database
+from compass.db.model import Adapter
+from compass.db.model import Cluster
+from compass.db.model import ClusterHost
+from compass.db.model import ClusterState
+from compass.db.model import HostState
+from compass.log_analyzor import file_matcher
+from compass.log_analyzor import log_generator
+from compass.log_analyzor import progress_calculator
+from compass.log_analyzor.progress_agent import ProgressAgent
+from compass.utils import setting_wrapper as setting
+
+
+class TestProgressAgent(unittest2.TestCase):
+    HOSTNAMES = ['host_01', 'host_02']
+
+    def setUp(self):
+        super(TestProgressAgent, self).setUp()
+        self.logdir = tempfile.mkdtemp()
+        self.old_logdir = file_matcher.FILE_READER_FACTORY.logdir_
+        file_matcher.FILE_READER_FACTORY.logdir_ = self.logdir
+        database.init('sqlite://')
+        database.create_db()
+        with database.session() as session:
+            cluster = Cluster(name='cluster_01')
+            cluster.state = ClusterState(state='INSTALLING')
+            for hostname in self.HOSTNAMES:
+                host = ClusterHost(hostname=hostname)
+                host.cluster = cluster
+                host.state = HostState(state='INSTALLING')
+                session.add(host)
+
+        self.client = Mock()
+        self.client.update_hosts_installing_progress.side_effect = (
+            self._update_hosts_installing_progress)
+        self.agent = ProgressAgent(
+            progress_calculator.get_adapter_matcher(
+                'cobbler', 'CentOS', 'chef', 'openstack'),
+            self.client)
+
+    def tearDown(self):
+        database.drop_db()
+        file_matcher.FILE_READER_FACTORY.logdir_ = self.old_logdir
+        shutil.rmtree(self.logdir)
+        super(TestProgressAgent, self).tearDown()
+
+    def _update_hosts_installing_progress(self, progresses):
+        results = progress_update.update_hosts_progress(dict([
+            (progress['hostname'], progress) for progress in progresses
+        ]))
+        return 200, {'status': 'OK', 'progresses': results}
+
+    def test_run_once(self):
+        generator = log_generator.LogGenerator(
+            self.logdir, self.HOSTNAMES, steps=3)
+        generator.advance()
+        self.assertEqual(2, self.agent.run_once())
+        deltas = self.client.update_hosts_installing_progress.call_args[0][0]
+        self.assertItemsEqual(
+            self.HOSTNAMES, [delta['hostname'] for delta in deltas])
+        with database.session() as session:
+            state = session.query(ClusterState).first()
+            self.assertEqual('INSTALLING', state.state)
+            self.assertGreater(state.progress, 0.0)
+
+        # nothing is reported when the logs are not changed.
+        self.assertEqual(0, self.agent.run_once())
+        self.assertEqual(
+            1, self.client.update_hosts_installing_progress.call_count)
+
+        while not generator.is_finished():
+            generator.advance()
+            self.agent.run_once()
+
+        with database.session() as session:
+            self.assertEqual(
+                'READY', session.query(ClusterState).first().state)
+            for state in session.query(HostState):
+                self.assertEqual('READY', state.state)
+                self.assertEqual(1.0, state.progress)
+
+    def test_run_once_failed(self):
+        log_generator.LogGenerator(
+            self.logdir, self.HOSTNAMES, steps=3).advance()
+        self.client.update_hosts_installing_progress.side_effect = None
+        self.client.update_hosts_installing_progress.return_value = (
+            500, {'status': 'Internal Error'})
+        self.assertEqual(0, self.agent.run_once())
+
+        # the progresses are reported again after a failure.
+        self.client.update_hosts_installing_progress.side_effect = (
+            self._update_hosts_installing_progress)
+        self.assertEqual(2, self.agent.run_once())
+
+    def test_run_once_not_found(self):
+        log_generator.LogGenerator(
+            self.logdir, self.HOSTNAMES + ['host_03'], steps=3).advance()
+        self.assertEqual(2, self.agent.run_once())
+
+        # the progress of the unknown host is reported again.
+        self.assertEqual(0, self.agent.run_once())
+        deltas = self.client.update_hosts_installing_progress.call_args[0][0]
+        self.assertEqual(
+            ['host_03'], [delta['hostname'] for delta in deltas])
+
+    def test_central_update_skipped(self):
+        log_generator.LogGenerator(
+            self.logdir, self.HOSTNAMES, steps=3).advance()
+        old_from_agents = setting.PROGRESS_UPDATE_FROM_AGENTS
+        setting.PROGRESS_UPDATE_FROM_AGENTS = True
+        try:
+            with database.session() as session:
+                cluster = session.query(Cluster).first()
+                cluster.adapter = Adapter(
+                    name='CentOS_openstack', os='CentOS',
+                    target_system='openstack')
+                session.flush()
+                clusterid = cluster.id
+
+            progress_update.update_clusters_progress([clusterid])
+        finally:
+            setting.PROGRESS_UPDATE_FROM_AGENTS = old_from_agents
+
+        with database.session() as session:
+            for state in session.query(HostState):
+                self.assertEqual(0.0, state.progress)
+
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+
+import unittest2
+
+from compass.log_analyzor import progress_calculator
+from compass.log_analyzor import replay
+
+
+class TestReplay(unittest2.TestCase):
+    def setUp(self):
+        super(TestReplay, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        adapter = progress_calculator.get_adapter_matcher(
+            'cobbler', 'CentOS', 'chef', 'openstack')
+        self.file_matchers = replay.get_file_matchers(adapter)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        super(TestReplay, self).tearDown()
+
+    def _write_log(self, filename, lines):
+        pathname = os.path.join(self.tmpdir, filename)
+        with open(pathname, 'w') as log:
+            log.write(''.join(['%s\n' % line for line in lines]))
+
+        return pathname
+
+    def test_get_file_matchers(self):
+        self.assertItemsEqual(
+            ['sys.log', 'anaconda.log', 'install.log', 'chef-client.log'],
+            self.file_matchers.keys())
+        _, min_progress, max_progress = self.file_matchers['chef-client.log']
+        self.assertEqual((0.6, 1.0), (min_progress, max_progress))
+
+    def test_replay_file(self):
+        pathname = self._write_log('chef-client.log', [
+            'Processing package[nova] action install',
+            'some other line',
+            'Processing service[nova-api] action start',
+            'Chef Run complete in 3 seconds',
+            'after exit'])
+        file_matcher, min_progress, max_progress = (
+            self.file_matchers['chef-client.log'])
+        result = replay.replay_file(
+            file_matcher, pathname, min_progress, max_progress)
+        self.assertEqual(5, result.lines_)
+        self.assertEqual('exit', result.line_matcher_name_)
+        self.assertEqual(4, result.profiles_['start'].evaluations_)
+        self.assertEqual(2, result.profiles_['start'].matches_)
+        self.assertEqual(2, result.profiles_['chef_complete'].evaluations_)
+        self.assertEqual(1, result.profiles_['chef_complete'].matches_)
+        self.assertEqual([1, 3, 4], [entry[0] for entry in result.timeline_])
+        self.assertEqual(1.0, result.total_progress_.progress)
+        self.assertEqual('Chef run complete', result.total_progress_.message)
+
+
+if __name__ == '__main__':
+    unittest2.main()
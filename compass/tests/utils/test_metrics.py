@@ -0,0 +1,175 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest2
+
+from compass.utils import metrics
+
+
+class TestRegistry(unittest2.TestCase):
+    def setUp(self):
+        super(TestRegistry, self).setUp()
+        self.registry = metrics.Registry()
+
+    def test_counter(self):
+        counter = self.registry.counter('requests_total', 'requests')
+        counter.inc(method='GET')
+        counter.inc(2, method='GET')
+        counter.inc(method='POST')
+        self.assertEqual(counter.get(method='GET'), 3)
+        self.assertIs(self.registry.counter('requests_total', 'requests'),
+                      counter)
+        self.assertRaises(ValueError, self.registry.gauge,
+                          'requests_total', 'requests')
+
+    def test_histogram(self):
+        histogram = self.registry.histogram(
+            'duration_seconds', 'duration', buckets=(0.1, 1.0))
+        histogram.observe(0.05, endpoint='/switches')
+        histogram.observe(0.5, endpoint='/switches')
+        histogram.observe(5, endpoint='/switches')
+        self.assertEqual(histogram.get_count(endpoint='/switches'), 3)
+        samples = dict([
+            ((name, dict(key).get('le')), value)
+            for name, key, value in histogram.get_samples()
+        ])
+        self.assertEqual(samples[('duration_seconds_bucket', '0.1')], 1)
+        self.assertEqual(samples[('duration_seconds_bucket', '1.0')], 2)
+        self.assertEqual(samples[('duration_seconds_bucket', '+Inf')], 3)
+        self.assertEqual(samples[('duration_seconds_count', None)], 3)
+        self.assertAlmostEqual(samples[('duration_seconds_sum', None)], 5.55)
+
+    def test_render(self):
+        self.registry.counter('requests_total', 'Number of requests.').inc(
+            endpoint='/switches', status=200)
+        self.registry.gauge('last_run', 'Last run.').set(10)
+        text = self.registry.render()
+        self.assertIn('# HELP requests_total Number of requests.\n', text)
+        self.assertIn('# TYPE requests_total counter\n', text)
+        self.assertIn(
+            'requests_total{endpoint="/switches",status="200"} 1.0\n', text)
+        self.assertIn('# TYPE last_run gauge\nlast_run 10.0\n', text)
+
+    def test_merge(self):
+        self.registry.counter('tasks_total', 'tasks').inc(task='poll')
+        self.registry.histogram('task_seconds', 'task').observe(
+            1.0, task='poll')
+        merged = metrics.Registry()
+        merged.merge(self.registry.to_dict())
+        merged.merge(self.registry.to_dict())
+        self.assertEqual(
+            merged.counter('tasks_total', 'tasks').get(task='poll'), 2)
+        self.assertEqual(
+            merged.histogram('task_seconds', 'task').get_count(task='poll'),
+            2)
+
+
+class TestDumpCollect(unittest2.TestCase):
+    def setUp(self):
+        super(TestDumpCollect, self).setUp()
+        self.dirname = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+        super(TestDumpCollect, self).tearDown()
+
+    def _dump_other(self, registry, process, pid, mtime=None):
+        filename = metrics.get_dump_filename(self.dirname, pid, process)
+        with open(filename, 'w') as dump:
+            dump.write(metrics.json.dumps(registry.to_dict()))
+
+        if mtime is not None:
+            os.utime(filename, (mtime, mtime))
+
+        return filename
+
+    def _get_finished_pid(self):
+        process = subprocess.Popen(['true'])
+        process.wait()
+        return process.pid
+
+    def test_collect_dumped(self):
+        registry = metrics.Registry()
+        registry.counter('requests_total', 'requests').inc(3)
+        other_registry = metrics.Registry()
+        other_registry.counter('requests_total', 'requests').inc(2)
+        self._dump_other(other_registry, 'poll_switch.py', os.getppid())
+
+        # The file dumped by the process itself is skipped.
+        metrics.dump(self.dirname, registry)
+        self.assertTrue(os.path.exists(
+            metrics.get_dump_filename(self.dirname)))
+        collected = metrics.collect(self.dirname, registry)
+        counter = collected.counter('requests_total', 'requests')
+        self.assertEqual(
+            counter.get(process=metrics.get_process_name(),
+                        pid=str(os.getpid())), 3)
+        self.assertEqual(
+            counter.get(process='poll_switch.py', pid=str(os.getppid())), 2)
+
+    def test_collect_stale_dumped(self):
+        registry = metrics.Registry()
+        live_registry = metrics.Registry()
+        live_registry.gauge('last_loop', 'last loop').set(
+            200, daemon='poll_switch')
+        stale_registry = metrics.Registry()
+        stale_registry.gauge('last_loop', 'last loop').set(
+            100, daemon='poll_switch')
+        live_filename = self._dump_other(
+            live_registry, 'a_poll_switch.py', os.getppid())
+        # Both stale files sort after the live one.
+        dead_filename = self._dump_other(
+            stale_registry, 'z_poll_switch.py', self._get_finished_pid())
+        expired_filename = self._dump_other(
+            stale_registry, 'z_poll_switch.py', os.getppid(),
+            time.time() - metrics.setting.METRICS_FILE_TTL - 10)
+        invalid_filename = self._dump_other(
+            stale_registry, 'z_poll_switch.py', 0)
+
+        collected = metrics.collect(self.dirname, registry)
+        samples = collected.gauge('last_loop', 'last loop').get_samples()
+        self.assertEqual(
+            [(dict(key)['process'], value) for _, key, value in samples],
+            [('a_poll_switch.py', 200)])
+        self.assertTrue(os.path.exists(live_filename))
+        self.assertFalse(os.path.exists(dead_filename))
+        self.assertFalse(os.path.exists(expired_filename))
+        self.assertFalse(os.path.exists(invalid_filename))
+
+    def test_dump_if_due(self):
+        registry = metrics.Registry()
+        filename = metrics.get_dump_filename(self.dirname)
+        old_last_dump_time = metrics.LAST_DUMP_TIME[0]
+        self.addCleanup(
+            metrics.LAST_DUMP_TIME.__setitem__, 0, old_last_dump_time)
+        metrics.LAST_DUMP_TIME[0] = 0
+        metrics.dump_if_due(self.dirname, registry)
+        self.assertTrue(os.path.exists(filename))
+
+        os.remove(filename)
+        metrics.dump_if_due(self.dirname, registry)
+        self.assertFalse(os.path.exists(filename))
+
+    def test_daemon_loop(self):
+        registry = metrics.Registry()
+        with metrics.daemon_loop('poll_switch', registry):
+            pass
+
+        try:
+            with metrics.daemon_loop('poll_switch', registry):
+                raise KeyError('poll')
+        except KeyError:
+            pass
+
+        runs = registry.counter('compass_daemon_loops_total', '')
+        self.assertEqual(runs.get(daemon='poll_switch', status='success'), 1)
+        self.assertEqual(runs.get(daemon='poll_switch', status='failure'), 1)
+        duration = registry.histogram(
+            'compass_daemon_loop_duration_seconds', '')
+        self.assertEqual(duration.get_count(daemon='poll_switch'), 2)
+
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -72,3 +72,17 @@ def init():
 
     handler.setFormatter(formatter)
     logger.addHandler(handler)
+
+    slow_query_logger = logging.getLogger('compass.db.slow_query')
+    for handler in slow_query_logger.handlers[:]:
+        slow_query_logger.removeHandler(handler)
+
+    slow_query_logger.propagate = True
+    if logdir and setting.SLOW_QUERY_LOGFILE:
+        handler = logging.handlers.TimedRotatingFileHandler(
+            os.path.join(logdir, setting.SLOW_QUERY_LOGFILE),
+            when=flags.OPTIONS.log_interval_unit,
+            interval=flags.OPTIONS.log_interval)
+        handler.setFormatter(formatter)
+        slow_query_logger.addHandler(handler)
+        slow_query_logger.propagate = False
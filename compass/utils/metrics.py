@@ -0,0 +1,511 @@
+"""Module to collect the operational metrics of the compass processes.
+
+   Each process keeps its counters, gauges and histograms in memory in
+   :data:`REGISTRY`. The processes dump their metrics to METRICS_DIR, one
+   file per process, where the api server reads them back to serve the
+   metrics of all the processes in the Prometheus text format. The
+   served samples are labeled with the process name and pid they come
+   from, so the metrics of the processes never override each other.
+
+   .. note::
+      The metrics are not dumped if METRICS_DIR is not set, and the api
+      server then only serves its own metrics. METRICS_DIR should be
+      local to the host, since the files of the processes which are not
+      running anymore are found by their pids, and removed.
+"""
+import errno
+import logging
+import os
+import os.path
+import simplejson as json
+import sys
+import threading
+import time
+
+from contextlib import contextmanager
+
+from compass.utils import setting_wrapper as setting
+
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0
+)
+
+
+def _get_key(labels):
+    """Get the hashable key of the labels."""
+    return tuple(sorted(labels.items()))
+
+
+def _merge_key(key, labels):
+    """Get the key of the dumped labels with the extra labels added."""
+    return tuple(sorted(
+        [tuple(item) for item in key] + (labels or {}).items()))
+
+
+def _format_value(value):
+    """Format the sample value in the Prometheus text format."""
+    if value == float('inf'):
+        return '+Inf'
+
+    return repr(float(value))
+
+
+def _format_sample(name, key, value):
+    """Format one sample line in the Prometheus text format."""
+    if not key:
+        return '%s %s' % (name, _format_value(value))
+
+    labels = ','.join([
+        '%s="%s"' % (
+            label_name,
+            unicode(label_value).replace('\\', '\\\\').replace(
+                '"', '\\"').replace('\n', '\\n'))
+        for label_name, label_value in key
+    ])
+    return '%s{%s} %s' % (name, labels, _format_value(value))
+
+
+class Counter(object):
+    """Counter only going up, like the number of requests."""
+
+    TYPE = 'counter'
+
+    def __init__(self, name, documentation, lock):
+        self.name_ = name
+        self.documentation_ = documentation
+        self.lock_ = lock
+        self.values_ = {}
+
+    def __str__(self):
+        return '%s[%s]' % (self.__class__.__name__, self.name_)
+
+    def inc(self, amount=1, **labels):
+        """Increase the counter of the labels by amount."""
+        key = _get_key(labels)
+        with self.lock_:
+            self.values_[key] = self.values_.get(key, 0) + amount
+
+    def get(self, **labels):
+        """Get the value of the labels."""
+        return self.values_.get(_get_key(labels), 0)
+
+    def get_samples(self):
+        """Get the list of (name, key, value) samples."""
+        return [
+            (self.name_, key, value)
+            for key, value in sorted(self.values_.items())
+        ]
+
+    def to_dict(self):
+        """Get the values as json serializable dict."""
+        return {
+            'type': self.TYPE,
+            'documentation': self.documentation_,
+            'values': [
+                [list(key), value] for key, value in self.values_.items()
+            ]
+        }
+
+    def merge(self, data, labels=None):
+        """Add the values dumped by :meth:`to_dict` to the counter."""
+        with self.lock_:
+            for key, value in data['values']:
+                key = _merge_key(key, labels)
+                self.values_[key] = self.values_.get(key, 0) + value
+
+
+class Gauge(Counter):
+    """Gauge set to the current value, like the last run time."""
+
+    TYPE = 'gauge'
+
+    def set(self, value, **labels):
+        """Set the gauge of the labels to value."""
+        with self.lock_:
+            self.values_[_get_key(labels)] = value
+
+    def merge(self, data, labels=None):
+        """Set the values dumped by :meth:`to_dict` to the gauge."""
+        with self.lock_:
+            for key, value in data['values']:
+                self.values_[_merge_key(key, labels)] = value
+
+
+class Histogram(object):
+    """Histogram of observed values, like the request latencies."""
+
+    TYPE = 'histogram'
+
+    def __init__(self, name, documentation, lock, buckets=DEFAULT_BUCKETS):
+        self.name_ = name
+        self.documentation_ = documentation
+        self.lock_ = lock
+        self.buckets_ = sorted(buckets)
+        self.values_ = {}
+
+    def __str__(self):
+        return '%s[%s, buckets: %s]' % (
+            self.__class__.__name__, self.name_, self.buckets_)
+
+    def observe(self, value, **labels):
+        """Observe the value for the labels."""
+        key = _get_key(labels)
+        with self.lock_:
+            counts, total, count = self.values_.get(
+                key, ([0] * len(self.buckets_), 0.0, 0))
+            counts = [
+                bucket_count + 1 if value <= bound else bucket_count
+                for bucket_count, bound in zip(counts, self.buckets_)
+            ]
+            self.values_[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the seconds spent in the with block."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(time.time() - start, **labels)
+
+    def get_count(self, **labels):
+        """Get the number of observed values of the labels."""
+        return self.values_.get(_get_key(labels), (None, 0.0, 0))[2]
+
+    def get_samples(self):
+        """Get the list of (name, key, value) samples."""
+        samples = []
+        for key, (counts, total, count) in sorted(self.values_.items()):
+            for bound, bucket_count in zip(self.buckets_, counts):
+                samples.append((
+                    '%s_bucket' % self.name_,
+                    key + (('le', _format_value(bound)),),
+                    bucket_count))
+
+            samples.append((
+                '%s_bucket' % self.name_, key + (('le', '+Inf'),), count))
+            samples.append(('%s_sum' % self.name_, key, total))
+            samples.append(('%s_count' % self.name_, key, count))
+
+        return samples
+
+    def to_dict(self):
+        """Get the values as json serializable dict."""
+        return {
+            'type': self.TYPE,
+            'documentation': self.documentation_,
+            'buckets': self.buckets_,
+            'values': [
+                [list(key), list(value)]
+                for key, value in self.values_.items()
+            ]
+        }
+
+    def merge(self, data, labels=None):
+        """Add the values dumped by :meth:`to_dict` to the histogram."""
+        if data['buckets'] != self.buckets_:
+            logging.error('%s buckets mismatch: %s', self, data['buckets'])
+            return
+
+        with self.lock_:
+            for key, (counts, total, count) in data['values']:
+                key = _merge_key(key, labels)
+                old_counts, old_total, old_count = self.values_.get(
+                    key, ([0] * len(self.buckets_), 0.0, 0))
+                self.values_[key] = (
+                    [lhs + rhs for lhs, rhs in zip(old_counts, counts)],
+                    old_total + total, old_count + count)
+
+
+METRIC_TYPES = {
+    Counter.TYPE: Counter,
+    Gauge.TYPE: Gauge,
+    Histogram.TYPE: Histogram,
+}
+
+
+class Registry(object):
+    """Registry of the metrics of a process."""
+
+    def __init__(self):
+        self.lock_ = threading.RLock()
+        self.metrics_ = {}
+
+    def __str__(self):
+        return '%s[metrics: %s]' % (
+            self.__class__.__name__, sorted(self.metrics_.keys()))
+
+    def _get_metric(self, metric_type, name, documentation, **kwargs):
+        """Get the metric of the name, creating it if not registered."""
+        with self.lock_:
+            metric = self.metrics_.get(name)
+            if not metric:
+                metric = METRIC_TYPES[metric_type](
+                    name, documentation, self.lock_, **kwargs)
+                self.metrics_[name] = metric
+            elif metric.TYPE != metric_type:
+                raise ValueError('%s is registered as %s' % (
+                    name, metric.TYPE))
+
+        return metric
+
+    def counter(self, name, documentation):
+        """Get the counter of the name."""
+        return self._get_metric(Counter.TYPE, name, documentation)
+
+    def gauge(self, name, documentation):
+        """Get the gauge of the name."""
+        return self._get_metric(Gauge.TYPE, name, documentation)
+
+    def histogram(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        """Get the histogram of the name."""
+        return self._get_metric(Histogram.TYPE, name, documentation,
+                                buckets=buckets)
+
+    def to_dict(self):
+        """Get the metrics as json serializable dict."""
+        with self.lock_:
+            return dict([
+                (name, metric.to_dict())
+                for name, metric in self.metrics_.items()
+            ])
+
+    def merge(self, data, labels=None):
+        """Merge the metrics dumped by :meth:`to_dict` to the registry.
+
+        :param labels: the labels added to all the merged samples.
+        :type labels: dict
+        """
+        for name, metric_data in data.items():
+            kwargs = {}
+            if metric_data['type'] == Histogram.TYPE:
+                kwargs['buckets'] = metric_data['buckets']
+
+            try:
+                self._get_metric(
+                    metric_data['type'], name,
+                    metric_data['documentation'], **kwargs
+                ).merge(metric_data, labels)
+            except Exception as error:
+                logging.error('failed to merge metric %s', name)
+                logging.exception(error)
+
+    def render(self):
+        """Render the metrics in the Prometheus text format."""
+        lines = []
+        with self.lock_:
+            for name, metric in sorted(self.metrics_.items()):
+                lines.append('# HELP %s %s' % (
+                    name, metric.documentation_.replace(
+                        '\\', '\\\\').replace('\n', '\\n')))
+                lines.append('# TYPE %s %s' % (name, metric.TYPE))
+                lines.extend([
+                    _format_sample(sample_name, key, value)
+                    for sample_name, key, value in metric.get_samples()
+                ])
+
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+LAST_DUMP_TIME = [0]
+
+
+@contextmanager
+def daemon_loop(daemon, registry=REGISTRY):
+    """Time one run of the daemon loop and dump the metrics after it.
+
+    :param daemon: the daemon name.
+    :type daemon: str
+
+    .. note::
+       The exception raised in the run is counted as a failure and
+       raised again.
+    """
+    duration = registry.histogram(
+        'compass_daemon_loop_duration_seconds',
+        'Seconds spent in each run of the daemon loops by daemon.')
+    runs = registry.counter(
+        'compass_daemon_loops_total',
+        'Number of the runs of the daemon loops by daemon and status.')
+    last_run = registry.gauge(
+        'compass_daemon_last_loop_timestamp_seconds',
+        'Unix time the daemon loops last finished a run by daemon.')
+    start = time.time()
+    status = 'failure'
+    try:
+        yield
+        status = 'success'
+    finally:
+        end = time.time()
+        duration.observe(end - start, daemon=daemon)
+        runs.inc(daemon=daemon, status=status)
+        last_run.set(end, daemon=daemon)
+        dump(registry=registry)
+
+
+def get_process_name():
+    """Get the name of the current process."""
+    return os.path.basename(sys.argv[0]) or 'python'
+
+
+def get_dump_filename(dirname, pid=None, process=None):
+    """Get the file the metrics of the process are dumped to."""
+    if pid is None:
+        pid = os.getpid()
+
+    if process is None:
+        process = get_process_name()
+
+    return os.path.join(dirname, '%s.%s.json' % (process, pid))
+
+
+def parse_dump_filename(filename):
+    """Get (process, pid) from the name of a dumped file.
+
+    :returns: (process, pid), pid is None if it is not a valid pid.
+    """
+    process, _, pid = os.path.basename(filename)[:-len('.json')].rpartition(
+        '.')
+    try:
+        pid = int(pid)
+    except ValueError:
+        return process, None
+
+    if pid <= 0:
+        return process, None
+
+    return process, pid
+
+
+def is_running(pid):
+    """Check if the process of the pid is running on the host."""
+    try:
+        os.kill(pid, 0)
+    except OSError as error:
+        return error.errno == errno.EPERM
+
+    return True
+
+
+def dump(dirname=None, registry=REGISTRY):
+    """Dump the metrics of the process to the metrics dir.
+
+    :param dirname: the metrics dir. Default is METRICS_DIR.
+
+    .. note::
+       The file is replaced atomically, so the api server never reads a
+       partially written file. The errors are only logged.
+    """
+    if dirname is None:
+        dirname = setting.METRICS_DIR
+
+    if not dirname:
+        return
+
+    filename = get_dump_filename(dirname)
+    try:
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        with open('%s.tmp' % filename, 'w') as dump_file:
+            json.dump(registry.to_dict(), dump_file)
+
+        os.rename('%s.tmp' % filename, filename)
+        LAST_DUMP_TIME[0] = time.time()
+    except Exception as error:
+        logging.error('failed to dump metrics to %s', filename)
+        logging.exception(error)
+
+
+def dump_if_due(dirname=None, registry=REGISTRY):
+    """Dump the metrics if the last dump is METRICS_DUMP_INTERVAL ago."""
+    if time.time() - LAST_DUMP_TIME[0] >= setting.METRICS_DUMP_INTERVAL:
+        dump(dirname, registry)
+
+
+def get_dump_files(dirname, now=None):
+    """Get the live dumped files, removing the stale ones.
+
+    A file is stale if its process is not running anymore, or if it is
+    not dumped for METRICS_FILE_TTL seconds.
+
+    :returns: list of (filename, process, pid), the least recently
+              dumped first.
+    """
+    if now is None:
+        now = time.time()
+
+    dump_files = []
+    for filename in os.listdir(dirname):
+        filename = os.path.join(dirname, filename)
+        try:
+            mtime = os.path.getmtime(filename)
+        except OSError:
+            continue
+
+        if filename.endswith('.json'):
+            process, pid = parse_dump_filename(filename)
+            stale = (
+                pid is None or not is_running(pid) or
+                now - mtime > setting.METRICS_FILE_TTL)
+        elif filename.endswith('.tmp'):
+            stale = now - mtime > setting.METRICS_FILE_TTL
+        else:
+            continue
+
+        if stale:
+            logging.info('remove stale metrics file %s', filename)
+            try:
+                os.remove(filename)
+            except OSError as error:
+                logging.error('failed to remove %s: %s', filename, error)
+
+            continue
+
+        if filename.endswith('.json'):
+            dump_files.append((mtime, filename, process, pid))
+
+    return [
+        (filename, process, pid)
+        for _, filename, process, pid in sorted(dump_files)
+    ]
+
+
+def collect(dirname=None, registry=REGISTRY):
+    """Collect the metrics of the process and the dumped ones.
+
+    :param dirname: the metrics dir. Default is METRICS_DIR.
+
+    :returns: :class:`Registry` of the merged metrics, each sample is
+              labeled with the process and pid it comes from.
+
+    .. note::
+       The file dumped by the process itself is skipped since its
+       metrics in memory are more recent. The stale files are removed.
+    """
+    if dirname is None:
+        dirname = setting.METRICS_DIR
+
+    collected = Registry()
+    if dirname and os.path.isdir(dirname):
+        own_filename = get_dump_filename(dirname)
+        for filename, process, pid in get_dump_files(dirname):
+            if filename == own_filename:
+                continue
+
+            try:
+                with open(filename) as dump_file:
+                    data = json.load(dump_file)
+            except Exception as error:
+                logging.error('failed to load metrics from %s', filename)
+                logging.exception(error)
+                continue
+
+            collected.merge(data, {'process': process, 'pid': str(pid)})
+
+    collected.merge(registry.to_dict(), {
+        'process': get_process_name(), 'pid': str(os.getpid())})
+    return collected
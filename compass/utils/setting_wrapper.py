@@ -8,6 +8,41 @@ if 'COMPASS_SETTING' in os.environ:
 else:
     SETTING = '/etc/compass/setting'
 
+# default values of the settings which may be missing in old setting files.
+PROGRESS_UPDATE_WORKERS = 1
+PROGRESS_UPDATE_POOL_TYPE = 'thread'
+PROGRESS_UPDATE_COLD_START_BYTES = 1048576
+PROGRESS_CLUSTER_MESSAGE_MAX_LENGTH = 1024
+PROGRESS_UPDATE_MIN_INTERVAL = 10
+PROGRESS_UPDATE_MAX_INTERVAL = 300
+PROGRESS_UPDATE_TASK_WORKERS = 1
+DAEMON_LEASE_EXPIRE_SECONDS = 180
+SQLALCHEMY_POOL_SIZE = 5
+SQLALCHEMY_MAX_OVERFLOW = 10
+SQLALCHEMY_POOL_TIMEOUT = 30
+SQLALCHEMY_POOL_RECYCLE = 3600
+SQLALCHEMY_POOL_PRE_PING = True
+SQLITE_JOURNAL_MODE = 'WAL'
+SQLITE_SYNCHRONOUS = 'NORMAL'
+SQLITE_BUSY_TIMEOUT = 30
+SQLALCHEMY_READ_DATABASE_URI = None
+SLOW_QUERY_THRESHOLD = 1.0
+SLOW_QUERY_LOGFILE = 'slow_query.log'
+COMPRESSED_COLUMN_THRESHOLD = 4096
+API_MAX_PAGE_SIZE = 1000
+API_GZIP_MIN_SIZE = 1024
+PROGRESS_STREAM_INTERVAL = 2
+PROGRESS_STREAM_TIMEOUT = 300
+PROGRESS_STREAM_LOOKBACK = 10
+PROGRESS_UPDATE_FROM_AGENTS = False
+PROGRESS_AGENT_DATABASE_URI = 'sqlite:////var/lib/compass/progress_agent.db'
+API_MAX_BATCH_SIZE = 1000
+POLLSWITCH_BATCH_SIZE = 20
+POLLSWITCH_BATCH_INTERVAL = 10
+METRICS_DIR = None
+METRICS_DUMP_INTERVAL = 10
+METRICS_FILE_TTL = 3600
+
 try:
     execfile(SETTING, globals(), locals())
 except Exception as error: